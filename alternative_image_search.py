@@ -6,12 +6,19 @@ Provides multiple fallback options when Google Custom Search quota is exhausted
 import requests
 import json
 import logging
+import time
 from typing import List, Dict, Any, Optional
 from urllib.parse import quote_plus, urljoin
-import time
 import random
 from bs4 import BeautifulSoup
-import re
+from .search_cache import cached_search
+from .rate_limiter import rate_limiter
+from .http_client import http_session
+from .duckduckgo_tokens import vqd_tokens
+from .bing_extractor import extract_bing_results
+from .search_orchestrator import (SearchOrchestrator, DeadlineExceeded, acquire_within_budget, budget_timeout,
+                                  remaining_budget)
+from .circuit_breaker import circuit_breakers
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +29,13 @@ class AlternativeImageSearch:
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         ]
+        self.orchestrator = SearchOrchestrator()
+        self.orchestrator.register('Bing', lambda q, n: self.search_bing_images(q, n),
+                                   breaker=circuit_breakers.get('engine:bing'))
+        self.orchestrator.register('DuckDuckGo', lambda q, n: self.search_duckduckgo_images(q, n),
+                                   breaker=circuit_breakers.get('engine:duckduckgo'))
+        self.orchestrator.register('Direct Scraping', lambda q, n: self.search_direct_scraping(q, n),
+                                   backup=True, breaker=circuit_breakers.get('site:etsy'))
     
     def get_headers(self):
         """Get random headers to avoid blocking"""
@@ -34,69 +48,60 @@ class AlternativeImageSearch:
             'Upgrade-Insecure-Requests': '1',
         }
     
+    @cached_search
     def search_bing_images(self, query: str, num_results: int = 10) -> List[Dict[str, Any]]:
         """Search Bing Images for shell craft images"""
+        breaker = circuit_breakers.get('engine:bing')
+        if not breaker.allow():
+            return []
         try:
             # Bing Image Search URL
             search_url = f"https://www.bing.com/images/search?q={quote_plus(query)}&form=HDRSC2&first=1&tsc=ImageBasicHover"
             
-            response = requests.get(search_url, headers=self.get_headers(), timeout=10)
+            acquire_within_budget('engine:bing')
+            started = time.monotonic()
+            response = http_session.get(search_url, headers=self.get_headers(), timeout=10)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find image containers
-            image_containers = soup.find_all('a', class_='iusc')
-            
             results = []
-            for container in image_containers[:num_results]:
-                try:
-                    # Extract image data from the container
-                    m_attr = container.get('m')
-                    if m_attr:
-                        image_data = json.loads(m_attr)
-                        
-                        result = {
-                            'title': image_data.get('t', 'Shell Craft'),
-                            'image_url': image_data.get('murl', ''),
-                            'source_url': image_data.get('purl', ''),
-                            'platform': self._extract_platform(image_data.get('purl', '')),
-                            'description': image_data.get('d', ''),
-                            'search_query': query
-                        }
-                        
-                        if result['image_url'] and result['source_url']:
-                            results.append(result)
-                            
-                except (json.JSONDecodeError, KeyError) as e:
-                    logger.debug(f"Error parsing Bing image data: {e}")
-                    continue
+            for image_data in extract_bing_results(response.content, num_results):
+                results.append({
+                    'title': image_data.get('t', 'Shell Craft'),
+                    'image_url': image_data['murl'],
+                    'source_url': image_data['purl'],
+                    'platform': self._extract_platform(image_data['purl']),
+                    'description': image_data.get('d', ''),
+                    'search_query': query
+                })
             
+            breaker.record_success(time.monotonic() - started)
             logger.info(f"Bing found {len(results)} image results")
             return results
             
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
+            breaker.record_failure(e)
             logger.error(f"Bing search error: {e}")
             return []
     
+    @cached_search
     def search_duckduckgo_images(self, query: str, num_results: int = 10) -> List[Dict[str, Any]]:
         """Search DuckDuckGo Images for shell craft images"""
+        breaker = circuit_breakers.get('engine:duckduckgo')
+        if not breaker.allow():
+            return []
         try:
-            # DuckDuckGo doesn't require API keys
-            search_url = "https://duckduckgo.com/"
-            
-            # Get search token first
-            response = requests.get(search_url, headers=self.get_headers())
-            response.raise_for_status()
-            
-            # Extract vqd token needed for image search
-            vqd_match = re.search(r'vqd=([\d-]+)', response.text)
-            if not vqd_match:
+            # DuckDuckGo doesn't require API keys, only a per-query vqd token
+            vqd = vqd_tokens.get(query, self.get_headers(), timeout=budget_timeout(15.0))
+            if not vqd and remaining_budget() == 0:
+                raise DeadlineExceeded('no budget left for a DuckDuckGo token')
+            if not vqd:
+                breaker.record_failure('no vqd token')
                 logger.error("Could not extract DuckDuckGo vqd token")
                 return []
             
-            vqd = vqd_match.group(1)
-            
             # Perform image search
             image_search_url = "https://duckduckgo.com/i.js"
             params = {
@@ -108,11 +113,16 @@ class AlternativeImageSearch:
                 'p': '1'
             }
             
-            time.sleep(1)  # Rate limiting
-            response = requests.get(image_search_url, params=params, headers=self.get_headers())
-            response.raise_for_status()
-            
-            data = response.json()
+            acquire_within_budget('engine:duckduckgo')
+            started = time.monotonic()
+            response = http_session.get(image_search_url, params=params, headers=self.get_headers())
+            try:
+                response.raise_for_status()
+                data = response.json()
+            except (requests.HTTPError, ValueError):
+                vqd_tokens.record_search(query, False)
+                raise
+            vqd_tokens.record_search(query, True)
             results = []
             
             for item in data.get('results', [])[:num_results]:
@@ -128,10 +138,15 @@ class AlternativeImageSearch:
                 if result['image_url'] and result['source_url']:
                     results.append(result)
             
+            breaker.record_success(time.monotonic() - started)
             logger.info(f"DuckDuckGo found {len(results)} image results")
             return results
             
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
+            breaker.record_failure(e)
             logger.error(f"DuckDuckGo search error: {e}")
             return []
     
@@ -155,8 +170,6 @@ class AlternativeImageSearch:
                 
                 if len(results) >= num_results:
                     break
-                    
-                time.sleep(2)  # Rate limiting between sites
                 
             except Exception as e:
                 logger.error(f"Error scraping {site['name']}: {e}")
@@ -167,15 +180,25 @@ class AlternativeImageSearch:
     
     def _scrape_craft_site(self, site_config: Dict, query: str, limit: int) -> List[Dict[str, Any]]:
         """Scrape a specific craft website"""
+        breaker = circuit_breakers.get(f"site:{site_config['name'].lower()}")
+        if not breaker.allow():
+            return []
         try:
             search_url = site_config['base_url'] + quote_plus(f"{query} shell craft")
             
-            response = requests.get(search_url, headers=self.get_headers(), timeout=15)
+            acquire_within_budget(rate_limiter.host_key(search_url))
+            started = time.monotonic()
+            response = http_session.get(search_url, headers=self.get_headers(), timeout=15)
             response.raise_for_status()
+            breaker.record_success(time.monotonic() - started)
             
             return site_config['parser'](response.content, query, limit)
             
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
+            breaker.record_failure(e)
             logger.error(f"Error scraping {site_config['name']}: {e}")
             return []
     
@@ -252,40 +275,5 @@ class AlternativeImageSearch:
         return 'Web'
     
     def search_all_methods(self, query: str, num_results: int = 10) -> List[Dict[str, Any]]:
-        """Try all search methods and combine results"""
-        all_results = []
-        
-        # Try each method
-        methods = [
-            ('Bing', self.search_bing_images),
-            ('DuckDuckGo', self.search_duckduckgo_images),
-            ('Direct Scraping', self.search_direct_scraping)
-        ]
-        
-        results_per_method = max(1, num_results // len(methods))
-        
-        for method_name, method_func in methods:
-            try:
-                logger.info(f"Trying {method_name} search...")
-                results = method_func(query, results_per_method)
-                all_results.extend(results)
-                
-                if len(all_results) >= num_results:
-                    break
-                    
-                time.sleep(1)  # Rate limiting between methods
-                
-            except Exception as e:
-                logger.error(f"{method_name} search failed: {e}")
-                continue
-        
-        # Remove duplicates based on image URL
-        seen_urls = set()
-        unique_results = []
-        
-        for result in all_results:
-            if result['image_url'] not in seen_urls:
-                seen_urls.add(result['image_url'])
-                unique_results.append(result)
-        
-        return unique_results[:num_results]
\ No newline at end of file
+        """Try all search methods and combine results within the search deadline"""
+        return self.orchestrator.search(query, num_results)
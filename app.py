@@ -1,13 +1,17 @@
 import os
 import logging
+import click
 from flask import Flask, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from .blueprints.api_blueprint import api_blueprint
+from .blueprints.api_blueprint import api_blueprint, storage_janitor
 from .blueprints.main_blueprint import main_blueprint
 from .blueprints.image_blueprint import image_blueprint
+from .blueprints.metrics_blueprint import metrics_blueprint
+from .blueprints.profiling_blueprint import profiling_blueprint
 from .config import Config
+from .data_manager import DataManager
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +30,23 @@ def create_app():
     app.register_blueprint(main_blueprint)
     app.register_blueprint(api_blueprint)
     app.register_blueprint(image_blueprint)
+    app.register_blueprint(metrics_blueprint)
+    app.register_blueprint(profiling_blueprint)
+
+    # Keep data/images within its storage budget in the background
+    storage_janitor.start()
+
+    @app.cli.command('migrate-images')
+    def migrate_images():
+        """Move stored images into the configured IMAGE_LAYOUT"""
+        migrated = DataManager().migrate_image_layout()
+        click.echo(f"Migrated {migrated} images")
+
+    @app.cli.command('backfill-placeholders')
+    def backfill_placeholders():
+        """Record dimensions and placeholders for images saved before they were computed at ingest"""
+        updated = DataManager().backfill_image_attributes()
+        click.echo(f"Updated {updated} images")
 
     # Error handlers
     @app.errorhandler(404)
@@ -0,0 +1,63 @@
+"""
+Benchmark Bing result extraction on saved results pages
+
+    python benchmarks/bing_extraction.py [page.html ...] [--limit N] [--rounds N]
+
+Compares the BeautifulSoup parse the searchers used to do against bing_extractor.
+Defaults to the fixtures under tests/fixtures.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_DIR)
+
+from bs4 import BeautifulSoup
+from bing_extractor import extract_bing_results
+
+def soup_extract(page, limit):
+    """The previous implementation, kept here as the baseline"""
+    results = []
+    for container in BeautifulSoup(page, 'html.parser').find_all('a', class_='iusc')[:limit]:
+        m_attr = container.get('m')
+        if m_attr:
+            try:
+                image_data = json.loads(m_attr)
+            except json.JSONDecodeError:
+                continue
+            if image_data.get('murl') and image_data.get('purl'):
+                results.append(image_data)
+    return results
+
+def best_of(func, page, limit, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(page, limit)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pages', nargs='*')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob(os.path.join(REPO_DIR, 'tests', 'fixtures', 'bing_*.html')))
+    for path in pages:
+        with open(path, 'rb') as f:
+            page = f.read()
+        soup_time = best_of(soup_extract, page, args.limit, args.rounds)
+        scan_time = best_of(extract_bing_results, page, args.limit, args.rounds)
+        print(f"{os.path.basename(path)} ({len(page) // 1024} KB, limit {args.limit}): "
+              f"BeautifulSoup {soup_time * 1000:.2f} ms, extractor {scan_time * 1000:.3f} ms, "
+              f"{soup_time / scan_time:.0f}x faster")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark end-to-end scrape throughput against recorded responses
+
+    python benchmarks/scrape_throughput.py --record "shell frames" "shell mirrors"
+    python benchmarks/scrape_throughput.py "shell frames" "shell mirrors" [--latency 0.2] [--error-rate 0.05]
+
+--record runs the scrape live and saves every engine page and image to the cassette
+directory. Without it, the same scrape is replayed from the cassettes with no network
+access, the given latency and error rate injected, and rate limits lifted unless
+--rate-limit is passed. Search results are not cached between rounds.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('queries', nargs='+')
+    parser.add_argument('--record', action='store_true')
+    parser.add_argument('--cassettes', default=os.path.join(REPO_DIR, 'data', 'cassettes'))
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate-limit', action='store_true', help='keep the configured rate limits when replaying')
+    args = parser.parse_args()
+
+    # The shared session, rate limiter and search cache are configured from the environment at import
+    os.environ['HTTP_CASSETTE_MODE'] = 'record' if args.record else 'replay'
+    os.environ['HTTP_CASSETTE_DIR'] = args.cassettes
+    os.environ['HTTP_REPLAY_LATENCY'] = str(args.latency)
+    os.environ['HTTP_REPLAY_JITTER'] = str(args.jitter)
+    os.environ['HTTP_REPLAY_ERROR_RATE'] = str(args.error_rate)
+    os.environ['HTTP_REPLAY_SEED'] = str(args.seed)
+    os.environ['SEARCH_CACHE_TTL'] = '0'
+    if not args.record and not args.rate_limit:
+        os.environ['RATE_LIMITS'] = 'engine:*=1000/1000,host:*=1000/1000'
+
+    from tests import import_app_module
+    http_client = import_app_module('http_client')
+    ImageSearcher = import_app_module('image_search').ImageSearcher
+    DataManager = import_app_module('data_manager').DataManager
+
+    rounds = 1 if args.record else args.rounds
+    for round_number in range(1, rounds + 1):
+        data_dir = tempfile.mkdtemp(prefix='scrape-bench-')
+        try:
+            searcher = ImageSearcher()
+            data_manager = DataManager(data_dir=data_dir)
+            found = saved = 0
+            start = time.perf_counter()
+            for query in args.queries:
+                results = searcher.search_images(query, limit=args.limit)
+                found += len(results)
+                saved += data_manager.save_scraped_data(results, 'benchmark')
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        print(f"round {round_number}: {len(args.queries)} queries, {found} results, {saved} images saved "
+              f"in {elapsed:.2f}s ({saved / elapsed:.1f} images/s)")
+
+    print(f"cassettes: {http_client.cassette_stats(http_client.http_session)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Bing Images result extraction
+Reads the JSON in the m attribute of a.iusc anchors by scanning the raw page
+instead of building a full parse tree, and stops as soon as enough results are found.
+"""
+
+import re
+import json
+import html
+import logging
+from typing import Iterator, List, Dict, Any, Union
+
+logger = logging.getLogger(__name__)
+
+# Every result anchor carries the iusc class; everything else on the page is skipped
+_MARKER = re.compile(rb'\biusc\b')
+_CLASS_ATTR = re.compile(rb'''\sclass\s*=\s*(?:"[^"]*\biusc\b[^"]*"|'[^']*\biusc\b[^']*')''', re.I)
+_M_ATTR = re.compile(rb'''\sm\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+# Rest of a tag up to its closing '>', stepping over quoted attribute values that may contain '>'
+_TAG_REST = re.compile(rb'''(?:"[^"]*"|'[^']*'|[^"'>])*>''')
+
+def iter_bing_metadata(page: Union[bytes, str]) -> Iterator[Dict[str, Any]]:
+    """Yield the decoded m blob of each result anchor in page order"""
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+
+    position = 0
+    while True:
+        marker = _MARKER.search(page, position)
+        if not marker:
+            return
+        tag_start = page.rfind(b'<', 0, marker.start())
+        # The marker also shows up in stylesheets and scripts; only a.iusc anchors count
+        if tag_start < 0:
+            position = marker.end()
+            continue
+        rest = _TAG_REST.match(page, tag_start + 1)
+        # An unterminated quote leaves only the first '>' to go by
+        tag_end = rest.end() - 1 if rest else page.find(b'>', marker.end())
+        if tag_end < 0:
+            return
+        if tag_end < marker.end():
+            # The nearest tag closed before the marker, so the marker is in text
+            position = marker.end()
+            continue
+        position = tag_end + 1
+        tag = page[tag_start:tag_end]
+        if tag[:3].lower() not in (b'<a ', b'<a\t', b'<a\n') or not _CLASS_ATTR.search(tag):
+            continue
+        m_attr = _M_ATTR.search(tag)
+        if not m_attr:
+            continue
+        raw = m_attr.group(1) if m_attr.group(1) is not None else m_attr.group(2)
+        try:
+            yield json.loads(html.unescape(raw.decode('utf-8', 'replace')))
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.debug(f"Error parsing Bing image data: {e}")
+
+def extract_bing_results(page: Union[bytes, str], limit: int) -> List[Dict[str, Any]]:
+    """Up to limit m blobs that have both an image URL (murl) and a page URL (purl)"""
+    results = []
+    if limit <= 0:
+        return results
+    for image_data in iter_bing_metadata(page):
+        if isinstance(image_data, dict) and image_data.get('murl') and image_data.get('purl'):
+            results.append(image_data)
+            if len(results) >= limit:
+                break
+    return results
@@ -1,19 +1,24 @@
 import os
 import requests
-import json
 import base64
-import hashlib
 import logging
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from .image_analysis import AnalysisCache, default_analyzer, prepare_image
+from .image_search import ImageSearcher
 
 logger = logging.getLogger(__name__)
 
 class BingVisualSearch:
     """Bing Visual Search integration with AI-enhanced descriptive keywords"""
     
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    def __init__(self, analyzer=None, analysis_cache: Optional[AnalysisCache] = None,
+                 image_searcher: Optional[ImageSearcher] = None):
+        # Any callable taking a base64 JPEG and returning the analysis dict; see image_analysis
+        self.analyzer = analyzer or default_analyzer()
+        self.analysis_cache = analysis_cache or AnalysisCache()
+        self.max_dimension = int(os.environ.get('ANALYSIS_MAX_DIMENSION', 768))
+        # Derived queries run side by side on the searcher's orchestrator
+        self.image_searcher = image_searcher or ImageSearcher()
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -30,41 +35,22 @@ class BingVisualSearch:
         }
     
     def analyze_image_with_ai(self, image_path: str) -> Dict[str, Any]:
-        """Use OpenAI to analyze the image and generate descriptive keywords"""
+        """Use OpenAI to analyze the image and generate descriptive keywords.
+
+        The upload is downscaled to ANALYSIS_MAX_DIMENSION before encoding, and the
+        model is skipped when an identical or near-identical image was analyzed before.
+        """
         try:
-            # Read and encode the image
-            with open(image_path, 'rb') as image_file:
-                image_data = image_file.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            # do not change this unless explicitly requested by the user
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert at analyzing images and generating search keywords. Analyze the image and provide descriptive keywords that would help find similar items. Focus on style, materials, colors, craftsmanship, and purpose. Return JSON with 'description', 'keywords', and 'style_tags' fields."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Analyze this image and generate descriptive keywords for finding similar items. Focus on crafting style, materials, colors, and overall aesthetic. Return JSON format with description, keywords array, and style_tags array."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                            }
-                        ]
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=500
-            )
-            
-            result = json.loads(response.choices[0].message.content)
+            jpeg_data, content_hash, perceptual_hash = prepare_image(image_path, self.max_dimension)
+
+            cached = self.analysis_cache.get(content_hash, perceptual_hash)
+            if cached:
+                logger.info(f"AI analysis served from cache for {content_hash[:12]}")
+                return cached
+
+            base64_image = base64.b64encode(jpeg_data).decode('utf-8')
+            result = self.analyzer(base64_image)
+            self.analysis_cache.set(content_hash, perceptual_hash, result)
             logger.info(f"AI analysis completed: {result.get('description', '')[:100]}...")
             return result
             
@@ -112,38 +98,16 @@ class BingVisualSearch:
             
             logger.info(f"Enhanced visual search with {len(search_queries)} queries")
             
-            # Perform searches with the enhanced queries
-            from image_search import ImageSearcher
-            image_searcher = ImageSearcher()
-            
-            all_results = []
-            results_per_query = max(1, limit // len(search_queries))
-            
-            for i, query in enumerate(search_queries[:4]):  # Limit to 4 queries max
-                try:
-                    logger.info(f"Visual search query {i+1}: {query[:100]}...")
-                    results = image_searcher.search_images(query, results_per_query)
-                    for result in results:
-                        result['search_type'] = 'visual_enhanced'
-                        result['ai_keywords'] = ai_keywords
-                        result['user_keywords'] = user_keywords
-                        result['description'] = f"AI-enhanced visual search: {description[:100]}..."
-                    all_results.extend(results)
-                    
-                    if len(all_results) >= limit:
-                        break
-                        
-                except Exception as e:
-                    logger.error(f"Search query failed: {e}")
-                    continue
-            
-            # Remove duplicates and return limited results
-            seen_urls = set()
-            unique_results = []
-            for result in all_results:
-                if result.get('image_url') not in seen_urls:
-                    seen_urls.add(result.get('image_url'))
-                    unique_results.append(result)
+            def annotate(result):
+                result['search_type'] = 'visual_enhanced'
+                result['ai_keywords'] = ai_keywords
+                result['user_keywords'] = user_keywords
+                result['description'] = f"AI-enhanced visual search: {description[:100]}..."
+
+            queries = search_queries[:4]  # Limit to 4 queries max
+            for i, query in enumerate(queries):
+                logger.info(f"Visual search query {i+1}: {query[:100]}...")
+            unique_results = self._search_queries(queries, limit, annotate)
             
             logger.info(f"Visual search found {len(unique_results)} unique results")
             return unique_results[:limit]
@@ -168,29 +132,19 @@ class BingVisualSearch:
             else:
                 search_queries = base_queries
             
-            from image_search import ImageSearcher
-            image_searcher = ImageSearcher()
-            
-            all_results = []
-            results_per_query = max(1, limit // len(search_queries))
-            
-            for query in search_queries:
-                try:
-                    results = image_searcher.search_images(query, results_per_query)
-                    for result in results:
-                        result['search_type'] = 'visual_fallback'
-                        result['user_keywords'] = user_keywords
-                    all_results.extend(results)
-                    
-                    if len(all_results) >= limit:
-                        break
-                        
-                except Exception as e:
-                    logger.error(f"Fallback search failed: {e}")
-                    continue
-            
-            return all_results[:limit]
+            def annotate(result):
+                result['search_type'] = 'visual_fallback'
+                result['user_keywords'] = user_keywords
+
+            return self._search_queries(search_queries, limit, annotate)
             
         except Exception as e:
             logger.error(f"Fallback visual search failed: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def _search_queries(self, queries: List[str], limit: int, annotate) -> List[Dict[str, Any]]:
+        """The derived queries as one search, each result passed through annotate"""
+        results = self.image_searcher.search_queries(queries, limit)
+        for result in results:
+            annotate(result)
+        return results
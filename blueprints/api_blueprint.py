@@ -1,21 +1,112 @@
 
 import os
+import json
 import logging
 import time
-from flask import Blueprint, jsonify, request
+import functools
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+from flask import Blueprint, Response, jsonify, make_response, request, stream_with_context
 from werkzeug.utils import secure_filename
 from ..data_manager import DataManager
 from ..image_search import ImageSearcher
 from ..bing_visual_search import BingVisualSearch
+from ..storage_janitor import StorageJanitor
+from ..circuit_breaker import circuit_breakers
+from ..duckduckgo_tokens import vqd_tokens
+from ..response_cache import ResponseCache, ENCODINGS, MIN_COMPRESS_SIZE
+from ..result_sets import result_sets
+from ..url_canonicalizer import canonicalize_url
 
 api_blueprint = Blueprint('api', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
 data_manager = DataManager()
 image_searcher = ImageSearcher()
-visual_search = BingVisualSearch()
+visual_search = BingVisualSearch(image_searcher=image_searcher)
+storage_janitor = StorageJanitor(data_manager, result_sets=result_sets)
+response_cache = ResponseCache()
+
+# Most ids accepted by one /api/images request
+MAX_BATCH_IDS = 200
+
+# Fields the gallery grid needs to lay out and show a card, used by ?compact=1
+GRID_FIELDS = ('id', 'local_image', 'image_version', 'title', 'width', 'height')
+
+def versioned_json(view):
+    """Serve a read-only JSON view with an ETag from the metadata file version and query string.
+
+    A matching If-None-Match is answered with 304 before the view runs, and
+    repeated requests at the same version get the cached response body, gzip or
+    brotli encoded when the client accepts it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        key = f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+        etag = ResponseCache.etag(data_manager.metadata_manager.version(), key)
+        version = data_manager.metadata_manager.cache_version()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            body = response_cache.get(version, key)
+            if body is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                response_cache.set(version, key, body)
+            encoding = request.accept_encodings.best_match(ENCODINGS) if len(body) >= MIN_COMPRESS_SIZE else None
+            if encoding:
+                body = response_cache.get_encoded(version, key, body, encoding)
+            response = Response(body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapper
+
+def _shape_images(images):
+    """Images as requested by the query string.
+
+    ?fields=a,b keeps only those fields (id is always included); ?format=columnar
+    returns one array per field instead of one object per image; ?compact=1 is
+    columnar with GRID_FIELDS unless fields are given.
+    """
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    compact = request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+    if compact and not fields:
+        fields = list(GRID_FIELDS)
+    if fields and 'id' not in fields:
+        fields.insert(0, 'id')
+
+    if compact or request.args.get('format') == 'columnar':
+        fields = fields or sorted({field for image in images for field in image})
+        return {field: [image.get(field) for image in images] for field in fields}
+    if fields:
+        return [{field: image[field] for field in fields if field in image} for image in images]
+    return images
+
+@api_blueprint.route('/health')
+def health():
+    """Search provider health: circuit breaker states plus orchestrator and token statistics"""
+    providers = circuit_breakers.snapshot()
+    degraded = [name for name, breaker in providers.items() if breaker['state'] != 'closed']
+    return jsonify({
+        'success': True,
+        'status': 'degraded' if degraded else 'ok',
+        'degraded_providers': degraded,
+        'providers': providers,
+        'search': image_searcher.orchestrator.stats(),
+        'duckduckgo_tokens': vqd_tokens.stats(),
+        'response_cache': response_cache.stats()
+    })
 
 @api_blueprint.route('/categories')
+@versioned_json
 def get_categories():
     """Get all categories with image counts"""
     try:
@@ -32,6 +123,7 @@ def get_categories():
         }), 500
 
 @api_blueprint.route('/category/<category>')
+@versioned_json
 def get_category_images(category):
     """Get images for a specific category"""
     try:
@@ -43,7 +135,7 @@ def get_category_images(category):
         return jsonify({
             'success': True,
             'category': category,
-            'images': images,
+            'images': _shape_images(images),
             'total': len(images)
         })
     except Exception as e:
@@ -120,15 +212,14 @@ def upload_search():
         logger.info(f"Keywords: {keywords}")
         logger.info(f"Search type: {search_type}")
 
-        data_manager.clear_category('upload_search')
-
         if search_type == 'visual_enhanced':
             results = visual_search.visual_search_with_keywords(filepath, keywords, limit=12)
         else:
             results = visual_search.fallback_visual_search(filepath, keywords, limit=12)
 
-        data_manager.save_scraped_data(results, 'upload_search')
-        images = data_manager.get_images_by_category('upload_search', limit=50)
+        images = list(data_manager.iter_fetched_items(results))
+        result_set = result_sets.create('upload_search', keywords, images)
+        storage_janitor.wake()
 
         search_description = "AI-enhanced visual search" if search_type == 'visual_enhanced' else "Visual similarity search"
         if keywords:
@@ -137,6 +228,7 @@ def upload_search():
         return jsonify({
             'success': True,
             'images': images,
+            'result_set': result_set,
             'message': f'{search_description} found {len(images)} similar items'
         })
 
@@ -161,55 +253,35 @@ def scrape_new_content():
             data = request.get_json()
             query = data.get('query', '') if data else ''
             limit = data.get('limit', 12) if data else 12
-            fresh_search = data.get('fresh_search', False) if data else False
+            load_more = data.get('load_more', False) if data else False
+            result_set = _search_result_set(query, data.get('result_set') if data and load_more else None)
             
             logger.info(f"Search-based scraping for query: {query}")
             
-            if fresh_search:
-                logger.info("Fresh search requested - clearing search_results category")
-                data_manager.clear_category('search_results')
-            
             search_type = data.get('search_type', 'general') if data else 'general'
-            if search_type == 'text_search':
-                search_query = query
-            else:
-                search_query = f"{query} shell crafts handmade"
+            search_query = _scrape_search_query(query, search_type)
             
+            saved_count = 0
             try:
                 logger.info(f"Searching for images: {search_query}")
-                scraped_data = image_searcher.search_images(search_query, limit)
+                scraped_data = _search_page(search_query, limit, result_set, load_more)
                 
                 if scraped_data:
-                    results = {}
-                    for item in scraped_data:
-                        content = (item.get('title', '') + ' ' + item.get('description', '')).lower()
-                        
-                        if 'frame' in content or 'photo' in content:
-                            category = 'picture_frames'
-                        elif 'shadow box' in content or 'display' in content:
-                            category = 'shadow_boxes'  
-                        elif 'jewelry' in content or 'box' in content:
-                            category = 'jewelry_boxes'
-                        else:
-                            category = 'display_cases'
-                        
-                        saved_count = data_manager.save_scraped_data([item], 'search_results')
-                        results['search_results'] = results.get('search_results', 0) + saved_count
+                    saved_count = result_sets.add(result_set, data_manager.iter_fetched_items(scraped_data))
                 else:
                     logger.warning(f"No real images found for query: {search_query}")
-                    results = {'search_results': 0}
                     
             except Exception as e:
                 logger.exception(f"Error searching for images: {e}")
-                results = {'search_results': 0}
                 
-            images = data_manager.get_category_images('search_results', limit=50)
-            total_results = sum(results.values())
+            storage_janitor.wake()
+            images = (result_sets.get(result_set, limit=50) or {}).get('items', [])
             
             return jsonify({
                 'success': True,
-                'message': f'Found {total_results} images for "{query}"',
-                'results_count': total_results,
+                'message': f'Found {saved_count} images for "{query}"',
+                'results_count': saved_count,
+                'result_set': result_set,
                 'images': images
             })
         else:
@@ -246,6 +318,7 @@ def scrape_new_content():
                 saved_count = data_manager.save_scraped_data(scraped_data, category)
                 results = {category: saved_count}
         
+        storage_janitor.wake()
         total_results = sum(results.values())
         query_text = ''
         if request.method == 'POST':
@@ -265,7 +338,123 @@ def scrape_new_content():
             'error': f'Scraping failed: {str(e)}'
         }), 500
 
+@api_blueprint.route('/scrape/stream', methods=['GET', 'POST'])
+def stream_scrape():
+    """Search and save images like POST /scrape, streaming each image as soon as it is stored.
+
+    Sends Server-Sent Events when the client asks for text/event-stream (EventSource)
+    and newline-delimited JSON otherwise. The stream ends with a summary event.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    query = (params.get('query') or params.get('q') or '').strip()
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'Search query is required'
+        }), 400
+
+    try:
+        limit = int(params.get('limit', 12))
+    except (TypeError, ValueError):
+        limit = 12
+    load_more = str(params.get('load_more', '')).lower() in ('1', 'true', 'yes')
+    search_query = _scrape_search_query(query, params.get('search_type', 'general'))
+
+    use_sse = request.accept_mimetypes.best_match(['application/x-ndjson', 'text/event-stream']) == 'text/event-stream'
+
+    def encode(event):
+        payload = json.dumps(event)
+        if use_sse:
+            return f"event: {event['type']}\ndata: {payload}\n\n"
+        return payload + "\n"
+
+    def events():
+        started = time.monotonic()
+        saved_count = 0
+        result_set = None
+        error = None
+        try:
+            result_set = _search_result_set(query, params.get('result_set') if load_more else None)
+            logger.info(f"Streaming search for images: {search_query}")
+            scraped_data = _search_page(search_query, limit, result_set, load_more)
+            yield encode({'type': 'search', 'found': len(scraped_data), 'result_set': result_set})
+
+            for image in data_manager.iter_fetched_items(scraped_data):
+                if result_sets.add(result_set, [image]):
+                    saved_count += 1
+                    yield encode({'type': 'image', 'image': image})
+        except Exception as e:
+            logger.exception(f"Error streaming search for '{query}'")
+            error = f'Scraping failed: {str(e)}'
+            yield encode({'type': 'error', 'error': error})
+
+        storage_janitor.wake()
+        yield encode({
+            'type': 'summary',
+            'success': error is None,
+            'results_count': saved_count,
+            'result_set': result_set,
+            'elapsed': round(time.monotonic() - started, 3),
+            'message': f'Found {saved_count} images for "{query}"'
+        })
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api_blueprint.route('/result_sets/<set_id>')
+def get_result_set(set_id):
+    """Images of an earlier search, while its result set is alive"""
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    result_set = result_sets.get(set_id, limit=limit, offset=offset)
+    if not result_set:
+        return jsonify({
+            'success': False,
+            'error': 'Result set not found or expired'
+        }), 404
+    return jsonify({
+        'success': True,
+        'result_set': set_id,
+        'query': result_set['query'],
+        'images': result_set['items'],
+        'expires': result_set['expires']
+    })
+
+def _search_result_set(query: str, set_id: Optional[str] = None) -> str:
+    """The live result set a load-more continues, or a new one for a fresh search"""
+    if set_id and result_sets.touch(set_id):
+        return set_id
+    return result_sets.create('search', query)
+
+def _search_page(search_query: str, limit: int, result_set: str, load_more: bool) -> List[Dict[str, Any]]:
+    """Engine results for a search, or for its next page when loading more.
+
+    The position is kept in the result set rather than in this process, so a
+    load-more continues the caller's own search on whichever worker it lands.
+    The next page is prefetched, since these are the searches users page through.
+    """
+    offset = result_sets.position(result_set) if load_more else 0
+    if offset:
+        stored = result_sets.get(result_set) or {'items': []}
+        seen = [item.get('canonical_url') or canonicalize_url(item['image_url'])
+                for item in stored['items'] if item.get('image_url')]
+        results = image_searcher.search_more(search_query, limit, offset=offset, seen=seen)
+    else:
+        results = image_searcher.search_images(search_query, limit, prefetch=True)
+    result_sets.advance(result_set, offset + limit)
+    return results
+
+def _scrape_search_query(query: str, search_type: str) -> str:
+    """Text searches run as typed; anything else is narrowed to shell crafts"""
+    if search_type == 'text_search':
+        return query
+    return f"{query} shell crafts handmade"
+
 @api_blueprint.route('/gallery')
+@versioned_json
 def get_gallery_images():
     """Get images for gallery display"""
     try:
@@ -280,7 +469,7 @@ def get_gallery_images():
         
         return jsonify({
             'success': True,
-            'images': images,
+            'images': _shape_images(images),
             'category': category
         })
     except Exception as e:
@@ -291,6 +480,7 @@ def get_gallery_images():
         }), 500
 
 @api_blueprint.route('/image/<image_id>')
+@versioned_json
 def get_image_details(image_id):
     """Get detailed information about a specific image"""
     try:
@@ -311,3 +501,45 @@ def get_image_details(image_id):
             'success': False,
             'error': 'Failed to load image details'
         }), 500
+
+@api_blueprint.route('/images', methods=['GET', 'POST'])
+@versioned_json
+def get_images_batch():
+    """Details of several images in one request.
+
+    Ids come from ?ids=a,b (or repeated ids params) or a JSON body {"ids": [...]}.
+    images follows the order of the ids, with null for unknown ones, which are
+    also listed in missing.
+    """
+    if request.method == 'POST':
+        ids = (request.get_json(silent=True) or {}).get('ids') or []
+        if not isinstance(ids, list):
+            ids = []
+    else:
+        ids = [image_id for value in request.args.getlist('ids') for image_id in value.split(',')]
+    ids = [str(image_id).strip() for image_id in ids if str(image_id).strip()]
+
+    if not ids:
+        return jsonify({
+            'success': False,
+            'error': 'At least one image id is required'
+        }), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({
+            'success': False,
+            'error': f'At most {MAX_BATCH_IDS} ids per request'
+        }), 400
+
+    try:
+        images = data_manager.get_images_by_ids(ids)
+        return jsonify({
+            'success': True,
+            'images': images,
+            'missing': [image_id for image_id, image in zip(ids, images) if image is None]
+        })
+    except Exception as e:
+        logger.exception("Error getting images")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load image details'
+        }), 500
@@ -1,15 +1,63 @@
 
+import os
 import logging
-from flask import Blueprint, send_from_directory, jsonify
+from flask import Blueprint, send_file, jsonify, request, make_response
+from ..image_file_manager import ImageFileManager
+from ..storage_janitor import access_tracker
 
 image_blueprint = Blueprint('images', __name__, url_prefix='/images')
 logger = logging.getLogger(__name__)
 
-@image_blueprint.route('/<filename>')
+image_file_manager = ImageFileManager()
+
+# URLs carrying the file's version (?v=, see ImageFileManager.file_version) never
+# change content, so clients may keep them for a year without revalidating
+CACHE_MAX_AGE = 31536000
+
+def _image_etag(filename: str, stat: os.stat_result) -> str:
+    """Strong ETag from the image id and the stat of its file"""
+    image_id = os.path.splitext(os.path.basename(filename))[0]
+    return f"{image_id}-{ImageFileManager.stat_version(stat)}"
+
+def _set_cache_headers(response, etag: str, stat: os.stat_result, immutable: bool):
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.max_age = CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # Revalidation may rewrite the file under the same name
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+    return response
+
+@image_blueprint.route('/<path:filename>')
 def serve_image(filename):
-    """Serve static images"""
+    """Serve static images with long-lived caching, conditional requests and ranges"""
     try:
-        return send_from_directory('data/images', filename)
+        # Resolves both the flat and the sharded layout while images are migrated
+        filepath = image_file_manager.resolve_path(filename)
+        if filepath is None:
+            raise FileNotFoundError(filename)
+        stat = os.stat(filepath)
+        etag = _image_etag(filename, stat)
+        immutable = request.args.get('v') == ImageFileManager.stat_version(stat)
+
+        # Answer revalidations from the stat alone, without opening the file
+        not_modified = (
+            request.if_none_match.contains_weak(etag) if request.if_none_match
+            else request.if_modified_since is not None
+            and int(stat.st_mtime) <= request.if_modified_since.timestamp()
+        )
+        if not_modified:
+            response = _set_cache_headers(make_response('', 304), etag, stat, immutable)
+        else:
+            response = send_file(filepath, etag=etag, conditional=True)
+            _set_cache_headers(response, etag, stat, immutable)
+
+        access_tracker.touch(filename)
+        return response
     except Exception as e:
         logger.error(f"Error serving image {filename}: {str(e)}")
         return jsonify({
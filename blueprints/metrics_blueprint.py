@@ -0,0 +1,29 @@
+import time
+import logging
+from flask import Blueprint, Response, g, request
+from ..metrics import registry
+
+metrics_blueprint = Blueprint('metrics', __name__)
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = registry.histogram('http_request_duration_seconds',
+                                     'Request latency by route, method and status; streamed responses '
+                                     'are measured to their first byte', ('route', 'method', 'status'))
+
+@metrics_blueprint.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@metrics_blueprint.after_app_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The rule rather than the path, so ids and filenames do not become labels
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+@metrics_blueprint.route('/metrics')
+def metrics():
+    """All metrics in the Prometheus text format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,65 @@
+import random
+import logging
+from flask import Blueprint, Response, g, jsonify, request
+from ..profiler import request_profiler
+
+profiling_blueprint = Blueprint('profiling', __name__, url_prefix='/api/profiles')
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+def _token():
+    return request.headers.get(PROFILE_HEADER) or request.args.get('profile')
+
+@profiling_blueprint.before_app_request
+def start_profile():
+    if not request_profiler.enabled or request.blueprint == profiling_blueprint.name:
+        return
+    requested = request_profiler.authorized(_token())
+    if requested or random.random() < request_profiler.sample_rate:
+        g.profile = request_profiler.start(requested)
+
+@profiling_blueprint.after_app_request
+def finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    info = {
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'status': response.status_code,
+    }
+    # Streamed bodies are generated after this hook, so the profile ends when the response closes
+    response.call_on_close(lambda: request_profiler.finish(profile, info))
+    if profile.requested:
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@profiling_blueprint.teardown_app_request
+def abandon_profile(error=None):
+    # Only left set when the request failed before its response was finalized
+    profile = g.pop('profile', None)
+    if profile is not None:
+        request_profiler.finish(profile, {'method': request.method, 'path': request.path, 'status': 500})
+
+@profiling_blueprint.route('')
+def list_profiles():
+    """Stored profiles: the latest requested ones and the slowest sampled ones"""
+    if not request_profiler.authorized(_token()):
+        return jsonify({'success': False, 'error': 'Profiling is not enabled or the secret is wrong'}), 403
+    return jsonify({
+        'success': True,
+        'requested': request_profiler.requested.list(),
+        'slowest': request_profiler.slowest.list(),
+    })
+
+@profiling_blueprint.route('/<profile_id>')
+def get_profile(profile_id):
+    """A profile as collapsed stacks, ready for flamegraph.pl or speedscope"""
+    if not request_profiler.authorized(_token()):
+        return jsonify({'success': False, 'error': 'Profiling is not enabled or the secret is wrong'}), 403
+    stacks = request_profiler.read(profile_id)
+    if stacks is None:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    return Response(stacks, mimetype='text/plain')
@@ -0,0 +1,167 @@
+"""
+Circuit breakers for search providers
+A provider that keeps failing or answering slowly is skipped for a cooldown, then
+probed with a single request at a jittered time before it is trusted again.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by the error and slow-call rate of recent calls"""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 slow_call: Optional[float] = None, cooldown: Optional[float] = None,
+                 max_cooldown: float = 600.0, jitter: float = 0.2):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        # Calls slower than this count against the provider like errors do
+        self.slow_call = slow_call if slow_call is not None else float(os.environ.get('CIRCUIT_BREAKER_SLOW_CALL', 8.0))
+        self.base_cooldown = cooldown if cooldown is not None else float(os.environ.get('CIRCUIT_BREAKER_COOLDOWN', 30.0))
+        self.max_cooldown = max_cooldown
+        self.jitter = jitter
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._cooldown = self.base_cooldown
+        self._retry_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._opened_count = 0
+        self._skipped = 0
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether a call would be let through right now, without claiming the probe"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() >= self._retry_at
+            return not (self.state == HALF_OPEN and self._probe_pending())
+
+    def allow(self) -> bool:
+        """Claim permission for one call; False means skip the provider"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._retry_at:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probe_pending():
+                self._probing = True
+                self._probe_started = time.monotonic()
+                return True
+            self._skipped += 1
+            return False
+
+    def release(self):
+        """Give back a call claimed with allow() that was never made"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def record_success(self, latency: float = 0.0):
+        slow = latency > self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if slow:
+                    self._trip(f"probe took {latency:.1f}s")
+                else:
+                    logger.info(f"Circuit for {self.name} closed after a successful probe")
+                    self.state = CLOSED
+                    self._probing = False
+                    self._outcomes.clear()
+                    self._cooldown = self.base_cooldown
+                return
+            self._outcomes.append(not slow)
+            if slow:
+                self._last_error = f"slow call ({latency:.1f}s)"
+            self._evaluate()
+
+    def record_failure(self, error: Any = None):
+        with self._lock:
+            self._last_error = str(error) if error else 'failed'
+            if self.state == HALF_OPEN:
+                # Each failed probe doubles the wait before the next one
+                self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+                self._trip(self._last_error)
+                return
+            self._outcomes.append(False)
+            self._evaluate()
+
+    def trip(self, reason: Any = None):
+        """Open the circuit right away, for errors that are known to persist (e.g. quota exhausted)"""
+        with self._lock:
+            self._last_error = str(reason) if reason else 'tripped'
+            self._trip(self._last_error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = calls - sum(self._outcomes)
+            return {
+                'state': self.state,
+                'recent_calls': calls,
+                'recent_failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'retry_in': round(max(self._retry_at - time.monotonic(), 0.0), 1) if self.state == OPEN else None,
+                'times_opened': self._opened_count,
+                'skipped_calls': self._skipped,
+                'last_error': self._last_error,
+            }
+
+    def _probe_pending(self) -> bool:
+        """A probe is out and has not yet been given up on. Caller holds the lock."""
+        # A probe whose caller never reported back must not hold the circuit half-open forever
+        return self._probing and time.monotonic() - self._probe_started < 2 * self.slow_call
+
+    def _evaluate(self):
+        """Open the circuit once enough recent calls failed. Caller holds the lock."""
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        failures = len(self._outcomes) - sum(self._outcomes)
+        if failures / len(self._outcomes) >= self.failure_rate:
+            self._trip(self._last_error)
+
+    def _trip(self, reason: Optional[str]):
+        """Move to open with a jittered retry time. Caller holds the lock."""
+        delay = self._cooldown * random.uniform(1 - self.jitter, 1 + self.jitter)
+        self.state = OPEN
+        self._probing = False
+        self._retry_at = time.monotonic() + delay
+        self._opened_count += 1
+        self._outcomes.clear()
+        logger.warning(f"Circuit for {self.name} opened for {delay:.0f}s: {reason}")
+
+class CircuitBreakers:
+    """Breakers by provider key, using the same keys as the rate limiter (e.g. engine:bing)"""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key, **self.defaults)
+            return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {key: breaker.snapshot() for key, breaker in sorted(breakers.items())}
+
+circuit_breakers = CircuitBreakers()
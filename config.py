@@ -62,16 +62,166 @@ class Config:
         """Maximum images to store per category"""
         return int(os.getenv('MAX_IMAGES_PER_CATEGORY', 100))
     
+    @property
+    def MAX_STORAGE_BYTES(self) -> int:
+        """Maximum total size of stored images in bytes (0 disables the limit)"""
+        return int(os.getenv('MAX_STORAGE_BYTES', 500 * 1024 * 1024))
+    
+    @property
+    def STORAGE_EVICTION_POLICY(self) -> str:
+        """Which images to evict first: 'lru' (least recently served) or 'oldest' (saved_date)"""
+        return os.getenv('STORAGE_EVICTION_POLICY', 'lru')
+    
+    @property
+    def SEARCH_DEADLINE(self) -> float:
+        """Longest time a multi-engine image search waits for results (seconds)"""
+        return float(os.getenv('SEARCH_DEADLINE', 12.0))
+    
+    @property
+    def SEARCH_HEDGE_AFTER(self) -> float:
+        """How long to wait on slow engines before also trying backup sources (seconds)"""
+        return float(os.getenv('SEARCH_HEDGE_AFTER', 3.0))
+    
+    @property
+    def SEARCH_CACHE_TTL(self) -> float:
+        """How long search engine results are reused (seconds, 0 disables the cache)"""
+        return float(os.getenv('SEARCH_CACHE_TTL', 6 * 3600))
+    
+    @property
+    def SEARCH_CACHE_MAX_BYTES(self) -> int:
+        """Size limit of the on-disk search result cache (bytes)"""
+        return int(os.getenv('SEARCH_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+    
+    @property
+    def DDG_TOKEN_TTL(self) -> float:
+        """How long a DuckDuckGo vqd token is reused for the same query (seconds)"""
+        return float(os.getenv('DDG_TOKEN_TTL', 900))
+    
+    @property
+    def CIRCUIT_BREAKER_COOLDOWN(self) -> float:
+        """How long a failing search provider is skipped before it is probed again (seconds)"""
+        return float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', 30.0))
+    
+    @property
+    def CIRCUIT_BREAKER_SLOW_CALL(self) -> float:
+        """Provider calls slower than this count as failures (seconds)"""
+        return float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL', 8.0))
+    
+    @property
+    def ANALYSIS_MAX_DIMENSION(self) -> int:
+        """Longest side of an upload as sent to the vision model (pixels)"""
+        return int(os.getenv('ANALYSIS_MAX_DIMENSION', 768))
+    
+    @property
+    def ANALYSIS_CACHE_TTL(self) -> float:
+        """How long an image analysis is reused for the same or a near-identical upload (seconds)"""
+        return float(os.getenv('ANALYSIS_CACHE_TTL', 30 * 86400))
+    
+    @property
+    def ANALYSIS_PHASH_DISTANCE(self) -> int:
+        """Largest perceptual-hash distance treated as the same image (-1 matches exact uploads only)"""
+        return int(os.getenv('ANALYSIS_PHASH_DISTANCE', 6))
+    
+    @property
+    def IMAGE_ANALYZER(self) -> str:
+        """Vision model client: 'openai', or 'stub' for offline development"""
+        return os.getenv('IMAGE_ANALYZER', 'openai')
+    
     @property
     def SCRAPE_DELAY(self) -> float:
-        """Delay between scraping requests (seconds)"""
+        """Average delay between requests to one search engine (seconds)"""
         return float(os.getenv('SCRAPE_DELAY', 2.0))
     
+    @property
+    def RATE_LIMITS(self) -> str:
+        """Per-engine/per-host overrides as 'key=rate/burst' pairs, e.g. 'engine:bing=0.5/3,host:*=2/4'"""
+        return os.getenv('RATE_LIMITS', '')
+    
+    @property
+    def RATE_LIMIT_SHARED_PATH(self) -> str:
+        """SQLite file for rate limits shared across workers (empty keeps them per process)"""
+        return os.getenv('RATE_LIMIT_SHARED_PATH', '')
+    
+    @property
+    def RESULT_SET_TTL(self) -> float:
+        """How long a search's result set stays available after its last update (seconds)"""
+        return float(os.getenv('RESULT_SET_TTL', 3600))
+    
+    @property
+    def HTTP_CASSETTE_MODE(self) -> str:
+        """'live', or 'record'/'replay' to save responses to or serve them from cassettes"""
+        return os.getenv('HTTP_CASSETTE_MODE', 'live')
+    
+    @property
+    def HTTP_CASSETTE_DIR(self) -> str:
+        """Directory holding recorded responses"""
+        return os.getenv('HTTP_CASSETTE_DIR', os.path.join('data', 'cassettes'))
+    
+    @property
+    def HTTP_REPLAY_LATENCY(self) -> float:
+        """Delay added to every replayed response (seconds), varied by HTTP_REPLAY_JITTER"""
+        return float(os.getenv('HTTP_REPLAY_LATENCY', 0.0))
+    
+    @property
+    def HTTP_REPLAY_ERROR_RATE(self) -> float:
+        """Fraction of replayed requests that fail with a connection error"""
+        return float(os.getenv('HTTP_REPLAY_ERROR_RATE', 0.0))
+    
+    @property
+    def PROFILE_SECRET(self) -> str:
+        """Secret that profiles a request when sent in the X-Profile header or ?profile= (empty disables)"""
+        return os.getenv('PROFILE_SECRET', '')
+    
+    @property
+    def PROFILE_SAMPLE_RATE(self) -> float:
+        """Fraction of requests profiled automatically; the slowest PROFILE_KEEP are kept"""
+        return float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+    
+    @property
+    def PROFILE_KEEP(self) -> int:
+        """Profiles kept per pool (latest requested, slowest sampled)"""
+        return int(os.getenv('PROFILE_KEEP', 20))
+    
+    @property
+    def PROFILE_DIR(self) -> str:
+        """Directory holding request profiles"""
+        return os.getenv('PROFILE_DIR', os.path.join('data', 'profiles'))
+    
     @property
     def IMAGE_MAX_WIDTH(self) -> int:
         """Maximum width for processed images"""
         return int(os.getenv('IMAGE_MAX_WIDTH', 800))
     
+    @property
+    def IMAGE_MAX_BYTES(self) -> int:
+        """Largest image download accepted (bytes)"""
+        return int(os.getenv('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+    
+    @property
+    def IMAGE_MAX_PIXELS(self) -> int:
+        """Largest image accepted (width x height), checked from the header before decoding"""
+        return int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+    
+    @property
+    def IMAGE_DECODE_TIMEOUT(self) -> float:
+        """Longest time a single image may take to decode and re-encode (seconds)"""
+        return float(os.getenv('IMAGE_DECODE_TIMEOUT', 10.0))
+    
+    @property
+    def IMAGE_DECODE_WORKERS(self) -> int:
+        """Images decoded and re-encoded at once per process (defaults to the CPU count)"""
+        return int(os.getenv('IMAGE_DECODE_WORKERS', os.cpu_count() or 2))
+    
+    @property
+    def IMAGE_REVALIDATE_AFTER(self) -> float:
+        """Age after which a stored image is revalidated against its source on re-scrape (seconds)"""
+        return float(os.getenv('IMAGE_REVALIDATE_AFTER', 7 * 86400))
+    
+    @property
+    def IMAGE_LAYOUT(self) -> str:
+        """On-disk layout for data/images: 'sharded' (ab/cd/<id>.jpg) or 'flat'"""
+        return os.getenv('IMAGE_LAYOUT', 'sharded')
+    
     @property
     def IMAGE_QUALITY(self) -> int:
         """JPEG quality for processed images"""
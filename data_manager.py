@@ -1,8 +1,10 @@
 import os
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from .metadata_manager import MetadataManager
 from .image_file_manager import ImageFileManager
+from .url_canonicalizer import canonicalize_url, canonical_id
 
 logger = logging.getLogger(__name__)
 
@@ -15,33 +17,96 @@ class DataManager:
 
     def save_scraped_data(self, scraped_data: List[Dict[str, Any]], category: str) -> int:
         """Save scraped data with image downloads"""
-        if not scraped_data:
-            return 0
-        
-        saved_count = 0
-        for item in scraped_data:
+        return sum(1 for _ in self.iter_saved_items(scraped_data, category))
+
+    def iter_saved_items(self, scraped_data: List[Dict[str, Any]], category: str) -> Iterator[Dict[str, Any]]:
+        """Download and save scraped items one at a time, yielding each stored item as soon as its image is saved"""
+        for item in self.iter_fetched_items(scraped_data, revalidate=True):
+            try:
+                if self.metadata_manager.save_item(item, category):
+                    yield self.metadata_manager.get_by_id(item['id']) or item
+            except Exception as e:
+                logger.error(f"Error saving item: {str(e)}")
+                continue
+
+    def iter_fetched_items(self, scraped_data: List[Dict[str, Any]],
+                           revalidate: bool = False) -> Iterator[Dict[str, Any]]:
+        """Download the images of scraped items without writing to the metadata store.
+
+        Items are matched against the stored library by canonical image URL, so a
+        picture already on disk is not downloaded again; such items come back merged
+        with their stored fields. Only a caller that saves the yielded items passes
+        ``revalidate``, letting stale library files be refreshed in place - otherwise
+        the library's file could change or disappear under its unchanged metadata.
+        Each item is yielded as soon as its image file is in place.
+        """
+        index, library = self._library()
+        seen = set()
+        for item in scraped_data or []:
             try:
                 image_url = item.get('image_url')
                 if not image_url:
                     logger.warning(f"No image URL for item, skipping")
                     continue
 
-                item_id = self.metadata_manager.save_item(item, category)
-                if not item_id:
+                canonical_url = canonicalize_url(image_url)
+                if canonical_url in seen:
+                    continue
+                seen.add(canonical_url)
+                item['canonical_url'] = canonical_url
+                item['id'] = index.get(canonical_url) or canonical_id(image_url)
+
+                previous = library.get(item['id'])
+                if previous and self._has_file(previous) and (not revalidate or self._is_fresh(previous)):
+                    # Already in the library, and recently validated or not ours to refresh
+                    yield {**previous, **item}
                     continue
+                if not revalidate:
+                    # Never hand the library's validators over, so nothing stored is replaced
+                    previous = None
 
-                local_filename = self.image_file_manager.download_and_process_image(image_url, item_id)
+                image_info = {
+                    field: previous[field]
+                    for field in ImageFileManager.VALIDATOR_FIELDS
+                    if previous and field in previous
+                }
+                local_filename = self.image_file_manager.download_and_process_image(image_url, item['id'], image_info)
                 if local_filename:
+                    item.update(image_info)
                     item['local_image'] = local_filename
-                    self.metadata_manager.save_item(item, category) # Save again to update with local filename
-                    saved_count += 1
-                else:
-                    self.metadata_manager.delete_item(item_id) # Rollback metadata if image download fails
+                    item['file_size'] = self.image_file_manager.get_file_size(local_filename)
+                    # Goes into the image URL, which is cached as immutable
+                    item['image_version'] = self.image_file_manager.file_version(local_filename)
+                    yield item
             except Exception as e:
-                logger.error(f"Error saving item: {str(e)}")
+                logger.error(f"Error fetching item: {str(e)}")
                 continue
-        
-        return saved_count
+
+    def _library(self) -> Tuple[Dict[str, str], Dict[str, Dict[str, Any]]]:
+        """Stored item id by canonical image URL, and stored items by id.
+
+        The URL index also covers items saved under older id schemes.
+        """
+        index, items = {}, {}
+        for stored in self.metadata_manager.get_all():
+            if not stored.get('id'):
+                continue
+            items[stored['id']] = stored
+            if stored.get('image_url'):
+                index.setdefault(stored.get('canonical_url') or canonicalize_url(stored['image_url']), stored['id'])
+        return index, items
+
+    def _has_file(self, stored: Dict[str, Any]) -> bool:
+        """Whether a stored item's image exists on disk"""
+        return bool(stored.get('local_image') and self.image_file_manager.resolve_path(stored['local_image']))
+
+    def _is_fresh(self, stored: Dict[str, Any]) -> bool:
+        """Whether a stored image exists on disk and was validated within IMAGE_REVALIDATE_AFTER"""
+        if not self._has_file(stored):
+            return False
+        max_age = float(os.environ.get('IMAGE_REVALIDATE_AFTER', 7 * 86400))
+        validated = stored.get('http_validated', stored.get('saved_date', 0))
+        return time.time() - validated < max_age
 
     def get_category_images(self, category: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
         """Get images for a specific category with valid local files only"""
@@ -49,6 +114,34 @@ class DataManager:
         valid_items = self._filter_valid_images(items)
         return valid_items[offset:offset + limit]
 
+    def get_images_by_category(self, category: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Alias of get_category_images used by the gallery and upload search"""
+        return self.get_category_images(category, limit=limit, offset=offset)
+
+    def get_category_counts(self) -> Dict[str, int]:
+        """Number of images with valid local files in each category"""
+        counts: Dict[str, int] = {}
+        for item in self._filter_valid_images(self.metadata_manager.get_all()):
+            category = item.get('category') or 'uncategorized'
+            counts[category] = counts.get(category, 0) + 1
+        return counts
+
+    def search_images(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Stored images whose title, description, keywords or search query contain every word of query"""
+        terms = query.lower().split()
+        if not terms:
+            return []
+        matches = []
+        for item in self._filter_valid_images(self.metadata_manager.get_all()):
+            values = []
+            for field in ('title', 'description', 'search_query', 'platform', 'category', 'keywords'):
+                value = item.get(field)
+                values.extend(value if isinstance(value, list) else [value or ''])
+            text = ' '.join(str(value) for value in values).lower()
+            if all(term in text for term in terms):
+                matches.append(item)
+        return matches[:limit] if limit else matches
+
     def get_all_images(self, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
         """Get all images across all categories with valid local files only"""
         items = self.metadata_manager.get_all()
@@ -59,6 +152,11 @@ class DataManager:
         """Get specific image by ID"""
         return self.metadata_manager.get_by_id(image_id)
 
+    def get_images_by_ids(self, image_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Images for several ids in one storage pass, in the order asked for, with None for unknown ids"""
+        found = self.metadata_manager.get_many(image_ids)
+        return [found.get(image_id) for image_id in image_ids]
+
     def delete_image(self, image_id: str) -> bool:
         """Delete an image and its metadata"""
         item = self.metadata_manager.get_by_id(image_id)
@@ -71,18 +169,65 @@ class DataManager:
         
         return self.metadata_manager.delete_item(image_id)
 
+    def delete_images(self, image_ids: List[str]) -> int:
+        """Delete several images and their metadata with a single metadata write"""
+        if not image_ids:
+            return 0
+        wanted = set(image_ids)
+        for item in self.metadata_manager.get_all():
+            if item.get('id') in wanted and item.get('local_image'):
+                self.image_file_manager.delete_image_file(item['local_image'])
+        return self.metadata_manager.delete_items(list(wanted))
+
     def clear_category(self, category: str) -> bool:
         """Clear all items from a specific category"""
         items_to_delete = self.metadata_manager.get_by_category(category)
-        for item in items_to_delete:
-            self.delete_image(item['id'])
+        self.delete_images([item['id'] for item in items_to_delete])
         return True
 
+    def migrate_image_layout(self, batch_size: int = 500) -> int:
+        """Move stored images into the configured directory layout.
+
+        Files are renamed in batches and each batch's new local_image paths are
+        written with a single metadata save. Safe to re-run after an interruption.
+        """
+        items = [item for item in self.metadata_manager.get_all() if item.get('local_image')]
+        migrated = 0
+        for start in range(0, len(items), batch_size):
+            updates = {}
+            for item in items[start:start + batch_size]:
+                try:
+                    new_path = self.image_file_manager.migrate_file(item['local_image'])
+                except OSError as e:
+                    logger.error(f"Error migrating image {item['local_image']}: {e}")
+                    continue
+                if new_path and new_path != item['local_image']:
+                    updates[item['id']] = {'local_image': new_path}
+            migrated += self.metadata_manager.update_items(updates) if updates else 0
+        logger.info(f"Migrated {migrated} images to the {self.image_file_manager.layout} layout")
+        return migrated
+
+    def backfill_image_attributes(self, batch_size: int = 100) -> int:
+        """Compute dimensions and placeholders for images stored before they were recorded at ingest"""
+        items = [
+            item for item in self.metadata_manager.get_all()
+            if item.get('local_image') and 'placeholder' not in item
+        ]
+        updated = 0
+        for start in range(0, len(items), batch_size):
+            updates = {}
+            for item in items[start:start + batch_size]:
+                attributes = self.image_file_manager.describe_image(item['local_image'])
+                if attributes:
+                    updates[item['id']] = attributes
+            updated += self.metadata_manager.update_items(updates) if updates else 0
+        return updated
+
     def _filter_valid_images(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Filters a list of items, returning only those with valid, existing local image files."""
         valid_items = []
         for item in items:
             local_image = item.get('local_image')
-            if local_image and os.path.exists(os.path.join(self.image_file_manager.images_dir, local_image)):
+            if local_image and self.image_file_manager.resolve_path(local_image):
                 valid_items.append(item)
         return valid_items
@@ -0,0 +1,151 @@
+"""
+DuckDuckGo vqd token cache
+DuckDuckGo image searches need a vqd token tied to the query. Tokens are fetched once,
+reused for their lifetime and refreshed in the background before they expire.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, Iterable
+from .rate_limiter import rate_limiter
+from .http_client import http_session
+
+logger = logging.getLogger(__name__)
+
+VQD_PATTERNS = [
+    re.compile(r'vqd=["\']?([\d-]+)'),
+    re.compile(r'"vqd"\s*:\s*"([\d-]+)"'),
+    re.compile(r'vqd=([^&,\s"\']+)'),
+]
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+def extract_vqd(html: str) -> Optional[str]:
+    """First vqd token found in a DuckDuckGo page, or None"""
+    for pattern in VQD_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            return match.group(1)
+    return None
+
+def fetch_vqd(query: str, headers: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """Fetch a fresh vqd token for query from the DuckDuckGo results page"""
+    rate_limiter.acquire('engine:duckduckgo')
+    response = http_session.get("https://duckduckgo.com/", params={'q': query, 'iax': 'images', 'ia': 'images'},
+                                headers=headers or DEFAULT_HEADERS, timeout=10)
+    response.raise_for_status()
+    return extract_vqd(response.text)
+
+class VqdTokenManager:
+    """Per-query vqd cache with background refresh, shared by every DuckDuckGo caller"""
+
+    def __init__(self, fetch=fetch_vqd, ttl: Optional[float] = None, refresh_ratio: float = 0.75,
+                 max_entries: int = 512):
+        self.fetch = fetch
+        self.ttl = ttl if ttl is not None else float(os.environ.get('DDG_TOKEN_TTL', 900))
+        # Tokens older than this fraction of ttl are refreshed in the background on use
+        self.refresh_after = self.ttl * refresh_ratio
+        self.max_entries = max_entries
+
+        self._tokens: Dict[str, tuple] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ddg-vqd')
+        self._stats = {'hits': 0, 'misses': 0, 'fetches': 0, 'fetch_failures': 0,
+                       'searches_ok': 0, 'searches_failed': 0}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return ' '.join(query.lower().split())
+
+    def get(self, query: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15.0) -> Optional[str]:
+        """Valid token for query, fetching one if none is cached"""
+        key = self.normalize_query(query)
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._stats['hits'] += 1
+                if now - entry[1] >= self.refresh_after:
+                    self._schedule(key, query, headers)
+                return entry[0]
+            self._stats['misses'] += 1
+            future = self._schedule(key, query, headers)
+
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            logger.debug(f"Waiting for DuckDuckGo token failed: {e}")
+            return None
+
+    def prefetch(self, queries: Iterable[str], headers: Optional[Dict[str, str]] = None):
+        """Start fetching tokens for queries that have no fresh token, without waiting"""
+        now = time.time()
+        with self._lock:
+            for query in queries:
+                key = self.normalize_query(query)
+                entry = self._tokens.get(key)
+                if not entry or now - entry[1] >= self.refresh_after:
+                    self._schedule(key, query, headers)
+
+    def invalidate(self, query: str):
+        """Drop the cached token for query, e.g. after DuckDuckGo rejected it"""
+        with self._lock:
+            self._tokens.pop(self.normalize_query(query), None)
+
+    def record_search(self, query: str, success: bool):
+        """Note whether a search made with a cached token worked; failures drop the token"""
+        with self._lock:
+            self._stats['searches_ok' if success else 'searches_failed'] += 1
+        if not success:
+            self.invalidate(query)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus token fetch and search success rates"""
+        with self._lock:
+            stats = dict(self._stats, cached=len(self._tokens))
+        searches = stats['searches_ok'] + stats['searches_failed']
+        stats['search_success_rate'] = stats['searches_ok'] / searches if searches else None
+        stats['fetch_success_rate'] = 1 - stats['fetch_failures'] / stats['fetches'] if stats['fetches'] else None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def _schedule(self, key: str, query: str, headers: Optional[Dict[str, str]]) -> Future:
+        """Future for a fetch of key's token, joining one already running. Caller holds the lock."""
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._executor.submit(self._fetch, key, query, headers)
+            self._inflight[key] = future
+        return future
+
+    def _fetch(self, key: str, query: str, headers: Optional[Dict[str, str]]) -> Optional[str]:
+        token = None
+        try:
+            token = self.fetch(query, headers)
+        except Exception as e:
+            logger.debug(f"DuckDuckGo token fetch for '{query}' failed: {e}")
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._stats['fetches'] += 1
+            if not token:
+                self._stats['fetch_failures'] += 1
+                return None
+            if len(self._tokens) >= self.max_entries and key not in self._tokens:
+                oldest = min(self._tokens, key=lambda k: self._tokens[k][1])
+                del self._tokens[oldest]
+            self._tokens[key] = (token, time.time())
+        return token
+
+vqd_tokens = VqdTokenManager()
@@ -3,15 +3,18 @@ Google Custom Search API implementation for finding real shell craft images
 """
 
 import os
-import requests
 import logging
-import hashlib
 import json
 import random
 import time
 from typing import List, Dict, Any, Optional
 from urllib.parse import quote, quote_plus
-from bs4 import BeautifulSoup
+from .bing_extractor import extract_bing_results
+from .url_canonicalizer import canonical_id, canonicalize_url
+from .search_cache import cached_search
+from .http_client import http_session
+from .circuit_breaker import circuit_breakers
+from .search_orchestrator import DeadlineExceeded, acquire_within_budget
 
 logger = logging.getLogger(__name__)
 
@@ -58,8 +61,9 @@ class GoogleImageSearcher:
             seen_urls = set()
             unique_results = []
             for item in all_results:
-                if item.get('image_url') not in seen_urls:
-                    seen_urls.add(item.get('image_url'))
+                canonical_url = canonicalize_url(item.get('image_url'))
+                if canonical_url not in seen_urls:
+                    seen_urls.add(canonical_url)
                     unique_results.append(item)
                     
             return unique_results[:limit]
@@ -68,12 +72,18 @@ class GoogleImageSearcher:
             logger.error(f"Error in reverse image search: {str(e)}")
             return []
 
+    @cached_search
     def search_images(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search for shell craft images using Google Custom Search API"""
         if not self.api_key or not self.search_engine_id:
             logger.error("Google API credentials missing")
             return []
         
+        breaker = circuit_breakers.get('engine:google')
+        if not breaker.allow():
+            # Quota errors keep the circuit open, so go straight to the fallback
+            return self.search_bing_images(query, limit)
+        
         try:
             params = {
                 'key': self.api_key,
@@ -88,9 +98,12 @@ class GoogleImageSearcher:
             }
             
             logger.info(f"Searching Google Images for: {query}")
-            response = requests.get(self.base_url, params=params, timeout=10)
+            acquire_within_budget('engine:google')
+            started = time.monotonic()
+            response = http_session.get(self.base_url, params=params, timeout=10)
             
             if response.status_code == 200:
+                breaker.record_success(time.monotonic() - started)
                 data = response.json()
                 items = data.get('items', [])
                 logger.info(f"Google found {len(items)} image results")
@@ -107,12 +120,18 @@ class GoogleImageSearcher:
                 logger.error(f"Google API error {response.status_code}: {response.text}")
                 # Check if quota exceeded
                 if response.status_code == 429 or 'quota' in response.text.lower():
+                    breaker.trip(f"quota exceeded (HTTP {response.status_code})")
                     logger.info("Google quota exceeded, switching to Bing Image Search")
                     return self.search_bing_images(query, limit)
+                breaker.record_failure(f"HTTP {response.status_code}")
                 return []
                 
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
             logger.error(f"Error searching Google Images: {str(e)}")
+            breaker.record_failure(e)
             # Check if quota exceeded in exception
             if '429' in str(e) or 'quota' in str(e).lower():
                 logger.info("Google quota exceeded, switching to Bing Image Search")
@@ -135,7 +154,7 @@ class GoogleImageSearcher:
                 return None
             
             # Create unique ID based on image URL
-            item_id = hashlib.md5(image_url.encode()).hexdigest()
+            item_id = canonical_id(image_url)
             
             # Determine platform/source
             platform = self.detect_platform(context_link or display_link)
@@ -226,55 +245,40 @@ class GoogleImageSearcher:
     
     def search_bing_images(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Fallback search using Bing Images when Google quota is exhausted"""
+        breaker = circuit_breakers.get('engine:bing')
+        if not breaker.allow():
+            return []
         try:
             logger.info(f"Searching Bing Images for: {query}")
             search_url = f"https://www.bing.com/images/search?q={quote_plus(query)}&form=HDRSC2"
             
-            response = requests.get(search_url, headers=self.get_headers(), timeout=15)
+            acquire_within_budget('engine:bing')
+            started = time.monotonic()
+            response = http_session.get(search_url, headers=self.get_headers(), timeout=15)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find image containers with proper error handling
-            image_containers = soup.find_all('a', class_='iusc')
-            
             results = []
-            for container in image_containers[:limit]:
-                try:
-                    # Extract image data from the container
-                    m_attr = container.get('m')
-                    if m_attr:
-                        try:
-                            image_data = json.loads(m_attr)
-                            
-                            # Extract required fields with safe defaults
-                            title = image_data.get('t', 'Shell Craft')
-                            image_url = image_data.get('murl', '')
-                            source_url = image_data.get('purl', '')
-                            
-                            if image_url and source_url:
-                                result = {
-                                    'id': hashlib.md5(image_url.encode()).hexdigest(),
-                                    'title': title,
-                                    'image_url': image_url,
-                                    'source_url': source_url,
-                                    'platform': self.detect_platform(source_url),
-                                    'description': f"Shell craft found via Bing Images search for '{query}'",
-                                    'search_query': query
-                                }
-                                results.append(result)
-                                
-                        except (json.JSONDecodeError, KeyError) as e:
-                            logger.debug(f"Error parsing Bing image data: {e}")
-                            continue
-                            
-                except Exception as e:
-                    logger.debug(f"Error processing Bing container: {e}")
-                    continue
+            for image_data in extract_bing_results(response.content, limit):
+                image_url = image_data['murl']
+                source_url = image_data['purl']
+                results.append({
+                    'id': canonical_id(image_url),
+                    'title': image_data.get('t', 'Shell Craft'),
+                    'image_url': image_url,
+                    'source_url': source_url,
+                    'platform': self.detect_platform(source_url),
+                    'description': f"Shell craft found via Bing Images search for '{query}'",
+                    'search_query': query
+                })
             
+            breaker.record_success(time.monotonic() - started)
             logger.info(f"Bing found {len(results)} image results")
             return results
             
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
+            breaker.record_failure(e)
             logger.error(f"Bing search error: {e}")
             return [][:limit]
\ No newline at end of file
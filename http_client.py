@@ -0,0 +1,169 @@
+"""
+Shared HTTP session with record/replay cassettes
+Every search engine and image host request goes through http_session. With
+HTTP_CASSETTE_MODE=record, live responses are saved to on-disk cassettes; with
+HTTP_CASSETTE_MODE=replay they are served from the cassettes instead of the network,
+optionally with injected latency and errors, so scrapes can be tested and benchmarked offline.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+LIVE = 'live'
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Hop-by-hop and encoding headers describe the original transfer, not the stored body
+_DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'connection', 'keep-alive', 'set-cookie'}
+
+class CassetteMiss(requests.ConnectionError):
+    """No recorded interaction for a request while replaying"""
+
+def cassette_key(method: str, url: str) -> str:
+    """Stable key for a request; query parameters are sorted so their order does not matter"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    normalized = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ''))
+    return hashlib.sha1(f"{method.upper()} {normalized}".encode()).hexdigest()
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter that records live responses to, or replays them from, a cassette directory.
+
+    Each interaction is stored as <dir>/<host>/<key>.json (status, headers, url) plus
+    <key>.body with the raw body bytes. In replay mode every request waits latency
+    seconds (+/- jitter) and fails with a ConnectionError at error_rate; the random
+    source is seeded so runs are repeatable.
+    """
+
+    def __init__(self, cassette_dir: str, mode: str = REPLAY, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette_dir = cassette_dir
+        self.mode = mode
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0, 'injected_errors': 0}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.mode == RECORD:
+            response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+            self._record(request, response)
+            return response
+        return self._replay(request)
+
+    def _paths(self, method: str, url: str):
+        host = (urlsplit(url).hostname or 'unknown').lower()
+        base = os.path.join(self.cassette_dir, host, cassette_key(method, url))
+        return base + '.json', base + '.body'
+
+    def save(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes,
+             reason: Optional[str] = None) -> None:
+        """Store one interaction; also used to build cassettes by hand for tests"""
+        meta_path, body_path = self._paths(method, url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(body_path, 'wb') as f:
+            f.write(body)
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'method': method.upper(),
+                'url': url,
+                'status': status,
+                'reason': reason,
+                'headers': {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS},
+                'recorded': time.time(),
+            }, f, indent=2)
+
+    def _record(self, request, response: requests.Response):
+        try:
+            self.save(request.method, request.url, response.status_code, response.headers, response.content,
+                      response.reason)
+            self._count('recorded')
+        except (OSError, requests.RequestException) as e:
+            logger.error(f"Error recording {request.url}: {e}")
+
+    def _replay(self, request) -> requests.Response:
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._count('injected_errors')
+            raise requests.ConnectionError(f"Injected error for {request.url}", request=request)
+
+        meta_path, body_path = self._paths(request.method, request.url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            self._count('misses')
+            raise CassetteMiss(f"No recorded response for {request.method} {request.url}", request=request)
+
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.reason = meta.get('reason')
+        response.headers = CaseInsensitiveDict(meta.get('headers', {}))
+        response.headers['Content-Length'] = str(len(body))
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        # A fully read body: iter_content() serves it in slices, as for a streamed response
+        response._content = body
+        response._content_consumed = True
+        self._count('replayed')
+        return response
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+def build_session(mode: Optional[str] = None, cassette_dir: Optional[str] = None, latency: Optional[float] = None,
+                  jitter: Optional[float] = None, error_rate: Optional[float] = None,
+                  seed: Optional[int] = None, pool_size: int = 32) -> requests.Session:
+    """Session with pooled connections; mode and replay settings default to the HTTP_CASSETTE_* variables"""
+    mode = (mode or os.environ.get('HTTP_CASSETTE_MODE') or LIVE).lower()
+    session = requests.Session()
+    if mode in (RECORD, REPLAY):
+        adapter = CassetteAdapter(
+            cassette_dir or os.environ.get('HTTP_CASSETTE_DIR') or os.path.join('data', 'cassettes'),
+            mode=mode,
+            latency=latency if latency is not None else float(os.environ.get('HTTP_REPLAY_LATENCY', 0.0)),
+            jitter=jitter if jitter is not None else float(os.environ.get('HTTP_REPLAY_JITTER', 0.0)),
+            error_rate=error_rate if error_rate is not None else float(os.environ.get('HTTP_REPLAY_ERROR_RATE', 0.0)),
+            seed=seed if seed is not None else int(os.environ.get('HTTP_REPLAY_SEED', 0)),
+            pool_connections=pool_size, pool_maxsize=pool_size,
+        )
+        logger.info(f"HTTP {mode} mode using cassettes in {adapter.cassette_dir}")
+    else:
+        if mode != LIVE:
+            logger.warning(f"Unknown HTTP_CASSETTE_MODE '{mode}', using live requests")
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def cassette_stats(session: requests.Session) -> Optional[Dict[str, Any]]:
+    """Record/replay counters of a session, or None for a live one"""
+    adapter = session.get_adapter('https://')
+    if isinstance(adapter, CassetteAdapter):
+        return dict(adapter.stats, mode=adapter.mode)
+    return None
+
+http_session = build_session()
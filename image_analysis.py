@@ -0,0 +1,171 @@
+"""
+AI analysis of uploaded images
+Uploads are downscaled before they are sent to the vision model, and analyses are
+cached in SQLite by content hash and perceptual hash so repeat uploads skip the model.
+"""
+
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Any, Optional, Tuple
+from PIL import Image, ImageOps
+from .metrics import CACHE_REQUESTS
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_PROMPT = "Analyze this image and generate descriptive keywords for finding similar items. Focus on crafting style, materials, colors, and overall aesthetic. Return JSON format with description, keywords array, and style_tags array."
+SYSTEM_PROMPT = "You are an expert at analyzing images and generating search keywords. Analyze the image and provide descriptive keywords that would help find similar items. Focus on style, materials, colors, craftsmanship, and purpose. Return JSON with 'description', 'keywords', and 'style_tags' fields."
+
+def prepare_image(image_path: str, max_dimension: int = 768, quality: int = 85) -> Tuple[bytes, str, Optional[int]]:
+    """Downscaled JPEG of an upload, the SHA-256 of the original bytes and its perceptual hash"""
+    with open(image_path, 'rb') as f:
+        original = f.read()
+    content_hash = hashlib.sha256(original).hexdigest()
+
+    with Image.open(io.BytesIO(original)) as img:
+        img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        perceptual_hash = difference_hash(img)
+        output = io.BytesIO()
+        img.save(output, 'JPEG', quality=quality, optimize=True)
+    return output.getvalue(), content_hash, perceptual_hash
+
+def difference_hash(img: Image.Image) -> int:
+    """64-bit dHash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour"""
+    pixels = img.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+class OpenAIImageAnalyzer:
+    """Vision model client; the OpenAI client is created on first use"""
+
+    def __init__(self, model: str = "gpt-4o", api_key: Optional[str] = None):
+        self.model = model
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key or os.environ.get("OPENAI_API_KEY"))
+        return self._client
+
+    def __call__(self, jpeg_base64: str) -> Dict[str, Any]:
+        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+        # do not change this unless explicitly requested by the user
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": ANALYSIS_PROMPT
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": f"data:image/jpeg;base64,{jpeg_base64}"}
+                        }
+                    ]
+                }
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=500
+        )
+        return json.loads(response.choices[0].message.content)
+
+class StubImageAnalyzer:
+    """Local stand-in for the vision model, for tests and offline development"""
+
+    def __init__(self, result: Optional[Dict[str, Any]] = None):
+        self.result = result or {
+            "description": "handmade seashell craft",
+            "keywords": ["seashell", "handmade", "coastal"],
+            "style_tags": ["beach", "rustic"]
+        }
+        self.calls = 0
+
+    def __call__(self, jpeg_base64: str) -> Dict[str, Any]:
+        self.calls += 1
+        return dict(self.result)
+
+def default_analyzer():
+    """Analyzer selected by IMAGE_ANALYZER ('openai' or 'stub')"""
+    if os.environ.get('IMAGE_ANALYZER', 'openai').lower() == 'stub':
+        return StubImageAnalyzer()
+    return OpenAIImageAnalyzer()
+
+class AnalysisCache(SQLiteStore):
+    """Persistent TTL cache of analyses keyed on content hash, with perceptual-hash lookups for near duplicates"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS analysis_cache ('
+        'content_hash TEXT PRIMARY KEY, phash TEXT, result TEXT, created REAL, expires REAL)',
+    )
+    LABEL = 'Analysis cache'
+
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[float] = None,
+                 max_distance: Optional[int] = None, scan_limit: int = 5000):
+        super().__init__(db_path or os.path.join('data', 'analysis_cache.sqlite'))
+        self.ttl = ttl if ttl is not None else float(os.environ.get('ANALYSIS_CACHE_TTL', 30 * 86400))
+        # Largest dHash distance still treated as the same picture; negative disables near matches
+        self.max_distance = max_distance if max_distance is not None else int(os.environ.get('ANALYSIS_PHASH_DISTANCE', 6))
+        self.scan_limit = scan_limit
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, content_hash: str, perceptual_hash: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Cached analysis for an identical upload, else for the closest near-identical one"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        rows = self._execute('SELECT result FROM analysis_cache WHERE content_hash = ? AND expires > ?', (content_hash, now))
+        if rows:
+            CACHE_REQUESTS.labels('analysis', 'hit').inc()
+            return json.loads(rows[0][0])
+
+        if perceptual_hash is None or self.max_distance < 0:
+            CACHE_REQUESTS.labels('analysis', 'miss').inc()
+            return None
+        best = None
+        rows = self._execute(
+            'SELECT phash, result FROM analysis_cache WHERE phash IS NOT NULL AND expires > ? ORDER BY created DESC LIMIT ?',
+            (now, self.scan_limit)
+        ) or []
+        for stored, result in rows:
+            distance = hamming_distance(perceptual_hash, int(stored, 16))
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, result)
+        CACHE_REQUESTS.labels('analysis', 'near_hit' if best else 'miss').inc()
+        return json.loads(best[1]) if best else None
+
+    def set(self, content_hash: str, perceptual_hash: Optional[int], result: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        self._execute(
+            'INSERT OR REPLACE INTO analysis_cache (content_hash, phash, result, created, expires) VALUES (?, ?, ?, ?, ?)',
+            (content_hash, f"{perceptual_hash:016x}" if perceptual_hash is not None else None,
+             json.dumps(result, ensure_ascii=False), now, now + self.ttl),
+            commit=True,
+        )
+        self._execute('DELETE FROM analysis_cache WHERE expires <= ?', (now,), commit=True)
@@ -1,77 +1,467 @@
 import os
+import json
+import time
+import base64
+import hashlib
 import logging
+import threading
 import requests
-from typing import Optional
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, Tuple
 from PIL import Image
 import io
+from urllib.parse import urlparse
+from .rate_limiter import rate_limiter
+from .http_client import http_session
+from .metrics import registry, BYTE_BUCKETS
+from .profiler import bind
 
 logger = logging.getLogger(__name__)
 
+DOWNLOADS = registry.counter('image_downloads_total', 'Image fetches by host and outcome', ('host', 'outcome'))
+DOWNLOAD_SECONDS = registry.histogram('image_download_seconds', 'Image fetch duration by host', ('host',))
+DOWNLOAD_BYTES = registry.histogram('image_download_bytes', 'Downloaded image body size by host', ('host',),
+                                    buckets=BYTE_BUCKETS)
+PROCESSING_SECONDS = registry.histogram('image_processing_seconds', 'Pillow decode, resize and encode time')
+
+# Longest side, in pixels, of the inline preview stored with each image
+PLACEHOLDER_SIZE = 16
+
+# Width processed images are scaled down to
+MAX_WIDTH = 800
+
+# Formats accepted from remote hosts, with the extension used when stored as-is
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+# Declared content types that are spelled differently from Pillow's MIME names
+CONTENT_TYPE_ALIASES = {'image/jpg': 'image/jpeg', 'image/pjpeg': 'image/jpeg', 'image/x-png': 'image/png'}
+
+# How much of the body to buffer before giving up on reading the image header
+HEADER_PROBE_LIMIT = 1024 * 1024
+
+# Rejected URLs are not retried for this long
+REJECTION_TTL = 30 * 24 * 3600
+
+# Decodes run here so a pathological image cannot hold the caller past its timeout
+DECODE_WORKERS = int(os.environ.get('IMAGE_DECODE_WORKERS', os.cpu_count() or 2))
+_decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='image-decode')
+
+# Held from submission until the decode finishes, so a submitted decode always
+# starts on a free worker and its timeout covers decoding only, never queueing.
+# A decode that overruns its timeout keeps its slot until it actually ends.
+_decode_slots = threading.BoundedSemaphore(DECODE_WORKERS)
+
+class ImageRejected(Exception):
+    """Raised when a downloaded image fails validation"""
+
+class DecodeTimeout(Exception):
+    """Raised when decoding outlasts its timeout; transient, so never recorded as a rejection"""
+
 class ImageFileManager:
     """Manages downloading, processing, and storing image files."""
 
-    def __init__(self, data_dir: str = 'data'):
+    # Item fields carrying the HTTP cache validators of the last fetch
+    VALIDATOR_FIELDS = ('local_image', 'http_etag', 'http_last_modified', 'http_content_length', 'http_validated')
+
+    # Item fields computed once at ingest for instant placeholders in the gallery
+    PLACEHOLDER_FIELDS = ('width', 'height', 'dominant_color', 'placeholder')
+
+    # 'flat' keeps every image directly in images_dir; 'sharded' fans them out
+    # over two levels of hash-prefix directories (ab/cd/<id>.jpg)
+    LAYOUTS = ('flat', 'sharded')
+
+    def __init__(self, data_dir: str = 'data', layout: Optional[str] = None):
         self.images_dir = os.path.join(data_dir, 'images')
         os.makedirs(self.images_dir, exist_ok=True)
+        self.max_bytes = int(os.environ.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+        self.max_pixels = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+        self.decode_timeout = float(os.environ.get('IMAGE_DECODE_TIMEOUT', 10.0))
+        self.rejections_file = os.path.join(data_dir, 'rejected_images.json')
+        self._rejections: Dict[str, Dict[str, Any]] = {}
+        self._rejections_mtime = None
+        self._rejections_lock = threading.Lock()
+        self.layout = (layout or os.environ.get('IMAGE_LAYOUT', 'sharded')).lower()
+        if self.layout not in self.LAYOUTS:
+            logger.warning(f"Unknown image layout '{self.layout}', falling back to 'flat'")
+            self.layout = 'flat'
+
+    def download_and_process_image(self, image_url: str, image_id: str,
+                                   image_info: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Download image and save locally with optimization.
+
+        If ``image_info`` holds the fields of a previous fetch (see
+        ``VALIDATOR_FIELDS``) and that file still exists, the request is made
+        conditional and an unchanged image is neither re-read nor re-encoded.
+        ``image_info`` is updated in place with the validators of the response
+        and, for a newly processed image, its dimensions and placeholder (see
+        ``PLACEHOLDER_FIELDS``).
+        """
+        if image_info is None:
+            image_info = {}
+        if self.is_rejected(image_url):
+            logger.info(f"Skipping previously rejected image {image_url}")
+            return None
+        cached_file = self._existing_file(image_info.get('local_image'))
+
+        headers = {}
+        if cached_file:
+            if image_info.get('http_etag'):
+                headers['If-None-Match'] = image_info['http_etag']
+            if image_info.get('http_last_modified'):
+                headers['If-Modified-Since'] = image_info['http_last_modified']
 
-    def download_and_process_image(self, image_url: str, image_id: str) -> Optional[str]:
-        """Download image and save locally with optimization"""
+        host = urlparse(image_url).hostname or 'unknown'
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-
-            parsed_url = urlparse(image_url)
-            path = parsed_url.path.lower()
-
-            if path.endswith(('.jpg', '.jpeg')):
-                ext = '.jpg'
-            elif path.endswith('.png'):
-                ext = '.png'
-            elif path.endswith('.gif'):
-                ext = '.gif'
-            elif path.endswith('.webp'):
-                ext = '.webp'
-            else:
-                content_type = response.headers.get('content-type', '').lower()
-                if 'jpeg' in content_type:
-                    ext = '.jpg'
-                elif 'png' in content_type:
-                    ext = '.png'
-                elif 'gif' in content_type:
-                    ext = '.gif'
-                elif 'webp' in content_type:
-                    ext = '.webp'
-                else:
-                    ext = '.jpg'
-
-            filename = f"{image_id}{ext}"
-            filepath = os.path.join(self.images_dir, filename)
+            rate_limiter.acquire_host(image_url)
+            with http_session.get(image_url, headers=headers, timeout=30, stream=True) as response:
+                if cached_file and response.status_code == 304:
+                    image_info['http_validated'] = time.time()
+                    logger.info(f"Image not modified, keeping {cached_file}")
+                    outcome = 'not_modified'
+                    return cached_file
 
-            try:
-                image = Image.open(io.BytesIO(response.content))
-                if image.mode in ('RGBA', 'P'):
-                    image = image.convert('RGB')
-                if image.width > 800:
-                    ratio = 800 / image.width
-                    new_height = int(image.height * ratio)
-                    image = image.resize((800, new_height), Image.Resampling.LANCZOS)
-                image.save(filepath, 'JPEG', quality=85, optimize=True)
-                logger.info(f"Downloaded and processed image: {filename}")
-                return filename
-            except Exception as e:
-                logger.warning(f"Image processing failed, saving original: {str(e)}")
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+                response.raise_for_status()
+
+                fresh_validators = self._response_validators(response)
+                if cached_file and self._validators_match(image_info, fresh_validators):
+                    image_info.update(fresh_validators)
+                    logger.info(f"Image validators unchanged, keeping {cached_file}")
+                    outcome = 'unchanged'
+                    return cached_file
+
+                body, image_format = self._read_validated_body(response)
+                DOWNLOAD_BYTES.labels(host).observe(len(body))
+                with PROCESSING_SECONDS.time():
+                    filename, attributes = self._process_image(body, image_format, image_id)
+                if cached_file and cached_file != filename:
+                    self.delete_image_file(cached_file)
+                image_info.update(fresh_validators)
+                image_info.update(attributes)
+                image_info['local_image'] = filename
+                outcome = 'downloaded'
                 return filename
+        except ImageRejected as e:
+            logger.warning(f"Rejected image {image_url}: {str(e)}")
+            self._record_rejection(image_url, str(e))
+            outcome = 'rejected'
+            return None
+        except DecodeTimeout as e:
+            logger.warning(f"Gave up on image {image_url}: {str(e)}")
+            outcome = 'timeout'
+            return None
         except Exception as e:
             logger.error(f"Error downloading image {image_url}: {str(e)}")
             return None
+        finally:
+            DOWNLOADS.labels(host, outcome).inc()
+            DOWNLOAD_SECONDS.labels(host).observe(time.perf_counter() - started)
+
+    def _read_validated_body(self, response: requests.Response) -> Tuple[bytes, str]:
+        """Read a response body, validating the image header before the rest is downloaded.
+
+        The format is sniffed and the dimensions read from the first bytes only,
+        so oversized or mislabelled images are rejected without buffering or
+        decoding them. Returns the body and the sniffed Pillow format.
+        """
+        declared_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        declared_type = CONTENT_TYPE_ALIASES.get(declared_type, declared_type)
+        if declared_type and not declared_type.startswith('image/') and declared_type not in (
+                'application/octet-stream', 'binary/octet-stream'):
+            raise ImageRejected(f"content type {declared_type} is not an image")
+
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise ImageRejected(f"body of {content_length} bytes exceeds {self.max_bytes}")
+
+        body = bytearray()
+        image_format = None
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body.extend(chunk)
+            if len(body) > self.max_bytes:
+                raise ImageRejected(f"body exceeds {self.max_bytes} bytes")
+            if image_format is None:
+                image_format = self._inspect_header(bytes(body), declared_type)
+                if image_format is None and len(body) >= HEADER_PROBE_LIMIT:
+                    raise ImageRejected("no readable image header")
+
+        if image_format is None:
+            image_format = self._inspect_header(bytes(body), declared_type)
+            if image_format is None:
+                raise ImageRejected("no readable image header")
+        return bytes(body), image_format
+
+    def _inspect_header(self, data: bytes, declared_type: str) -> Optional[str]:
+        """Sniff the format and check the dimensions of a possibly partial image.
+
+        Returns None when more bytes are needed to parse the header. Pillow only
+        parses the header in Image.open, so no pixel data is decoded here.
+        """
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image_format = image.format
+                width, height = image.size
+        except Image.DecompressionBombError as e:
+            raise ImageRejected(str(e))
+        except Exception:
+            return None
+
+        if image_format not in FORMAT_EXTENSIONS:
+            raise ImageRejected(f"unsupported format {image_format}")
+        sniffed_type = Image.MIME.get(image_format)
+        if declared_type.startswith('image/') and declared_type != sniffed_type:
+            raise ImageRejected(f"declared {declared_type} but content is {sniffed_type}")
+        if width * height > self.max_pixels:
+            raise ImageRejected(f"{width}x{height} exceeds the {self.max_pixels} pixel budget")
+        return image_format
+
+    def _process_image(self, body: bytes, image_format: str, image_id: str) -> Tuple[str, Dict[str, Any]]:
+        """Store a validated image, re-encoding it as an optimized JPEG when possible.
+
+        Returns the stored filename and the placeholder attributes of the image
+        (empty if it could not be re-encoded and was stored as downloaded).
+        """
+        # Overrunning decodes can hold every slot; wait no longer than a decode may take
+        if not _decode_slots.acquire(timeout=self.decode_timeout):
+            raise DecodeTimeout(f"no decode worker free within {self.decode_timeout}s")
+        try:
+            future = _decode_executor.submit(bind(self._encode_jpeg), body)
+        except RuntimeError:
+            _decode_slots.release()
+            raise
+        future.add_done_callback(lambda _: _decode_slots.release())
+        try:
+            data, attributes = future.result(timeout=self.decode_timeout)
+            ext = '.jpg'
+        except FutureTimeoutError:
+            raise DecodeTimeout(f"decoding took longer than {self.decode_timeout}s")
+        except Exception as e:
+            logger.warning(f"Image processing failed, saving original: {str(e)}")
+            data, attributes = body, {}
+            ext = FORMAT_EXTENSIONS[image_format]
+
+        filename = self.relative_path(f"{image_id}{ext}")
+        filepath = os.path.join(self.images_dir, filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Write next to the target and swap it in so the file is never served half-written
+        temp_path = f"{filepath}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, filepath)
+        logger.info(f"Downloaded and processed image: {filename}")
+        return filename, attributes
+
+    @classmethod
+    def _encode_jpeg(cls, body: bytes) -> Tuple[bytes, Dict[str, Any]]:
+        """Decode, scale down and re-encode an image; runs on the decode executor"""
+        image = Image.open(io.BytesIO(body))
+        # Let the JPEG decoder skip detail we would throw away when resizing
+        image.draft('RGB', (MAX_WIDTH, MAX_WIDTH * image.height // max(image.width, 1)))
+        if image.mode in ('RGBA', 'P'):
+            image = image.convert('RGB')
+        if image.width > MAX_WIDTH:
+            ratio = MAX_WIDTH / image.width
+            new_height = int(image.height * ratio)
+            image = image.resize((MAX_WIDTH, new_height), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85, optimize=True)
+        return buffer.getvalue(), cls._placeholder_attributes(image)
+
+    def is_rejected(self, image_url: str) -> bool:
+        """Whether image_url failed validation recently and should not be fetched again"""
+        rejection = self._load_rejections().get(self._rejection_key(image_url))
+        return bool(rejection) and time.time() - rejection.get('rejected_date', 0) < REJECTION_TTL
+
+    @staticmethod
+    def _rejection_key(image_url: str) -> str:
+        return hashlib.md5(image_url.encode()).hexdigest()
+
+    def _load_rejections(self) -> Dict[str, Dict[str, Any]]:
+        """Rejections recorded by any worker, re-read only when the file changes"""
+        try:
+            mtime = os.stat(self.rejections_file).st_mtime_ns
+        except OSError:
+            return self._rejections
+        if mtime != self._rejections_mtime:
+            try:
+                with open(self.rejections_file, 'r', encoding='utf-8') as f:
+                    self._rejections = json.load(f)
+                self._rejections_mtime = mtime
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Error loading image rejections: {str(e)}")
+        return self._rejections
+
+    def _record_rejection(self, image_url: str, reason: str) -> None:
+        with self._rejections_lock:
+            rejections = dict(self._load_rejections())
+            now = time.time()
+            rejections = {
+                key: value for key, value in rejections.items()
+                if now - value.get('rejected_date', 0) < REJECTION_TTL
+            }
+            rejections[self._rejection_key(image_url)] = {
+                'image_url': image_url,
+                'reason': reason,
+                'rejected_date': now,
+            }
+            temp_file = f"{self.rejections_file}.{os.getpid()}.tmp"
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(rejections, f, indent=2)
+                os.replace(temp_file, self.rejections_file)
+                self._rejections = rejections
+            except OSError as e:
+                logger.error(f"Error saving image rejection: {str(e)}")
+
+    @staticmethod
+    def _placeholder_attributes(image: Image.Image) -> Dict[str, Any]:
+        """Dimensions, dominant color and a tiny inline preview of a processed image.
+
+        Stored on the item so the gallery can reserve space and paint something
+        before the real image arrives, without an extra request.
+        """
+        rgb = image if image.mode == 'RGB' else image.convert('RGB')
+
+        sample = rgb.copy()
+        sample.thumbnail((64, 64))
+        quantized = sample.quantize(colors=5)
+        count, index = max(quantized.getcolors())
+        palette = quantized.getpalette()
+        red, green, blue = palette[index * 3:index * 3 + 3]
+
+        preview = rgb.copy()
+        preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        buffer = io.BytesIO()
+        preview.save(buffer, 'JPEG', quality=40)
+
+        return {
+            'width': image.width,
+            'height': image.height,
+            'dominant_color': f"#{red:02x}{green:02x}{blue:02x}",
+            'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+        }
+
+    def describe_image(self, local_image: str) -> Dict[str, Any]:
+        """Placeholder attributes of an already stored image (empty if it cannot be read)"""
+        filepath = self.resolve_path(local_image)
+        if not filepath:
+            return {}
+        try:
+            with Image.open(filepath) as image:
+                return self._placeholder_attributes(image)
+        except Exception as e:
+            logger.warning(f"Could not describe image {local_image}: {str(e)}")
+            return {}
+
+    def relative_path(self, filename: str) -> str:
+        """Location of an image named filename, relative to images_dir, in the configured layout"""
+        filename = os.path.basename(filename)
+        if self.layout == 'sharded':
+            return self.sharded_path(filename)
+        return filename
+
+    @staticmethod
+    def sharded_path(filename: str) -> str:
+        """Hash-prefix location of filename, e.g. 'ab/cd/<id>.jpg'"""
+        digest = hashlib.md5(os.path.splitext(filename)[0].encode()).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+    def resolve_path(self, local_image: str) -> Optional[str]:
+        """Absolute path of a stored image under either layout, None if it is missing.
+
+        local_image may be a bare filename or a sharded relative path, so items
+        saved before and after a layout migration both resolve.
+        """
+        images_root = os.path.abspath(self.images_dir)
+        filename = os.path.basename(local_image)
+        for candidate in (local_image, self.sharded_path(filename), filename):
+            path = os.path.abspath(os.path.join(images_root, candidate))
+            if not path.startswith(images_root + os.sep):
+                continue
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def migrate_file(self, local_image: str) -> Optional[str]:
+        """Move a stored image into the configured layout.
+
+        Returns its new relative path (unchanged if it is already in place),
+        or None if the file cannot be found.
+        """
+        current_path = self.resolve_path(local_image)
+        if not current_path:
+            return None
+        target = self.relative_path(local_image)
+        target_path = os.path.abspath(os.path.join(self.images_dir, target))
+        if current_path != target_path:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(current_path, target_path)
+        return target
+
+    def _existing_file(self, filename: Optional[str]) -> Optional[str]:
+        """Return the current relative path of filename if that image is still on disk"""
+        path = self.resolve_path(filename) if filename else None
+        if path:
+            return os.path.relpath(path, os.path.abspath(self.images_dir)).replace(os.sep, '/')
+        return None
+
+    @staticmethod
+    def _response_validators(response: requests.Response) -> Dict[str, Any]:
+        """Extract the cache validators of a response"""
+        validators: Dict[str, Any] = {'http_validated': time.time()}
+        if response.headers.get('ETag'):
+            validators['http_etag'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['http_last_modified'] = response.headers['Last-Modified']
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit():
+            validators['http_content_length'] = int(content_length)
+        return validators
+
+    @staticmethod
+    def _validators_match(stored: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+        """Whether a full response is known to carry the same bytes as the stored copy.
+
+        A strong ETag match is decisive; otherwise both Last-Modified and the
+        content length have to agree.
+        """
+        stored_etag = stored.get('http_etag')
+        fresh_etag = fresh.get('http_etag')
+        if stored_etag and fresh_etag and not fresh_etag.startswith('W/'):
+            return stored_etag == fresh_etag
+        return (
+            bool(stored.get('http_last_modified'))
+            and stored.get('http_last_modified') == fresh.get('http_last_modified')
+            and stored.get('http_content_length') is not None
+            and stored.get('http_content_length') == fresh.get('http_content_length')
+        )
+
+    @staticmethod
+    def stat_version(stat: os.stat_result) -> str:
+        """Token that changes whenever a file is rewritten, e.g. when revalidation replaces an image"""
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def file_version(self, filename: str) -> Optional[str]:
+        """stat_version of a stored image, None if it is missing"""
+        filepath = self.resolve_path(filename)
+        try:
+            return self.stat_version(os.stat(filepath)) if filepath else None
+        except OSError:
+            return None
+
+    def get_file_size(self, filename: str) -> int:
+        """Size in bytes of a stored image, 0 if it is missing"""
+        filepath = self.resolve_path(filename)
+        try:
+            return os.path.getsize(filepath) if filepath else 0
+        except OSError:
+            return 0
 
     def delete_image_file(self, filename: str) -> bool:
         """Deletes an image file from the images directory."""
-        filepath = os.path.join(self.images_dir, filename)
-        if os.path.exists(filepath):
+        filepath = self.resolve_path(filename)
+        if filepath:
             try:
                 os.remove(filepath)
                 return True
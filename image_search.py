@@ -3,19 +3,32 @@ Alternative Image Search Implementation
 Uses DuckDuckGo and Bing for finding shell craft images without API quotas
 """
 
+import os
 import requests
 import json
 import logging
-import hashlib
 import time
 import random
-import re
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Dict, Any, Optional
 from urllib.parse import quote_plus, urljoin
-from bs4 import BeautifulSoup
+from .search_cache import cached_search, search_cache
+from .http_client import http_session
+from .duckduckgo_tokens import vqd_tokens
+from .bing_extractor import extract_bing_results
+from .url_canonicalizer import canonical_id, canonicalize_url
+from .search_orchestrator import (SearchOrchestrator, DeadlineExceeded, acquire_within_budget, budget_timeout,
+                                  remaining_budget, search_budget)
+from .circuit_breaker import circuit_breakers
+from .alternative_image_search import AlternativeImageSearch
 
 logger = logging.getLogger(__name__)
 
+# Results per engine page; pages past the first are fetched by offset
+BING_PAGE_SIZE = 35
+DUCKDUCKGO_PAGE_SIZE = 100
+
 class ImageSearcher:
     """Search for shell craft images using DuckDuckGo and Bing"""
     
@@ -25,6 +38,21 @@ class ImageSearcher:
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         ]
+        # Seconds a search_images call may take before it returns what it has
+        self.search_deadline = float(os.environ.get('SEARCH_DEADLINE', 12.0))
+        self.alternative = AlternativeImageSearch()
+        # Providers are looked up on each call so they can be swapped per instance
+        self.orchestrator = SearchOrchestrator(budget=self.search_deadline)
+        self.orchestrator.register('DuckDuckGo', lambda q, n, offset: self.search_duckduckgo_images(q, n, offset),
+                                   breaker=circuit_breakers.get('engine:duckduckgo'))
+        self.orchestrator.register('Bing', lambda q, n, offset: self.search_bing_images(q, n, offset),
+                                   breaker=circuit_breakers.get('engine:bing'))
+        self.orchestrator.register('Direct Scraping', lambda q, n, offset: self.search_craft_sites(q, n, offset),
+                                   backup=True, breaker=circuit_breakers.get('site:etsy'))
+        # Background fetches of the page after the one just returned
+        self._prefetch_lock = threading.Lock()
+        self._prefetching = set()
+        self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search-prefetch')
     
     def get_headers(self):
         """Get random headers to avoid blocking"""
@@ -37,68 +65,95 @@ class ImageSearcher:
             'Upgrade-Insecure-Requests': '1',
         }
     
-    def search_images(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search for images using both DuckDuckGo and Bing"""
-        all_results = []
-        
-        # Split limit between the two search engines
-        ddg_limit = limit // 2
-        bing_limit = limit - ddg_limit
-        
-        # Try DuckDuckGo first
-        try:
-            ddg_results = self.search_duckduckgo_images(query, ddg_limit)
-            all_results.extend(ddg_results)
-        except Exception as e:
-            logger.error(f"DuckDuckGo search failed: {e}")
-        
-        # Add delay between search engines
-        time.sleep(2)
-        
-        # Try Bing search
-        try:
-            bing_results = self.search_bing_images(query, bing_limit)
-            all_results.extend(bing_results)
-        except Exception as e:
-            logger.error(f"Bing search failed: {e}")
-        
-        # Remove duplicates based on image URL
-        seen_urls = set()
-        unique_results = []
-        
-        for result in all_results:
-            if result['image_url'] not in seen_urls:
-                seen_urls.add(result['image_url'])
-                unique_results.append(result)
-        
-        return unique_results[:limit]
+    def search_images(self, query: str, limit: int = 10, deadline: Optional[float] = None,
+                      offset: int = 0, prefetch: bool = False) -> List[Dict[str, Any]]:
+        """Search for images on DuckDuckGo and Bing concurrently.
+
+        Results are merged and deduplicated as each engine answers. The call
+        returns as soon as limit unique results are in or the deadline (seconds,
+        defaulting to SEARCH_DEADLINE) passes, whichever comes first. Craft site
+        scraping is hedged in when the engines are slow or come up short.
+
+        With prefetch, the next page is then fetched into the search cache so
+        the search_more call for it can answer locally. Only searches a user is
+        likely to page through should ask for it, since it doubles engine traffic.
+        """
+        results = self.orchestrator.search(query, limit, budget=deadline, offset=offset)
+        if prefetch:
+            self.prefetch(query, limit, offset + limit)
+        return results
+    
+    def search_queries(self, queries: List[str], limit: int = 10,
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """search_images for several related queries under one deadline, merged and deduplicated"""
+        return self.orchestrator.search_many(queries, limit, budget=deadline, offset=0)
+    
+    def search_more(self, query: str, limit: int = 10, deadline: Optional[float] = None,
+                    offset: int = 0, seen: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """The page of a query starting at offset, without the canonical URLs in seen.
+
+        The caller keeps the position (see ResultSets.position), so a load-more
+        continues the right search whichever user or worker process it comes from.
+        """
+        seen = set(seen)
+        results = self.orchestrator.search(query, limit, budget=deadline, offset=offset)
+        results = [result for result in results if canonicalize_url(result['image_url']) not in seen]
+        self.prefetch(query, limit, offset + limit)
+        return results
+    
+    def prefetch(self, query: str, limit: int, offset: int):
+        """Warm the search cache with the engine pages covering offset..offset+limit"""
+        if not search_cache.enabled:
+            return
+        key = (search_cache.normalize_query(query), limit, offset)
+        with self._prefetch_lock:
+            if key in self._prefetching:
+                return
+            self._prefetching.add(key)
+
+        def fetch():
+            try:
+                with search_budget(self.search_deadline):
+                    self.search_bing_images(query, limit, offset)
+                    self.search_duckduckgo_images(query, limit, offset)
+            except Exception as e:
+                logger.debug(f"Prefetch of '{query}' at {offset} failed: {e}")
+            finally:
+                with self._prefetch_lock:
+                    self._prefetching.discard(key)
+
+        self._prefetcher.submit(fetch)
     
-    def search_duckduckgo_images(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search DuckDuckGo Images for shell craft images"""
+    def search_craft_sites(self, query: str, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """Scrape craft marketplaces directly, with ids in the same form as the engine results"""
+        if offset:
+            # Craft sites only contribute to the first page
+            return []
+        results = self.alternative.search_direct_scraping(query, limit)
+        for result in results:
+            result.setdefault('id', canonical_id(result['image_url']))
+        return results
+    
+    def search_duckduckgo_images(self, query: str, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """Search DuckDuckGo Images for shell craft images, starting offset results in"""
+        return self._collect_pages(self.search_duckduckgo_page, query, limit, offset, DUCKDUCKGO_PAGE_SIZE)
+    
+    @cached_search
+    def search_duckduckgo_page(self, query: str, page: int = 0) -> List[Dict[str, Any]]:
+        """One page of DuckDuckGo Images results (page 0 is the first)"""
+        breaker = circuit_breakers.get('engine:duckduckgo')
+        if not breaker.allow():
+            logger.debug(f"Skipping DuckDuckGo for '{query}': circuit open")
+            return []
         try:
-            # First make a request to get the vqd token
-            search_url = "https://duckduckgo.com/"
-            response = requests.get(search_url, headers=self.get_headers(), timeout=10)
-            response.raise_for_status()
-            
-            # Try multiple patterns to extract vqd token
-            vqd_patterns = [
-                r'vqd=([\d-]+)',
-                r'"vqd":"([\d-]+)"',
-                r'vqd":\s*"([\d-]+)"',
-                r'vqd=([^&,\s]+)'
-            ]
-            
-            vqd = None
-            for pattern in vqd_patterns:
-                vqd_match = re.search(pattern, response.text)
-                if vqd_match:
-                    vqd = vqd_match.group(1)
-                    break
-            
+            # Reuse the cached vqd token for this query; only a miss costs an extra round trip
+            vqd = vqd_tokens.get(query, self.get_headers(), timeout=budget_timeout(15.0))
+            if not vqd and remaining_budget() == 0:
+                raise DeadlineExceeded('no budget left for a DuckDuckGo token')
             if not vqd:
                 # DuckDuckGo token extraction failed - this is common due to anti-bot measures
                 # Skip DuckDuckGo silently since Bing provides good results
+                breaker.record_failure('no vqd token')
                 return []
             
             # Perform image search
@@ -109,17 +164,24 @@ class ImageSearcher:
                 'q': query,
                 'vqd': vqd,
                 'f': ',,,',
-                'p': '1'
+                'p': '1',
+                's': str(page * DUCKDUCKGO_PAGE_SIZE)
             }
             
-            time.sleep(1)  # Rate limiting
-            response = requests.get(image_search_url, params=params, headers=self.get_headers(), timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            acquire_within_budget('engine:duckduckgo')
+            started = time.monotonic()
+            response = http_session.get(image_search_url, params=params, headers=self.get_headers(), timeout=10)
+            try:
+                response.raise_for_status()
+                data = response.json()
+            except (requests.HTTPError, ValueError):
+                # A rejected or garbled answer usually means the token went stale
+                vqd_tokens.record_search(query, False)
+                raise
+            vqd_tokens.record_search(query, True)
             results = []
             
-            for item in data.get('results', [])[:limit]:
+            for item in data.get('results', []):
                 try:
                     title = item.get('title', 'Shell Craft')
                     image_url = item.get('image', '')
@@ -127,7 +189,7 @@ class ImageSearcher:
                     
                     if image_url and source_url:
                         result = {
-                            'id': hashlib.md5(image_url.encode()).hexdigest(),
+                            'id': canonical_id(image_url),
                             'title': title,
                             'image_url': image_url,
                             'source_url': source_url,
@@ -140,67 +202,82 @@ class ImageSearcher:
                     logger.debug(f"Error processing DuckDuckGo item: {e}")
                     continue
             
+            breaker.record_success(time.monotonic() - started)
             logger.info(f"DuckDuckGo found {len(results)} image results")
             return results
             
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
+            breaker.record_failure(e)
             logger.error(f"DuckDuckGo search error: {e}")
             return []
     
-    def search_bing_images(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search Bing Images for shell craft images"""
+    def search_bing_images(self, query: str, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """Search Bing Images for shell craft images, starting offset results in"""
+        return self._collect_pages(self.search_bing_page, query, limit, offset, BING_PAGE_SIZE)
+    
+    @cached_search
+    def search_bing_page(self, query: str, page: int = 0) -> List[Dict[str, Any]]:
+        """One page of Bing Images results (page 0 is the first)"""
+        breaker = circuit_breakers.get('engine:bing')
+        if not breaker.allow():
+            logger.debug(f"Skipping Bing for '{query}': circuit open")
+            return []
         try:
-            logger.info(f"Searching Bing Images for: {query}")
-            search_url = f"https://www.bing.com/images/search?q={quote_plus(query)}&form=HDRSC2"
+            logger.info(f"Searching Bing Images for: {query} (page {page + 1})")
+            if page == 0:
+                search_url = f"https://www.bing.com/images/search?q={quote_plus(query)}&form=HDRSC2"
+            else:
+                # Later pages come from the endpoint the results page uses for infinite scroll
+                search_url = (f"https://www.bing.com/images/async?q={quote_plus(query)}"
+                              f"&first={page * BING_PAGE_SIZE + 1}&count={BING_PAGE_SIZE}")
             
-            response = requests.get(search_url, headers=self.get_headers(), timeout=15)
+            acquire_within_budget('engine:bing')
+            started = time.monotonic()
+            response = http_session.get(search_url, headers=self.get_headers(), timeout=15)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find image containers
-            image_containers = soup.find_all('a', class_='iusc')
-            
             results = []
-            for container in image_containers[:limit]:
-                try:
-                    # Extract image data from the container
-                    m_attr = container.get('m')
-                    if m_attr:
-                        try:
-                            image_data = json.loads(m_attr)
-                            
-                            title = image_data.get('t', 'Shell Craft')
-                            image_url = image_data.get('murl', '')
-                            source_url = image_data.get('purl', '')
-                            
-                            if image_url and source_url:
-                                result = {
-                                    'id': hashlib.md5(image_url.encode()).hexdigest(),
-                                    'title': title,
-                                    'image_url': image_url,
-                                    'source_url': source_url,
-                                    'platform': self.detect_platform(source_url),
-                                    'description': f"Shell craft found via Bing Images search for '{query}'",
-                                    'search_query': query
-                                }
-                                results.append(result)
-                                
-                        except (json.JSONDecodeError, KeyError) as e:
-                            logger.debug(f"Error parsing Bing image data: {e}")
-                            continue
-                            
-                except Exception as e:
-                    logger.debug(f"Error processing Bing container: {e}")
-                    continue
+            for image_data in extract_bing_results(response.content, BING_PAGE_SIZE):
+                image_url = image_data['murl']
+                source_url = image_data['purl']
+                results.append({
+                    'id': canonical_id(image_url),
+                    'title': image_data.get('t', 'Shell Craft'),
+                    'image_url': image_url,
+                    'source_url': source_url,
+                    'platform': self.detect_platform(source_url),
+                    'description': f"Shell craft found via Bing Images search for '{query}'",
+                    'search_query': query
+                })
             
+            breaker.record_success(time.monotonic() - started)
             logger.info(f"Bing found {len(results)} image results")
             return results
             
+        except DeadlineExceeded:
+            breaker.release()
+            raise
         except Exception as e:
+            breaker.record_failure(e)
             logger.error(f"Bing search error: {e}")
             return []
     
+    def _collect_pages(self, fetch_page, query: str, limit: int, offset: int, page_size: int) -> List[Dict[str, Any]]:
+        """Results offset..offset+limit, fetched one engine page at a time"""
+        page, skip = divmod(offset, page_size)
+        last_page = (offset + limit) // page_size + 1
+        results = []
+        while len(results) < limit and page <= last_page:
+            page_results = fetch_page(query, page=page)
+            if not page_results:
+                break
+            results.extend(page_results[skip:])
+            page, skip = page + 1, 0
+        return results[:limit]
+    
     def reverse_image_search(self, image_path: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search for similar images using related shell craft terms"""
         # Since we don't have direct reverse image search, use related queries
@@ -213,6 +290,8 @@ class ImageSearcher:
         
         all_results = []
         results_per_query = max(1, limit // len(related_queries))
+        # Fetch DuckDuckGo tokens for the later queries while the first one runs
+        vqd_tokens.prefetch(related_queries, self.get_headers())
         
         for query in related_queries:
             results = self.search_images(query, results_per_query)
@@ -220,8 +299,6 @@ class ImageSearcher:
             
             if len(all_results) >= limit:
                 break
-            
-            time.sleep(1)  # Rate limiting
         
         return all_results[:limit]
     
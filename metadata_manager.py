@@ -3,16 +3,34 @@ import json
 import logging
 import time
 import hashlib
+import threading
 from typing import List, Dict, Any, Optional
+from .metrics import registry
 
 logger = logging.getLogger(__name__)
 
+METADATA_LOAD_SECONDS = registry.histogram('metadata_load_seconds', 'Time to read and parse metadata.json')
+METADATA_SAVE_SECONDS = registry.histogram('metadata_save_seconds', 'Time to serialize and write metadata.json')
+METADATA_FILE_BYTES = registry.gauge('metadata_file_bytes', 'Size of metadata.json at its last load or save')
+
+# One lock per metadata file, shared by every manager instance in the process
+_file_locks: Dict[str, threading.RLock] = {}
+_file_locks_guard = threading.Lock()
+
+# Writes made by this process per metadata file; catches rewrites the file's stat cannot tell apart
+_write_counts: Dict[str, int] = {}
+
+def _lock_for(path: str) -> threading.RLock:
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(path), threading.RLock())
+
 class MetadataManager:
     """Manages storage and retrieval of metadata"""
     
     def __init__(self, data_dir: str = 'data'):
         self.data_dir = data_dir
         self.metadata_file = os.path.join(data_dir, 'metadata.json')
+        self._lock = _lock_for(self.metadata_file)
         
         os.makedirs(self.data_dir, exist_ok=True)
         
@@ -21,43 +39,78 @@ class MetadataManager:
 
     def _load_metadata(self) -> Dict[str, Any]:
         """Load metadata from JSON file"""
+        started = time.perf_counter()
         try:
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.metadata_file, 'rb') as f:
+                data = f.read()
+            metadata = json.loads(data)
+            METADATA_LOAD_SECONDS.observe(time.perf_counter() - started)
+            METADATA_FILE_BYTES.set(len(data))
+            return metadata
         except (FileNotFoundError, json.JSONDecodeError) as e:
             logger.error(f"Error loading metadata: {str(e)}")
             return {}
 
     def _save_metadata(self, metadata: Dict[str, Any]) -> bool:
         """Save metadata to JSON file"""
+        started = time.perf_counter()
         try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
+            # Write to a temporary file and swap it in so readers never see a partial file
+            temp_file = f"{self.metadata_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, indent=2, ensure_ascii=False)
+            size = os.path.getsize(temp_file)
+            os.replace(temp_file, self.metadata_file)
+            METADATA_SAVE_SECONDS.observe(time.perf_counter() - started)
+            METADATA_FILE_BYTES.set(size)
+            path = os.path.abspath(self.metadata_file)
+            with _file_locks_guard:
+                _write_counts[path] = _write_counts.get(path, 0) + 1
             return True
         except Exception as e:
             logger.error(f"Error saving metadata: {str(e)}")
             return False
 
+    def version(self) -> str:
+        """Token that changes whenever the metadata file is rewritten, the same in every process"""
+        try:
+            stat = os.stat(self.metadata_file)
+        except OSError:
+            return '0'
+        return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def cache_version(self) -> str:
+        """version() plus this process's write count, for in-process caches only
+
+        The count catches rewrites the file's stat cannot tell apart, but differs
+        between worker processes, so it must never reach a client.
+        """
+        writes = _write_counts.get(os.path.abspath(self.metadata_file), 0)
+        return f"{self.version()}-{writes:x}"
+
     def save_item(self, item: Dict[str, Any], category: str) -> Optional[str]:
         """Save a single item to the metadata"""
-        metadata = self._load_metadata()
-        item_id = item.get('id')
-        if not item_id:
-            source_url = item.get('source_url', '')
-            item_id = hashlib.md5(source_url.encode()).hexdigest()
-            item['id'] = item_id
-
-        if item_id in metadata:
-            metadata[item_id]['category'] = category
-            metadata[item_id]['last_updated'] = time.time()
-        else:
-            item['category'] = category
-            item['saved_date'] = time.time()
-            metadata[item_id] = item
-
-        if self._save_metadata(metadata):
-            return item_id
-        return None
+        with self._lock:
+            metadata = self._load_metadata()
+            item_id = item.get('id')
+            if not item_id:
+                source_url = item.get('source_url', '')
+                item_id = hashlib.md5(source_url.encode()).hexdigest()
+                item['id'] = item_id
+
+            if item_id in metadata:
+                stored = metadata[item_id]
+                stored.update({key: value for key, value in item.items() if key != 'saved_date'})
+                stored['category'] = category
+                stored['last_updated'] = time.time()
+            else:
+                item['category'] = category
+                item['saved_date'] = time.time()
+                metadata[item_id] = item
+
+            if self._save_metadata(metadata):
+                return item_id
+            return None
 
     def get_all(self) -> List[Dict[str, Any]]:
         """Get all items from metadata"""
@@ -69,15 +122,46 @@ class MetadataManager:
         metadata = self._load_metadata()
         return metadata.get(item_id)
 
+    def get_many(self, item_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Items for several ids with a single read of the metadata file; missing ids are left out"""
+        metadata = self._load_metadata()
+        return {item_id: metadata[item_id] for item_id in item_ids if item_id in metadata}
+
     def get_by_category(self, category: str) -> List[Dict[str, Any]]:
         """Get all items in a specific category"""
         metadata = self._load_metadata()
         return [item for item in metadata.values() if item.get('category') == category]
 
+    def update_items(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """Merge fields into several stored items with a single write"""
+        with self._lock:
+            metadata = self._load_metadata()
+            updated = 0
+            for item_id, fields in updates.items():
+                if item_id in metadata:
+                    metadata[item_id].update(fields)
+                    updated += 1
+            if updated and not self._save_metadata(metadata):
+                return 0
+            return updated
+
     def delete_item(self, item_id: str) -> bool:
         """Delete an item from the metadata"""
-        metadata = self._load_metadata()
-        if item_id in metadata:
-            del metadata[item_id]
-            return self._save_metadata(metadata)
-        return False
+        with self._lock:
+            metadata = self._load_metadata()
+            if item_id in metadata:
+                del metadata[item_id]
+                return self._save_metadata(metadata)
+            return False
+
+    def delete_items(self, item_ids: List[str]) -> int:
+        """Delete several items from the metadata with a single write"""
+        with self._lock:
+            metadata = self._load_metadata()
+            deleted = 0
+            for item_id in item_ids:
+                if metadata.pop(item_id, None) is not None:
+                    deleted += 1
+            if deleted and not self._save_metadata(metadata):
+                return 0
+            return deleted
@@ -0,0 +1,249 @@
+"""
+In-process metrics in the Prometheus text format
+Counters and histograms keep one preallocated shard per thread, so recording a
+value is a plain list update with no lock; shards are only summed when /metrics
+is scraped. A thread's shard is folded into a retired total when the thread exits.
+"""
+
+import time
+import bisect
+import weakref
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers a fast cache hit through a slow engine call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# Label values past this many per metric are folded into one series
+OVERFLOW_LABEL = '__other__'
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _ThreadToken:
+    """Lives in a thread's local storage, so it is released when the thread exits"""
+
+class _Series:
+    """One label combination; values live in per-thread shards of a fixed size"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._shards: Dict[int, List[float]] = {}
+        self._retired = [0.0] * size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def shard(self) -> List[float]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            token = _ThreadToken()
+            shard = [0.0] * self._size
+            with self._lock:
+                self._shards[id(token)] = shard
+            weakref.finalize(token, self._retire, id(token))
+            self._local.token, self._local.shard = token, shard
+        return shard
+
+    def _retire(self, key: int):
+        """Fold the shard of an exited thread into the retired total"""
+        with self._lock:
+            shard = self._shards.pop(key, None)
+            if shard is not None:
+                for i, value in enumerate(shard):
+                    self._retired[i] += value
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards.values())
+            totals = list(self._retired)
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: int = 1000):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The series for these label values, created on first use"""
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                if len(self._series) >= self.max_series and key not in self._series:
+                    key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = self._new_series()
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _label_text(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, child in series:
+            lines.extend(self._render_series(key, child))
+        return lines
+
+class _CounterSeries(_Series):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1.0):
+        self.shard()[0] += amount
+
+    def value(self) -> float:
+        return self.totals()[0]
+
+class Counter(_Metric):
+    """Monotonic total, e.g. requests or bytes"""
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount: float = 1.0):
+        """Increment the series of a metric without labels"""
+        self.labels().inc(amount)
+
+    def _render_series(self, key, child):
+        return [f"{self.name}{self._label_text(key)} {_format_value(child.value())}"]
+
+class _GaugeSeries:
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def value(self) -> float:
+        return self._value
+
+class Gauge(_Metric):
+    """Last observed value, e.g. a file size"""
+    kind = 'gauge'
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _render_series(self, key, child):
+        return [f"{self.name}{self._label_text(key)} {_format_value(child.value())}"]
+
+class _HistogramSeries(_Series):
+    def __init__(self, buckets: Tuple[float, ...]):
+        # One slot per bucket, one for +Inf, then the sum
+        super().__init__(len(buckets) + 2)
+        self._buckets = buckets
+
+    def observe(self, value: float):
+        shard = self.shard()
+        shard[bisect.bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed, preallocated buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, max_series: int = 1000):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return self.labels().time()
+
+    def _render_series(self, key, child):
+        totals = child.totals()
+        lines = []
+        cumulative = 0.0
+        for bound, count in zip(self.buckets + (float('inf'),), totals[:-1]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._label_text(key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+        lines.append(f"{self.name}_sum{self._label_text(key)} {_format_value(totals[-1])}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {_format_value(cumulative)}")
+        return lines
+
+class MetricsRegistry:
+    """Named metrics; asking for an existing name returns the registered metric"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames, **kwargs)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames, **kwargs)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, **kwargs)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+CACHE_REQUESTS = registry.counter('cache_requests_total', 'Cache lookups by cache and result (hit, near_hit or miss)',
+                                  ('cache', 'result'))
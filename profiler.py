@@ -0,0 +1,239 @@
+"""
+On-demand request profiling
+A sampler thread reads the profiled request's stack at a fixed interval, so the
+request itself runs unmodified and requests that are not profiled pay nothing.
+Work the request hands to thread pools is sampled too when it is submitted
+through bind(). Profiles are written as collapsed stacks ("a;b;c <count>" per
+line), the input format of flamegraph.pl and speedscope, with a JSON sidecar
+describing the request.
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import re
+import logging
+import threading
+import functools
+import contextvars
+from collections import Counter
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class StackSampler:
+    """Samples the stack of one thread, plus any workers attached to it, until stopped"""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        # Pool threads currently doing work for the sampled thread, with the root frame they get
+        self._workers: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self) -> 'StackSampler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def attach(self, thread_id: int, name: str):
+        self._workers[thread_id] = name
+
+    def detach(self, thread_id: int):
+        self._workers.pop(thread_id, None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            frame = frames.get(self.thread_id)
+            if frame is None:
+                break
+            self._sample(frame)
+            for thread_id, name in list(self._workers.items()):
+                if thread_id in frames:
+                    self._sample(frames[thread_id], name)
+
+    def _sample(self, frame, root: Optional[str] = None):
+        stack = []
+        while frame is not None:
+            stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        if root:
+            stack.append(root)
+        self.stacks[';'.join(reversed(stack))] += 1
+
+def collapse(stacks: Counter) -> str:
+    """Stacks in the collapsed format, heaviest first"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class ProfileStore:
+    """Directory of profiles holding at most ``keep``, either the slowest or the latest"""
+
+    def __init__(self, directory: str, keep: int = 20, keep_slowest: bool = True):
+        self.directory = directory
+        self.keep = keep
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+
+    def save(self, profile_id: str, stacks: Counter, info: Dict[str, Any]) -> bool:
+        """Write a profile and prune the directory. False if it was not kept."""
+        info = dict(info, id=profile_id, samples=sum(stacks.values()))
+        with self._lock:
+            if self.keep_slowest and not self._is_kept(info['duration']):
+                return False
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._path(profile_id, '.collapsed'), 'w', encoding='utf-8') as f:
+                    f.write(collapse(stacks))
+                with open(self._path(profile_id, '.json'), 'w', encoding='utf-8') as f:
+                    json.dump(info, f)
+            except OSError as e:
+                logger.error(f"Error saving profile {profile_id}: {e}")
+                return False
+            self._prune()
+        return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Descriptions of the stored profiles, slowest or latest first"""
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        sort_key = 'duration' if self.keep_slowest else 'started'
+        return sorted(profiles, key=lambda profile: profile.get(sort_key, 0), reverse=True)
+
+    def read(self, profile_id: str) -> Optional[str]:
+        """Collapsed stacks of a stored profile, or None"""
+        if not profile_id.isalnum():
+            return None
+        try:
+            with open(self._path(profile_id, '.collapsed'), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def _is_kept(self, duration: float) -> bool:
+        profiles = self.list()
+        return len(profiles) < self.keep or duration > profiles[self.keep - 1].get('duration', 0)
+
+    def _prune(self):
+        for profile in self.list()[self.keep:]:
+            for suffix in ('.collapsed', '.json'):
+                try:
+                    os.remove(self._path(profile['id'], suffix))
+                except OSError:
+                    pass
+
+class ActiveProfile:
+    """A profile being recorded for one request"""
+
+    def __init__(self, sampler: StackSampler, requested: bool):
+        self.id = uuid.uuid4().hex[:16]
+        self.sampler = sampler
+        self.requested = requested
+        self.started = time.time()
+
+# The profile of the request running in this context, if it is being profiled
+_current: contextvars.ContextVar = contextvars.ContextVar('request_profile', default=None)
+
+def bind(fn):
+    """fn wrapped so the pool thread running it is sampled with the submitting request's profile
+
+    Returns fn itself when the submitting request is not being profiled.
+    """
+    profile = _current.get()
+    if profile is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        thread = threading.current_thread()
+        # 'search_3' and 'search_5' are the same pool in a flame graph
+        pool = re.sub(r'_\d+$', '', thread.name)
+        profile.sampler.attach(thread.ident, f"worker:{pool}")
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.sampler.detach(thread.ident)
+    return run
+
+class RequestProfiler:
+    """Decides which requests to profile and stores what was recorded.
+
+    A request is profiled when it carries the configured secret, or at random for
+    ``sample_rate`` of requests. Requested profiles keep the latest ``keep``;
+    sampled ones keep the slowest ``keep``, so the worst requests are on hand
+    without anyone asking for them.
+    """
+
+    def __init__(self, secret: Optional[str] = None, sample_rate: Optional[float] = None,
+                 directory: Optional[str] = None, keep: Optional[int] = None,
+                 interval: Optional[float] = None, max_concurrent: int = 4):
+        self.secret = secret if secret is not None else os.environ.get('PROFILE_SECRET', '')
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+        self.interval = interval if interval is not None else float(os.environ.get('PROFILE_INTERVAL', 0.005))
+        directory = directory or os.environ.get('PROFILE_DIR', os.path.join('data', 'profiles'))
+        keep = keep if keep is not None else int(os.environ.get('PROFILE_KEEP', 20))
+        self.requested = ProfileStore(os.path.join(directory, 'requested'), keep, keep_slowest=False)
+        self.slowest = ProfileStore(os.path.join(directory, 'slowest'), keep, keep_slowest=True)
+        # Bounds the sampler threads running at once
+        self._slots = threading.Semaphore(max_concurrent)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret) or self.sample_rate > 0
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return bool(self.secret and token) and hmac.compare_digest(token, self.secret)
+
+    def start(self, requested: bool) -> Optional[ActiveProfile]:
+        """Start sampling the current thread, or None if too many profiles are running"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            profile = ActiveProfile(StackSampler(interval=self.interval).start(), requested)
+            _current.set(profile)
+            return profile
+        except RuntimeError as e:
+            self._slots.release()
+            logger.error(f"Error starting profiler: {e}")
+            return None
+
+    def finish(self, profile: ActiveProfile, info: Dict[str, Any]) -> bool:
+        """Stop sampling and store the profile. False if it was not kept."""
+        if _current.get() is profile:
+            _current.set(None)
+        try:
+            stacks = profile.sampler.stop()
+        finally:
+            self._slots.release()
+        info = dict(info, started=profile.started, duration=time.time() - profile.started)
+        store = self.requested if profile.requested else self.slowest
+        return store.save(profile.id, stacks, info)
+
+    def read(self, profile_id: str) -> Optional[str]:
+        """Collapsed stacks of a stored profile from either pool"""
+        return self.requested.read(profile_id) or self.slowest.read(profile_id)
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,175 @@
+"""
+Token-bucket rate limiting for search engines and image hosts
+Buckets live in the process by default, or in a SQLite file when several
+workers should share one budget
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Allows rate requests per second on average with bursts of up to burst requests"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it.
+
+        Tokens may be taken on credit, so concurrent callers queue up behind
+        each other instead of all waking at the same moment.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self) -> None:
+        """Return a token whose reservation was abandoned"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+class SQLiteTokenBucket(SQLiteStore):
+    """A TokenBucket whose state is kept in SQLite so all workers draw from one budget"""
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tokens REAL, updated REAL)',)
+    LABEL = 'Shared rate limit'
+    # Updates run in explicit BEGIN IMMEDIATE transactions
+    ISOLATION_LEVEL = None
+
+    def __init__(self, key: str, rate: float, burst: float, db_path: str):
+        super().__init__(db_path)
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+
+    def _update(self, change: float) -> float:
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?', (self.key,)).fetchone()
+            now = time.time()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            tokens = min(self.burst, tokens + change)
+            connection.execute('INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)',
+                               (self.key, tokens, now))
+            connection.execute('COMMIT')
+            return tokens
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def reserve(self) -> float:
+        try:
+            tokens = self._update(-1)
+        except sqlite3.Error as e:
+            logger.error(f"Shared rate limit error for {self.key}: {e}")
+            return 0.0
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def refund(self) -> None:
+        try:
+            self._update(1)
+        except sqlite3.Error as e:
+            logger.error(f"Shared rate limit error for {self.key}: {e}")
+
+class RateLimiter:
+    """Registry of token buckets keyed by 'engine:<name>' or 'host:<hostname>'.
+
+    Limits are looked up by exact key, then by the '<kind>:*' default.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], shared_path: Optional[str] = None):
+        self.limits = limits
+        self.shared_path = shared_path
+        self._buckets: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> 'RateLimiter':
+        """Build the limiter from SCRAPE_DELAY, RATE_LIMITS and RATE_LIMIT_SHARED_PATH.
+
+        RATE_LIMITS is a comma separated list of key=rate/burst entries, e.g.
+        'engine:bing=0.5/3,host:*=2/4'. Engines default to one request per
+        SCRAPE_DELAY seconds with a burst of 3.
+        """
+        scrape_delay = float(os.environ.get('SCRAPE_DELAY', 2.0))
+        limits = {
+            'engine:*': (1.0 / scrape_delay if scrape_delay > 0 else 100.0, 3.0),
+            'host:*': (2.0, 4.0),
+        }
+        for entry in os.environ.get('RATE_LIMITS', '').split(','):
+            if not entry.strip():
+                continue
+            try:
+                key, spec = entry.split('=', 1)
+                rate, burst = spec.split('/', 1)
+                limits[key.strip()] = (float(rate), float(burst))
+            except ValueError:
+                logger.warning(f"Ignoring malformed RATE_LIMITS entry '{entry}'")
+        return cls(limits, os.environ.get('RATE_LIMIT_SHARED_PATH') or None)
+
+    def bucket(self, key: str):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                kind = key.split(':', 1)[0]
+                rate, burst = self.limits.get(key) or self.limits.get(f"{kind}:*") or (1.0, 1.0)
+                if self.shared_path:
+                    bucket = SQLiteTokenBucket(key, rate, burst, self.shared_path)
+                else:
+                    bucket = TokenBucket(rate, burst)
+                self._buckets[key] = bucket
+            return bucket
+
+    def acquire(self, key: str, timeout: Optional[float] = None) -> bool:
+        """Block until a request under key may go out.
+
+        Returns False without waiting if that would take longer than timeout.
+        """
+        bucket = self.bucket(key)
+        wait = bucket.reserve()
+        if timeout is not None and wait > timeout:
+            bucket.refund()
+            return False
+        if wait > 0:
+            logger.debug(f"Rate limit {key}: waiting {wait:.2f}s")
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, key: str, timeout: Optional[float] = None) -> bool:
+        """acquire() for coroutines; waits without blocking the event loop"""
+        bucket = self.bucket(key)
+        wait = bucket.reserve()
+        if timeout is not None and wait > timeout:
+            bucket.refund()
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        """Bucket key of the host a URL points at"""
+        return f"host:{urlparse(url).hostname or ''}"
+
+    def acquire_host(self, url: str, timeout: Optional[float] = None) -> bool:
+        """acquire() for the host a URL points at"""
+        return self.acquire(self.host_key(url), timeout)
+
+rate_limiter = RateLimiter.from_environment()
@@ -0,0 +1,90 @@
+"""
+Versioned cache of serialized API responses
+Entries are keyed on the metadata version and the request, so any write to the
+metadata store makes every older entry unreachable without explicit invalidation.
+Compressed variants are cached next to the plain body.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from .metrics import CACHE_REQUESTS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings in order of preference; brotli is used when the package is installed
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 512
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """body in the given content coding ('br' or 'gzip')"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+class ResponseCache:
+    """Small in-process LRU of response bodies keyed on (version, request key)"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(version: str, key: str) -> str:
+        """Entity tag for a request against a metadata version"""
+        return hashlib.sha1(f"{version}|{key}".encode()).hexdigest()[:24]
+
+    def get(self, version: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get((version, key))
+            if body is None:
+                self.misses += 1
+                CACHE_REQUESTS.labels('response', 'miss').inc()
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            CACHE_REQUESTS.labels('response', 'hit').inc()
+            return body
+
+    def set(self, version: str, key: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((version, key), None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[(version, key)] = body
+            self._size += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_encoded(self, version: str, key: str, body: bytes, encoding: str) -> bytes:
+        """Cached compressed variant of a body, compressing it on the first request"""
+        encoded_key = f"{key}|{encoding}"
+        encoded = self.get(version, encoded_key)
+        if encoded is None:
+            encoded = compress(body, encoding)
+            self.set(version, encoded_key, encoded)
+        return encoded
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,121 @@
+"""
+Ephemeral search result sets
+Each search or upload search gets its own short-lived collection of results in a
+SQLite file shared by the workers, instead of rewriting a shared category in the
+metadata store. Items reference image files by id, so a result that is also in the
+library shares its file.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from typing import Dict, Any, Optional, Iterable, Set
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+class ResultSets(SQLiteStore):
+    """TTL store of result sets; every write to a set extends its lifetime"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS result_sets (id TEXT PRIMARY KEY, kind TEXT, query TEXT, created REAL, expires REAL)',
+        'CREATE TABLE IF NOT EXISTS result_set_items (set_id TEXT, item_id TEXT, item TEXT, UNIQUE (set_id, item_id))',
+        'CREATE TABLE IF NOT EXISTS result_set_positions (set_id TEXT PRIMARY KEY, position INTEGER)',
+    )
+    LABEL = 'Result set'
+
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[float] = None):
+        super().__init__(db_path or os.environ.get('RESULT_SETS_PATH', os.path.join('data', 'result_sets.sqlite')))
+        self.ttl = ttl if ttl is not None else float(os.environ.get('RESULT_SET_TTL', 3600))
+
+    def create(self, kind: str, query: str = '', items: Iterable[Dict[str, Any]] = ()) -> str:
+        """Start a new result set and return its id"""
+        set_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute('INSERT INTO result_sets (id, kind, query, created, expires) VALUES (?, ?, ?, ?, ?)',
+                      (set_id, kind, query, now, now + self.ttl), commit=True)
+        self.add(set_id, items)
+        return set_id
+
+    def touch(self, set_id: str) -> bool:
+        """Extend a live set's lifetime; False if it does not exist or has expired"""
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                return connection.execute('UPDATE result_sets SET expires = ? WHERE id = ? AND expires > ?',
+                                          (now + self.ttl, set_id, now)).rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Result set error: {e}")
+            return False
+
+    def add(self, set_id: str, items: Iterable[Dict[str, Any]]) -> int:
+        """Append items to a live set, skipping ids it already holds. Returns how many were added."""
+        rows = [(set_id, item['id'], json.dumps(item, ensure_ascii=False)) for item in items if item.get('id')]
+        if not self.touch(set_id):
+            return 0
+        try:
+            connection = self._connection()
+            with connection:
+                before = connection.total_changes
+                connection.executemany(
+                    'INSERT OR IGNORE INTO result_set_items (set_id, item_id, item) VALUES (?, ?, ?)', rows
+                )
+                return connection.total_changes - before
+        except sqlite3.Error as e:
+            logger.error(f"Result set error: {e}")
+            return 0
+
+    def get(self, set_id: str, limit: Optional[int] = None, offset: int = 0) -> Optional[Dict[str, Any]]:
+        """A live result set with its items in the order they were added, or None"""
+        rows = self._execute('SELECT kind, query, created, expires FROM result_sets WHERE id = ? AND expires > ?',
+                             (set_id, time.time()))
+        if not rows:
+            return None
+        kind, query, created, expires = rows[0]
+        items = self._execute(
+            'SELECT item FROM result_set_items WHERE set_id = ? ORDER BY rowid LIMIT ? OFFSET ?',
+            (set_id, limit if limit is not None else -1, offset)
+        ) or []
+        return {
+            'id': set_id,
+            'kind': kind,
+            'query': query,
+            'created': created,
+            'expires': expires,
+            'items': [json.loads(item) for (item,) in items],
+        }
+
+    def position(self, set_id: str) -> int:
+        """Engine offset the next load-more of a set starts from (0 for a new set)"""
+        rows = self._execute('SELECT position FROM result_set_positions WHERE set_id = ?', (set_id,))
+        return rows[0][0] if rows else 0
+
+    def advance(self, set_id: str, position: int) -> None:
+        """Record how far into the engine results a set's searches have gone"""
+        self._execute('INSERT OR REPLACE INTO result_set_positions (set_id, position) VALUES (?, ?)',
+                      (set_id, position), commit=True)
+
+    def item_ids(self) -> Set[str]:
+        """Ids of every item held by a live set"""
+        rows = self._execute(
+            'SELECT DISTINCT i.item_id FROM result_set_items i JOIN result_sets s ON s.id = i.set_id WHERE s.expires > ?',
+            (time.time(),)
+        ) or []
+        return {item_id for (item_id,) in rows}
+
+    def sweep(self) -> int:
+        """Drop expired sets. Returns how many were removed."""
+        now = time.time()
+        expired = self._execute('SELECT id FROM result_sets WHERE expires <= ?', (now,)) or []
+        if expired:
+            for table in ('result_set_items', 'result_set_positions'):
+                self._execute(f'DELETE FROM {table} WHERE set_id IN (SELECT id FROM result_sets WHERE expires <= ?)',
+                              (now,), commit=True)
+            self._execute('DELETE FROM result_sets WHERE expires <= ?', (now,), commit=True)
+        return len(expired)
+
+result_sets = ResultSets()
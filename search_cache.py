@@ -0,0 +1,152 @@
+"""
+Query result cache for the image search engines
+An in-memory LRU in front of a SQLite file that every worker process shares
+"""
+
+import os
+import json
+import time
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from .metrics import CACHE_REQUESTS
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+class SearchCache(SQLiteStore):
+    """Two-tier TTL cache of search results keyed on engine, normalized query and arguments"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS search_cache ('
+        'key TEXT PRIMARY KEY, engine TEXT, payload TEXT, size INTEGER, created REAL, expires REAL)',
+    )
+    LABEL = 'Search cache'
+
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[float] = None,
+                 memory_entries: int = 256, max_bytes: Optional[int] = None):
+        super().__init__(db_path or os.environ.get('SEARCH_CACHE_PATH', os.path.join('data', 'search_cache.sqlite')))
+        self.ttl = ttl if ttl is not None else float(os.environ.get('SEARCH_CACHE_TTL', 6 * 3600))
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get('SEARCH_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return ' '.join(query.lower().split())
+
+    @classmethod
+    def make_key(cls, engine: str, query: str, *args, **kwargs) -> str:
+        """Stable key for one engine call"""
+        parts = [engine, cls.normalize_query(query), list(args), sorted(kwargs.items())]
+        return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached results for key, or None. Each hit returns a fresh copy."""
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                CACHE_REQUESTS.labels('search', 'hit').inc()
+                return json.loads(entry[1])
+            if entry:
+                del self._memory[key]
+
+        row = self._execute('SELECT payload, expires FROM search_cache WHERE key = ? AND expires > ?', (key, now))
+        if row:
+            payload, expires = row[0]
+            self._remember(key, expires, payload)
+            CACHE_REQUESTS.labels('search', 'hit').inc()
+            return json.loads(payload)
+        CACHE_REQUESTS.labels('search', 'miss').inc()
+        return None
+
+    def set(self, key: str, engine: str, results: List[Dict[str, Any]]) -> None:
+        """Store results under key in both tiers"""
+        if not self.enabled:
+            return
+        payload = json.dumps(results, ensure_ascii=False)
+        now = time.time()
+        expires = now + self.ttl
+        self._remember(key, expires, payload)
+        self._execute(
+            'INSERT OR REPLACE INTO search_cache (key, engine, payload, size, created, expires) VALUES (?, ?, ?, ?, ?, ?)',
+            (key, engine, payload, len(payload), now, expires),
+            commit=True,
+        )
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop expired rows, then the oldest rows until the disk tier fits in max_bytes"""
+        self._execute('DELETE FROM search_cache WHERE expires <= ?', (time.time(),), commit=True)
+        row = self._execute('SELECT COALESCE(SUM(size), 0) FROM search_cache')
+        total = row[0][0] if row else 0
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self._execute('SELECT key, size FROM search_cache ORDER BY created') or []:
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        if victims:
+            self._executemany('DELETE FROM search_cache WHERE key = ?', victims)
+            logger.info(f"Evicted {len(victims)} search cache entries to stay within {self.max_bytes} bytes")
+
+    def clear(self) -> None:
+        with self._memory_lock:
+            self._memory.clear()
+        self._execute('DELETE FROM search_cache', commit=True)
+
+    def _remember(self, key: str, expires: float, payload: str) -> None:
+        with self._memory_lock:
+            self._memory[key] = (expires, payload)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+search_cache = SearchCache()
+
+def cached_search(func):
+    """Cache the results of a search engine method called as method(query, ...).
+
+    Calls are keyed on the method, the normalized query and the remaining
+    arguments with defaults filled in, so f(q) and f(q, page=0) share an entry.
+    Empty results are not cached since engines return [] on errors.
+    """
+    engine = func.__qualname__
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(self, query: str, *args, **kwargs):
+        bound = signature.bind(self, query, *args, **kwargs)
+        bound.apply_defaults()
+        key = search_cache.make_key(engine, query, *list(bound.arguments.values())[2:])
+        cached = search_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Search cache hit for {engine} '{query}'")
+            return cached
+        results = func(self, query, *args, **kwargs)
+        if results:
+            search_cache.set(key, engine, results)
+        return results
+
+    return wrapper
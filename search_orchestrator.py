@@ -0,0 +1,253 @@
+"""
+Deadline-aware search orchestration
+Runs registered search providers concurrently under a latency budget, hedges to backup
+providers when the primaries are slow or come up short, and adapts how many results
+each provider is asked for from what it actually delivered before.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Dict, Any, Optional
+from .url_canonicalizer import canonicalize_url
+from .metrics import registry
+from .rate_limiter import rate_limiter
+from .profiler import bind
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SECONDS = registry.histogram('search_provider_seconds', 'Search provider call latency', ('provider',))
+SEARCH_CALLS = registry.counter('search_provider_calls_total', 'Search provider calls by outcome (ok or error)',
+                                ('provider', 'outcome'))
+SEARCH_REQUESTED = registry.counter('search_provider_requested_total', 'Results asked of each provider', ('provider',))
+SEARCH_RESULTS = registry.counter('search_provider_results_total', 'Results delivered by each provider', ('provider',))
+
+# Monotonic deadline of the search a provider call is running for, set on the worker thread
+_deadline: contextvars.ContextVar = contextvars.ContextVar('search_deadline', default=None)
+
+class DeadlineExceeded(Exception):
+    """Raised instead of making a provider call that could only finish after the search's deadline"""
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left for the search the calling provider runs for; None outside an orchestrated search"""
+    deadline = _deadline.get()
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+@contextlib.contextmanager
+def search_budget(seconds: float):
+    """Give provider calls made outside an orchestrated search (e.g. prefetches) a deadline"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def budget_timeout(timeout: float) -> float:
+    """timeout, cut down to what the running search has left"""
+    remaining = remaining_budget()
+    return timeout if remaining is None else min(timeout, remaining)
+
+def acquire_within_budget(key: str) -> None:
+    """rate_limiter.acquire(key), waiting no longer than the running search has left.
+
+    Raises DeadlineExceeded, with the reserved token given back, when the wait
+    would outlast the budget, so abandoned calls neither send requests nor leave
+    token debt behind for later searches.
+    """
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"no budget left for {key}")
+    if not rate_limiter.acquire(key, timeout=remaining):
+        raise DeadlineExceeded(f"rate limit wait for {key} outlasts the budget")
+
+class SearchProvider:
+    """One search function plus its observed latency and yield"""
+
+    def __init__(self, name: str, search: Callable[[str, int], List[Dict[str, Any]]], backup: bool = False,
+                 breaker=None):
+        self.name = name
+        self.search = search
+        self.backup = backup
+        self.breaker = breaker
+        self.calls = 0
+        self.failures = 0
+        self.skipped = 0
+        # Exponentially weighted averages; yield is the fraction of the quota delivered
+        self.latency: Optional[float] = None
+        self.yield_rate = 1.0
+
+    def available(self) -> bool:
+        """False while the provider's circuit breaker is open"""
+        return self.breaker is None or self.breaker.available()
+
+    def quota(self, wanted: int) -> int:
+        """How many results to ask for so that roughly wanted come back"""
+        return max(1, min(2 * wanted, math.ceil(wanted / max(self.yield_rate, 0.5))))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backup': self.backup,
+            'calls': self.calls,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'yield': round(self.yield_rate, 3),
+        }
+
+class SearchOrchestrator:
+    """Provider registry that answers each search within a latency budget"""
+
+    def __init__(self, budget: Optional[float] = None, hedge_after: Optional[float] = None,
+                 max_workers: int = 8, smoothing: float = 0.3):
+        self.budget = budget if budget is not None else float(os.environ.get('SEARCH_DEADLINE', 12.0))
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.environ.get('SEARCH_HEDGE_AFTER', 3.0))
+        self.smoothing = smoothing
+        self.providers: Dict[str, SearchProvider] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search')
+
+    def register(self, name: str, search: Callable[[str, int], List[Dict[str, Any]]], backup: bool = False,
+                 breaker=None) -> SearchProvider:
+        """Add a provider; primaries start with every search, backups only when hedging.
+
+        Providers whose breaker (a circuit_breaker.CircuitBreaker) is open are skipped.
+        """
+        provider = SearchProvider(name, search, backup, breaker)
+        self.providers[name] = provider
+        return provider
+
+    def search(self, query: str, limit: int = 10, budget: Optional[float] = None, **params) -> List[Dict[str, Any]]:
+        """Merged results from the providers, deduplicated by canonical image URL.
+
+        Extra keyword params (e.g. an offset) are passed to every provider.
+        Returns once limit unique results are in or the budget (seconds) runs out.
+        Providers still running at that point are abandoned; their results are dropped
+        but still count toward their latency and yield. Providers see the deadline
+        through remaining_budget() and stop waiting on rate limits when it passes.
+        """
+        return self.search_many([query], limit, budget, **params)
+
+    def search_many(self, queries: List[str], limit: int = 10, budget: Optional[float] = None,
+                    **params) -> List[Dict[str, Any]]:
+        """search() for several queries at once, merged into one result list.
+
+        Every provider runs every query, each asked for its share of limit, and all
+        of them share one budget and one pool, so related queries (e.g. those derived
+        from an image) cost no more threads than a single search.
+        """
+        if not queries:
+            return []
+        budget = budget if budget is not None else self.budget
+        started = time.monotonic()
+        deadline_at = started + budget
+        hedge_at = started + min(self.hedge_after, budget / 2)
+        share = -(-limit // len(queries))
+
+        providers = []
+        for provider in self.providers.values():
+            if provider.available():
+                providers.append(provider)
+            else:
+                with self._lock:
+                    provider.skipped += 1
+        primaries = [p for p in providers if not p.backup]
+        backups = [p for p in providers if p.backup]
+
+        futures = {self._launch(provider, query, provider.quota(share), deadline_at, params): provider
+                   for provider in primaries for query in queries}
+        pending = set(futures)
+
+        seen_urls = set()
+        unique_results = []
+
+        while len(unique_results) < limit:
+            now = time.monotonic()
+            if now >= deadline_at:
+                break
+
+            # Hedge when the primaries are slow or have all answered without enough results
+            if backups and (not pending or now >= hedge_at):
+                provider = backups.pop(0)
+                shortfall = -(-(limit - len(unique_results)) // len(queries))
+                logger.info(f"Hedging '{queries[0]}' to {provider.name} for {limit - len(unique_results)} more results")
+                for query in queries:
+                    future = self._launch(provider, query, provider.quota(shortfall), deadline_at, params)
+                    futures[future] = provider
+                    pending.add(future)
+                hedge_at = time.monotonic() + min(self.hedge_after, max(deadline_at - time.monotonic(), 0) / 2)
+
+            if not pending:
+                break
+
+            timeout = min(deadline_at, hedge_at) - time.monotonic() if backups else deadline_at - time.monotonic()
+            done, pending = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.error(f"{futures[future].name} search failed: {e}")
+                    continue
+                for result in results:
+                    canonical_url = canonicalize_url(result['image_url'])
+                    if canonical_url not in seen_urls:
+                        seen_urls.add(canonical_url)
+                        unique_results.append(result)
+
+        for future in pending:
+            future.cancel()
+        if pending:
+            abandoned = sorted({futures[f].name for f in pending})
+            logger.info(f"Returning '{queries[0]}' without {', '.join(abandoned)}")
+
+        return unique_results[:limit]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: provider.stats() for name, provider in self.providers.items()}
+
+    def _launch(self, provider: SearchProvider, query: str, quota: int, deadline_at: float, params: Dict[str, Any]):
+        started = time.monotonic()
+        future = self._executor.submit(bind(self._call), provider, query, quota, deadline_at, params)
+        future.add_done_callback(lambda f: self._observe(provider, quota, started, f))
+        return future
+
+    @staticmethod
+    def _call(provider: SearchProvider, query: str, quota: int, deadline_at: float, params: Dict[str, Any]):
+        """Run a provider on a worker thread with the search's deadline visible to it"""
+        if time.monotonic() >= deadline_at:
+            raise DeadlineExceeded(f"{provider.name} was reached after the deadline")
+        token = _deadline.set(deadline_at)
+        try:
+            return provider.search(query, quota, **params)
+        finally:
+            _deadline.reset(token)
+
+    def _observe(self, provider: SearchProvider, quota: int, started: float, future):
+        """Fold one finished call into the provider's averages"""
+        if future.cancelled():
+            return
+        if isinstance(future.exception(), DeadlineExceeded):
+            # Never called, so it says nothing about the provider's latency or yield
+            with self._lock:
+                provider.skipped += 1
+            return
+        latency = time.monotonic() - started
+        error = future.exception()
+        returned = 0 if error else len(future.result())
+        delivered = min(returned / quota, 1.0)
+        SEARCH_SECONDS.labels(provider.name).observe(latency)
+        SEARCH_CALLS.labels(provider.name, 'error' if error else 'ok').inc()
+        SEARCH_REQUESTED.labels(provider.name).inc(quota)
+        SEARCH_RESULTS.labels(provider.name).inc(returned)
+        alpha = self.smoothing
+        with self._lock:
+            provider.calls += 1
+            if error:
+                provider.failures += 1
+            provider.latency = latency if provider.latency is None else (1 - alpha) * provider.latency + alpha * latency
+            provider.yield_rate = (1 - alpha) * provider.yield_rate + alpha * delivered
@@ -0,0 +1,64 @@
+"""
+Base for the stores kept in SQLite files shared by the worker processes
+Each thread gets its own WAL-mode connection, reopened after a fork so a worker
+never reuses a handle inherited from its parent.
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SQLiteStore:
+    """Per-thread connections to one SQLite file; subclasses list their tables in SCHEMA"""
+
+    # CREATE statements run on every new connection
+    SCHEMA: Tuple[str, ...] = ()
+
+    # Prefix of logged database errors
+    LABEL = 'SQLite store'
+
+    # sqlite3's transaction handling; None means autocommit, for stores that issue BEGIN themselves
+    ISOLATION_LEVEL: Optional[str] = ''
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, reopened after a fork"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=self.ISOLATION_LEVEL)
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _execute(self, sql: str, params: tuple = (), commit: bool = False) -> Optional[list]:
+        """Rows of a statement, or None if the database failed"""
+        try:
+            connection = self._connection()
+            rows = connection.execute(sql, params).fetchall()
+            if commit:
+                connection.commit()
+            return rows
+        except sqlite3.Error as e:
+            logger.error(f"{self.LABEL} error: {e}")
+            return None
+
+    def _executemany(self, sql: str, params: list) -> bool:
+        try:
+            connection = self._connection()
+            connection.executemany(sql, params)
+            connection.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"{self.LABEL} error: {e}")
+            return False
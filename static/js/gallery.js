@@ -313,7 +313,6 @@ class ShellGallery {
 
             const formData = new FormData();
             formData.append('image', imageUpload.files[0]);
-            formData.append('fresh_search', 'true'); // Force fresh search
 
             const response = await fetch('/api/upload-search', {
                 method: 'POST',
@@ -416,36 +415,44 @@ class ShellGallery {
         // Clear previous results first
         this.clearAllCategories();
         this.showSearchLoading(true);
+        this.lastSearchQuery = query;
+        
+        const request = {
+            query: query,
+            limit: 12,
+            search_type: 'text_search'
+        };
         
         try {
-            // Search for new content based on the query
-            const response = await fetch('/api/scrape', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    query: query,
-                    limit: 12,
-                    fresh_search: true,
-                    search_type: 'text_search'
-                })
-            });
-            
-            const data = await response.json();
-            
-            if (data.success) {
-                // Set search results and display them
-                this.searchResults = data.images || [];
-                this.displaySearchResults();
-                const imageCount = this.searchResults.length;
-                this.showSuccess(`Found ${imageCount} images for "${query}"`);
-                
-                // Clear the search input
-                searchInput.value = '';
+            if (window.ReadableStream && window.TextDecoder) {
+                await this.streamSearch(query, request);
             } else {
-                this.showError('Search failed: ' + (data.error || 'Unknown error'));
+                // Search for new content based on the query
+                const response = await fetch('/api/scrape', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify(request)
+                });
+                
+                const data = await response.json();
+                
+                if (data.success) {
+                    // Set search results and display them
+                    this.searchResults = data.images || [];
+                    this.resultSetId = data.result_set;
+                    this.displaySearchResults();
+                    const imageCount = this.searchResults.length;
+                    this.showSuccess(`Found ${imageCount} images for "${query}"`);
+                } else {
+                    this.showError('Search failed: ' + (data.error || 'Unknown error'));
+                    return;
+                }
             }
+            
+            // Clear the search input
+            searchInput.value = '';
         } catch (error) {
             console.error('Search error:', error);
             this.showError('Search failed due to network error: ' + (error.message || error));
@@ -454,6 +461,102 @@ class ShellGallery {
         }
     }
     
+    async streamSearch(query, request, append = false) {
+        // Each image is shown as soon as the server has stored it
+        const response = await fetch('/api/scrape/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/x-ndjson'
+            },
+            body: JSON.stringify(request)
+        });
+        
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        
+        if (!append) {
+            this.searchResults = [];
+            this.displaySearchResults(true);
+        }
+        let received = 0;
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        const handleEvent = (event) => {
+            if (event.type === 'search') {
+                this.resultSetId = event.result_set;
+            } else if (event.type === 'image') {
+                received++;
+                this.searchResults.push(event.image);
+                this.renderImages([event.image], 'search', !append && received === 1);
+                this.updateSearchCount();
+            } else if (event.type === 'error') {
+                this.showError(event.error);
+            } else if (event.type === 'summary') {
+                if (this.searchResults.length === 0) {
+                    this.displaySearchResults();
+                }
+                const loadMoreBtn = document.getElementById('searchLoadMoreBtn');
+                if (loadMoreBtn) {
+                    loadMoreBtn.style.display = received > 0 ? 'inline-block' : 'none';
+                }
+                this.showSuccess(event.message || `Found ${received} images for "${query}"`);
+            }
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) {
+                    handleEvent(JSON.parse(line));
+                }
+            }
+            
+            if (done) {
+                break;
+            }
+        }
+    }
+    
+    async loadMoreSearchResults() {
+        // The result set keeps the search's position, and the server has usually prefetched this page already
+        const loadMoreBtn = document.getElementById('searchLoadMoreBtn');
+        if (!this.lastSearchQuery || !loadMoreBtn) return;
+        
+        loadMoreBtn.disabled = true;
+        try {
+            await this.streamSearch(this.lastSearchQuery, {
+                query: this.lastSearchQuery,
+                limit: 12,
+                load_more: true,
+                result_set: this.resultSetId,
+                search_type: 'text_search'
+            }, true);
+        } catch (error) {
+            console.error('Load more error:', error);
+            this.showError('Loading more results failed: ' + (error.message || error));
+        } finally {
+            loadMoreBtn.disabled = false;
+        }
+    }
+    
+    updateSearchCount() {
+        const badge = document.getElementById('search-count');
+        if (badge) {
+            badge.textContent = this.searchResults.length;
+        }
+    }
+    
     clearSearch() {
         this.isSearchMode = false;
         this.searchResults = [];
@@ -470,7 +573,7 @@ class ShellGallery {
         }
     }
     
-    displaySearchResults() {
+    displaySearchResults(streaming = false) {
         // Hide category sections
         document.querySelectorAll('.category-section').forEach(section => {
             section.style.display = 'none';
@@ -487,7 +590,7 @@ class ShellGallery {
             categoriesSection.insertBefore(searchResultsSection, categoriesSection.firstChild);
         }
         
-        const query = document.getElementById('searchInput').value.trim();
+        const query = this.lastSearchQuery || document.getElementById('searchInput').value.trim();
         
         searchResultsSection.innerHTML = `
             <div class="category-header">
@@ -496,7 +599,7 @@ class ShellGallery {
                         <h2 class="category-title">
                             <i class="fas fa-search me-3"></i>
                             Search Results for "${query}"
-                            <span class="badge bg-coastal-accent ms-3">${this.searchResults.length}</span>
+                            <span class="badge bg-coastal-accent ms-3" id="search-count">${this.searchResults.length}</span>
                         </h2>
                         <p class="category-description">Click any image to view the original source</p>
                     </div>
@@ -508,12 +611,20 @@ class ShellGallery {
                 </div>
             </div>
             <div class="image-grid" id="search-grid"></div>
+            <div class="text-center mt-4">
+                <button class="btn btn-outline-coastal" id="searchLoadMoreBtn" onclick="gallery.loadMoreSearchResults()" style="display: none;">
+                    <i class="fas fa-plus me-2"></i>Load More
+                </button>
+            </div>
         `;
         
         console.log('Search results to display:', this.searchResults);
         
         if (this.searchResults.length > 0) {
             this.renderImages(this.searchResults, 'search', true);
+        } else if (streaming) {
+            // Cards are appended as the stream delivers them
+            return;
         } else {
             // Show that no results were found
             const grid = document.getElementById('search-grid');
@@ -567,15 +678,22 @@ class ShellGallery {
         });
     }
     
+    getImageUrl(imageData) {
+        // The version makes a local image URL safe to cache for good
+        if (!imageData.local_image) {
+            return imageData.image_url;
+        }
+        const version = imageData.image_version ? `?v=${encodeURIComponent(imageData.image_version)}` : '';
+        return `/images/${imageData.local_image}${version}`;
+    }
+    
     createImageCard(imageData) {
         const card = document.createElement('div');
         card.className = 'image-card';
         card.setAttribute('data-image-id', imageData.id);
         
         // Determine image source - always prefer local image if available
-        const imageUrl = imageData.local_image 
-            ? `/images/${imageData.local_image}` 
-            : imageData.image_url;
+        const imageUrl = this.getImageUrl(imageData);
         
         // Platform badge styling
         const platformClass = `platform-${imageData.platform || 'blog'}`;
@@ -587,6 +705,7 @@ class ShellGallery {
             <img src="${imageUrl}" 
                  alt="${imageData.title || 'Shell craft project'}" 
                  loading="lazy"
+                 ${this.getPlaceholderAttributes(imageData)}
                  onerror="this.src='data:image/svg+xml,<svg xmlns=\\"http://www.w3.org/2000/svg\\" width=\\"300\\" height=\\"250\\" viewBox=\\"0 0 300 250\\"><rect width=\\"300\\" height=\\"250\\" fill=\\"%23f8f9fa\\"/><text x=\\"150\\" y=\\"125\\" text-anchor=\\"middle\\" fill=\\"%236c757d\\" font-family=\\"Arial\\" font-size=\\"14\\">Image not available</text></svg>'">
             <div class="source-info">
                 <i class="fas fa-external-link-alt me-1"></i>
@@ -611,6 +730,25 @@ class ShellGallery {
         return card;
     }
     
+    getPlaceholderAttributes(imageData) {
+        // Reserve the image's aspect ratio and paint its precomputed placeholder until it loads
+        const attributes = [];
+        if (imageData.width && imageData.height) {
+            attributes.push(`width="${imageData.width}" height="${imageData.height}"`);
+        }
+        const background = [];
+        if (imageData.dominant_color) {
+            background.push(imageData.dominant_color);
+        }
+        if (imageData.placeholder) {
+            background.push(`url('${imageData.placeholder}') center / cover no-repeat`);
+        }
+        if (background.length > 0) {
+            attributes.push(`style="background: ${background.join(' ')}"`);
+        }
+        return attributes.join(' ');
+    }
+    
     handleImageClick(imageData) {
         // Primary action: Open source URL
         if (imageData.source_url) {
@@ -633,10 +771,16 @@ class ShellGallery {
         const modalCategory = document.getElementById('modalCategory');
         const modalSourceBtn = document.getElementById('modalSourceBtn');
         
-        const imageUrl = imageData.local_image 
-            ? `/images/${imageData.local_image}` 
-            : imageData.image_url;
+        const imageUrl = this.getImageUrl(imageData);
         
+        if (imageData.width && imageData.height) {
+            modalImage.width = imageData.width;
+            modalImage.height = imageData.height;
+        } else {
+            modalImage.removeAttribute('width');
+            modalImage.removeAttribute('height');
+        }
+        modalImage.style.background = imageData.dominant_color || '';
         modalImage.src = imageUrl;
         modalImage.alt = imageData.title || 'Shell craft project';
         modalTitle.textContent = imageData.title || 'Shell Craft Project';
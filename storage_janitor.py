@@ -0,0 +1,327 @@
+"""
+Storage budget enforcement for the local image library
+Evicts images in small batches from a background thread so data/images stays
+within a byte budget and each category within its item limit. One janitor runs
+per host; the other worker processes only record which images they served.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Set
+from .sqlite_store import SQLiteStore
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class ServedTimes(SQLiteStore):
+    """When each image was last served, shared by the worker processes.
+
+    Kept out of metadata.json so serving images neither rewrites the library
+    file nor changes its version.
+    """
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS served (item_id TEXT PRIMARY KEY, served_at REAL)',)
+    LABEL = 'Served times'
+
+    def __init__(self, db_path: Optional[str] = None):
+        super().__init__(db_path or os.environ.get('SERVED_TIMES_PATH', os.path.join('data', 'served_times.sqlite')))
+
+    def record(self, served: Dict[str, float]) -> bool:
+        """Store item id -> served time, keeping the latest time per item"""
+        return self._executemany(
+            'INSERT INTO served (item_id, served_at) VALUES (?, ?) '
+            'ON CONFLICT (item_id) DO UPDATE SET served_at = max(served_at, excluded.served_at)',
+            list(served.items())
+        )
+
+    def all(self) -> Dict[str, float]:
+        rows = self._execute('SELECT item_id, served_at FROM served') or []
+        return dict(rows)
+
+    def forget(self, item_ids: Iterable[str]) -> bool:
+        return self._executemany('DELETE FROM served WHERE item_id = ?', [(item_id,) for item_id in item_ids])
+
+class AccessTracker:
+    """Records when image files were last served.
+
+    Touches are buffered in memory and written to the served-times store at most
+    every flush_interval seconds, so serving an image costs no I/O.
+    """
+
+    def __init__(self, store: Optional[ServedTimes] = None, flush_interval: float = 5.0):
+        self.store = store or ServedTimes()
+        self.flush_interval = flush_interval
+        self._served: Dict[str, float] = {}
+        self._flush_at = time.monotonic() + flush_interval
+
+    def touch(self, filename: str) -> None:
+        """Record that filename (named after its item id) was just served"""
+        self._served[os.path.splitext(os.path.basename(filename))[0]] = time.time()
+        if time.monotonic() >= self._flush_at:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered touches to the store"""
+        self._flush_at = time.monotonic() + self.flush_interval
+        served, self._served = self._served, {}
+        if served:
+            self.store.record(served)
+
+access_tracker = AccessTracker()
+
+class StorageJanitor:
+    """Keeps the image library within its storage budget"""
+
+    POLICIES = ('lru', 'oldest')
+
+    def __init__(self, data_manager, tracker: Optional[AccessTracker] = None,
+                 max_bytes: Optional[int] = None, max_per_category: Optional[int] = None,
+                 policy: Optional[str] = None, batch_size: int = 50, interval: float = 300.0,
+                 result_sets=None, orphan_interval: float = 900.0, lock_path: Optional[str] = None):
+        self.data_manager = data_manager
+        # Live result sets (see result_sets.ResultSets) keep their downloaded images from being swept
+        self.result_sets = result_sets
+        self.orphan_interval = orphan_interval
+        self.tracker = tracker or access_tracker
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get('MAX_STORAGE_BYTES', 500 * 1024 * 1024))
+        self.max_per_category = max_per_category if max_per_category is not None else int(os.environ.get('MAX_IMAGES_PER_CATEGORY', 100))
+        self.policy = (policy or os.environ.get('STORAGE_EVICTION_POLICY', 'lru')).lower()
+        if self.policy not in self.POLICIES:
+            logger.warning(f"Unknown eviction policy '{self.policy}', falling back to 'lru'")
+            self.policy = 'lru'
+        self.batch_size = batch_size
+        self.interval = interval
+        # Held by the one process per host whose janitor does the work
+        self.lock_path = lock_path or os.path.join(os.path.dirname(data_manager.image_file_manager.images_dir),
+                                                   'storage_janitor.lock')
+        self._lock_file = None
+
+        self._file_sizes: Dict[str, int] = {}
+        # Library snapshot and the metadata version it was read at
+        self._items: List[Dict[str, Any]] = []
+        self._items_version: Optional[str] = None
+        # Metadata version at which the library was last found within budget
+        self._settled_version: Optional[str] = None
+        self._held_back = False
+        self._next_orphan_sweep = 0.0
+        # Shard directories the running orphan sweep has still to visit; None between sweeps
+        self._orphan_shards: Optional[List[str]] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the background eviction thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='storage-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background eviction thread"""
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Ask for an eviction pass as soon as possible, e.g. after new images were saved"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._claim_host():
+                # Another process runs the janitor; take over if it goes away
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                continue
+            try:
+                more_work = self.run_pass()
+            except Exception as e:
+                logger.error(f"Storage eviction pass failed: {e}")
+                more_work = False
+            # Keep passes small and spread out; continue promptly while over budget
+            self._wake.wait(1.0 if more_work else self.interval)
+            self._wake.clear()
+
+    def _claim_host(self) -> bool:
+        """True once this process holds the host's janitor lock"""
+        if self._lock_file is not None or fcntl is None:
+            return True
+        try:
+            lock_file = open(self.lock_path, 'a')
+        except OSError as e:
+            logger.error(f"Error opening janitor lock {self.lock_path}: {e}")
+            return False
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def run_pass(self) -> bool:
+        """Evict at most one batch of images and sweep one shard directory for orphans.
+
+        Returns True when there is more work: the library is still over budget
+        afterwards or an orphan sweep is part way through.
+        """
+        if self.result_sets is not None and (self._orphan_shards is not None
+                                             or time.monotonic() >= self._next_orphan_sweep):
+            self.sweep_orphans()
+            if self._orphan_shards is None:
+                self._next_orphan_sweep = time.monotonic() + self.orphan_interval
+        sweeping = self._orphan_shards is not None
+
+        self.tracker.flush()
+        version = self.data_manager.metadata_manager.version()
+        if version == self._settled_version:
+            # Served times only reorder victims; nothing to do until the library changes
+            return sweeping
+
+        items = self._library()
+        victims = self._select_victims(items)
+        if not victims:
+            # Items held back for live result sets may become evictable without the library changing
+            if not self._held_back:
+                self._settled_version = version
+            return sweeping
+
+        victim_ids = [item['id'] for item in victims[:self.batch_size]]
+        evicted = self.data_manager.delete_images(victim_ids)
+        self.tracker.store.forget(victim_ids)
+        for item in victims[:self.batch_size]:
+            self._file_sizes.pop(item.get('local_image'), None)
+        logger.info(f"Evicted {evicted} images to stay within storage budget")
+        return sweeping or len(victims) > self.batch_size
+
+    def sweep_orphans(self) -> int:
+        """Drop expired result sets and delete the unreferenced image files of one shard directory.
+
+        A sweep starts with the files directly in images_dir and then visits one
+        top-level shard directory per call, resuming where the previous call
+        stopped, so no pass walks the whole library. A file is kept while a
+        library item or a live result set refers to its id. Files younger than
+        the result set lifetime are kept too, since a search may still be adding
+        them. Returns the number of files deleted.
+        """
+        images_dir = self.data_manager.image_file_manager.images_dir
+        expired = self.result_sets.sweep()
+        referenced = self.result_sets.item_ids()
+        for item in self._library():
+            referenced.add(item.get('id'))
+            if item.get('local_image'):
+                referenced.add(os.path.splitext(os.path.basename(item['local_image']))[0])
+
+        if self._orphan_shards is None:
+            shard = images_dir
+            self._orphan_shards = []
+            try:
+                entries = list(os.scandir(images_dir))
+            except OSError as e:
+                logger.error(f"Error listing {images_dir}: {e}")
+                entries = []
+            paths = []
+            for entry in entries:
+                if entry.is_dir():
+                    self._orphan_shards.append(entry.name)
+                else:
+                    paths.append(entry.path)
+            self._orphan_shards.sort(reverse=True)
+        else:
+            shard = os.path.join(images_dir, self._orphan_shards.pop())
+            paths = [os.path.join(root, filename) for root, _, files in os.walk(shard) for filename in files]
+        if not self._orphan_shards:
+            self._orphan_shards = None
+
+        cutoff = time.time() - self.result_sets.ttl
+        deleted = 0
+        for path in paths:
+            if os.path.splitext(os.path.basename(path))[0] in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    deleted += 1
+            except OSError as e:
+                logger.error(f"Error removing orphaned image {path}: {e}")
+        if expired or deleted:
+            logger.info(f"Swept {expired} expired result sets and {deleted} orphaned images from {shard}")
+        return deleted
+
+    def _library(self) -> List[Dict[str, Any]]:
+        """All library items, reread only when the metadata file has changed"""
+        version = self.data_manager.metadata_manager.version()
+        if version != self._items_version:
+            self._items = self.data_manager.metadata_manager.get_all()
+            self._items_version = version
+        return self._items
+
+    def _select_victims(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Pick the items to evict, most expendable first.
+
+        Items shown by a live result set are never picked, though they count
+        toward the budget; _held_back tells whether any had to be passed over.
+        """
+        self._held_back = False
+        if self.max_per_category <= 0 and self.max_bytes <= 0:
+            return []
+        protected: Set[str] = self.result_sets.item_ids() if self.result_sets is not None else set()
+        served = self.tracker.store.all() if self.policy == 'lru' else {}
+        ordered = sorted(items, key=lambda item: self._eviction_key(item, served))
+        victims = []
+        chosen = set()
+
+        if self.max_per_category > 0:
+            remaining: Dict[str, int] = {}
+            for item in items:
+                category = item.get('category')
+                remaining[category] = remaining.get(category, 0) + 1
+            for item in ordered:
+                category = item.get('category')
+                if remaining[category] > self.max_per_category:
+                    if item['id'] in protected:
+                        self._held_back = True
+                        continue
+                    victims.append(item)
+                    chosen.add(item['id'])
+                    remaining[category] -= 1
+
+        if self.max_bytes > 0:
+            total_bytes = sum(self._file_size(item) for item in items if item['id'] not in chosen)
+            for item in ordered:
+                if total_bytes <= self.max_bytes:
+                    break
+                if item['id'] in chosen:
+                    continue
+                if item['id'] in protected:
+                    self._held_back = True
+                    continue
+                victims.append(item)
+                chosen.add(item['id'])
+                total_bytes -= self._file_size(item)
+
+        return victims
+
+    def _eviction_key(self, item: Dict[str, Any], served: Dict[str, float]) -> float:
+        saved_date = item.get('saved_date', 0)
+        if self.policy == 'lru':
+            return max(served.get(item['id'], item.get('last_served', 0)), saved_date)
+        return saved_date
+
+    def _file_size(self, item: Dict[str, Any]) -> int:
+        """Size of an item's image, from metadata or a cached stat"""
+        if item.get('file_size') is not None:
+            return item['file_size']
+        local_image = item.get('local_image')
+        if not local_image:
+            return 0
+        if local_image not in self._file_sizes:
+            self._file_sizes[local_image] = self.data_manager.image_file_manager.get_file_size(local_image)
+        return self._file_sizes[local_image]
@@ -0,0 +1,12 @@
+import os
+import sys
+import importlib
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def import_app_module(name):
+    """Import a module of the app as part of its package so its relative imports resolve"""
+    parent_dir = os.path.dirname(REPO_DIR)
+    if parent_dir not in sys.path:
+        sys.path.insert(0, parent_dir)
+    return importlib.import_module(f"{os.path.basename(REPO_DIR)}.{name}")
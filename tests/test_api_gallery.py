@@ -0,0 +1,164 @@
+import os
+import sys
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from tests import import_app_module
+
+api = import_app_module('blueprints.api_blueprint')
+DataManager = import_app_module('data_manager').DataManager
+
+class TestGalleryEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.data_manager = DataManager(data_dir=self.data_dir)
+        for i, category in enumerate(['frames', 'frames', 'mirrors']):
+            self._add_item(f"item{i}", category, title=f"Shell {category} {i}",
+                           description=f"Handmade shell {category} decorated with seashells collected on the beach. " * 4,
+                           search_query=f"shell {category} handmade", ai_keywords=['shell', 'coastal', 'handmade'])
+
+        app = Flask(__name__)
+        app.register_blueprint(api.api_blueprint)
+        self.client = app.test_client()
+        patch = mock.patch.object(api, 'data_manager', self.data_manager)
+        patch.start()
+        self.addCleanup(patch.stop)
+        api.response_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def _add_item(self, item_id, category, **fields):
+        path = os.path.join(self.data_dir, 'images', f"{item_id}.jpg")
+        with open(path, 'wb') as f:
+            f.write(b'jpeg')
+        self.data_manager.metadata_manager.save_item(
+            dict(fields, id=item_id, image_url=f"https://example.com/{item_id}.jpg", local_image=f"{item_id}.jpg"),
+            category
+        )
+
+    def test_matching_etag_returns_304_without_running_the_view(self):
+        first = self.client.get('/api/gallery?limit=5')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.get_json()['images']), 3)
+        etag = first.headers['ETag']
+
+        with mock.patch.object(self.data_manager, 'get_all_images') as view:
+            second = self.client.get('/api/gallery?limit=5', headers={'If-None-Match': etag})
+        view.assert_not_called()
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers['ETag'], etag)
+        self.assertEqual(second.get_data(), b'')
+
+    def test_repeated_requests_are_served_from_cached_bytes(self):
+        first = self.client.get('/api/category/frames?offset=0&limit=10')
+        with mock.patch.object(self.data_manager, 'get_category_images') as view:
+            # Same parameters in a different order are the same request
+            second = self.client.get('/api/category/frames?limit=10&offset=0')
+        view.assert_not_called()
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(second.mimetype, 'application/json')
+
+    def test_writes_change_the_etag(self):
+        first = self.client.get('/api/categories')
+        self.assertEqual(first.get_json()['categories'], {'frames': 2, 'mirrors': 1})
+
+        self._add_item('item3', 'mirrors')
+        second = self.client.get('/api/categories', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(second.get_json()['categories'], {'frames': 2, 'mirrors': 2})
+
+    def test_etag_is_the_same_in_every_worker_process(self):
+        first = self.client.get('/api/categories')
+        metadata_manager = import_app_module('metadata_manager')
+        # Another worker has made a different number of writes to the same file
+        with mock.patch.dict(metadata_manager._write_counts, clear=True):
+            api.response_cache.clear()
+            second = self.client.get('/api/categories', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    def test_query_parameters_are_part_of_the_etag(self):
+        small = self.client.get('/api/gallery?limit=1')
+        large = self.client.get('/api/gallery?limit=2')
+        self.assertNotEqual(small.headers['ETag'], large.headers['ETag'])
+        self.assertEqual(len(large.get_json()['images']), 2)
+
+    def test_errors_are_not_cached(self):
+        missing = self.client.get('/api/image/nope')
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing.headers)
+
+        found = self.client.get('/api/image/item0')
+        self.assertEqual(found.get_json()['image']['title'], 'Shell frames 0')
+        self.assertIn('ETag', found.headers)
+
+    def test_fields_projection(self):
+        images = self.client.get('/api/gallery?fields=title,local_image').get_json()['images']
+        self.assertEqual(images[0], {'id': 'item0', 'title': 'Shell frames 0', 'local_image': 'item0.jpg'})
+
+    def test_columnar_and_compact_payloads(self):
+        columns = self.client.get('/api/category/frames?format=columnar&fields=title').get_json()['images']
+        self.assertEqual(columns, {'id': ['item0', 'item1'], 'title': ['Shell frames 0', 'Shell frames 1']})
+
+        full = self.client.get('/api/gallery?limit=3')
+        compact = self.client.get('/api/gallery?limit=3&compact=1')
+        self.assertEqual(sorted(compact.get_json()['images']), sorted(api.GRID_FIELDS))
+        self.assertEqual(compact.get_json()['images']['local_image'], ['item0.jpg', 'item1.jpg', 'item2.jpg'])
+        self.assertLess(len(compact.get_data()) * 3, len(full.get_data()))
+
+    def test_gzip_is_negotiated_and_cached(self):
+        plain = self.client.get('/api/gallery?limit=3')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        encoded = self.client.get('/api/gallery?limit=3', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(encoded.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(encoded.headers['ETag'], plain.headers['ETag'])
+        self.assertEqual(gzip.decompress(encoded.get_data()), plain.get_data())
+
+        with mock.patch.object(api.response_cache, 'set') as store:
+            again = self.client.get('/api/gallery?limit=3', headers={'Accept-Encoding': 'gzip, deflate'})
+        store.assert_not_called()
+        self.assertEqual(again.get_data(), encoded.get_data())
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.client.get('/api/image/nope', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        response = self.client.get('/api/categories', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_batch_lookup_keeps_request_order_and_lists_misses(self):
+        with mock.patch.object(self.data_manager.metadata_manager, '_load_metadata',
+                               wraps=self.data_manager.metadata_manager._load_metadata) as load:
+            response = self.client.get('/api/images?ids=item2,nope,item0')
+        self.assertEqual(load.call_count, 1)
+        data = response.get_json()
+        self.assertEqual([image and image['id'] for image in data['images']], ['item2', None, 'item0'])
+        self.assertEqual(data['missing'], ['nope'])
+        self.assertIn('ETag', response.headers)
+
+    def test_batch_lookup_by_post(self):
+        response = self.client.post('/api/images', json={'ids': ['item1', 'item0']})
+        self.assertEqual([image['id'] for image in response.get_json()['images']], ['item1', 'item0'])
+        self.assertNotIn('ETag', response.headers)
+
+        self.assertEqual(self.client.post('/api/images', json={}).status_code, 400)
+        too_many = ','.join(f"id{i}" for i in range(api.MAX_BATCH_IDS + 1))
+        self.assertEqual(self.client.get(f"/api/images?ids={too_many}").status_code, 400)
+
+    def test_library_search_matches_every_word(self):
+        response = self.client.get('/api/search?q=shell+mirrors')
+        self.assertEqual([item['id'] for item in response.get_json()['results']], ['item2'])
+
+if __name__ == '__main__':
+    unittest.main()
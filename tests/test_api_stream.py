@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from tests import import_app_module
+
+api = import_app_module('blueprints.api_blueprint')
+ResultSets = import_app_module('result_sets').ResultSets
+
+def _fetched_items(scraped_data):
+    for item in scraped_data:
+        yield dict(item, local_image=f"{item['id']}.jpg")
+
+class TestScrapeStream(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(api.api_blueprint)
+        self.client = app.test_client()
+        scraped = [{'id': str(i), 'image_url': f"https://example.com/{i}.jpg"} for i in range(3)]
+        self.sets_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sets_dir, True)
+        self.result_sets = ResultSets(db_path=os.path.join(self.sets_dir, 'result_sets.sqlite'))
+        patches = [
+            mock.patch.object(api.image_searcher, 'search_images', return_value=scraped),
+            mock.patch.object(api.image_searcher, 'search_more',
+                              return_value=[{'id': '3', 'image_url': 'https://example.com/3.jpg'}]),
+            mock.patch.object(api.data_manager, 'iter_fetched_items', side_effect=_fetched_items),
+            mock.patch.object(api.data_manager, 'iter_saved_items'),
+            mock.patch.object(api.storage_janitor, 'wake'),
+            mock.patch.object(api, 'result_sets', self.result_sets),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_ndjson_streams_images_then_summary(self):
+        response = self.client.post('/api/scrape/stream', json={'query': 'shell frame', 'search_type': 'text_search'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([e['type'] for e in events], ['search', 'image', 'image', 'image', 'summary'])
+        self.assertEqual(events[1]['image']['local_image'], '0.jpg')
+        self.assertEqual(events[-1]['results_count'], 3)
+        self.assertTrue(events[-1]['success'])
+        api.image_searcher.search_images.assert_called_once_with('shell frame', 12, prefetch=True)
+        # Results go to the request's own result set, not to the library
+        api.data_manager.iter_saved_items.assert_not_called()
+        result_set = events[0]['result_set']
+        self.assertEqual(events[-1]['result_set'], result_set)
+        self.assertEqual([i['id'] for i in self.result_sets.get(result_set)['items']], ['0', '1', '2'])
+
+    def test_load_more_extends_the_same_result_set(self):
+        first = self.client.post('/api/scrape/stream', json={'query': 'shell', 'search_type': 'text_search'})
+        result_set = json.loads(first.get_data(as_text=True).splitlines()[0])['result_set']
+        more = self.client.post('/api/scrape/stream', json={
+            'query': 'shell', 'search_type': 'text_search', 'load_more': True, 'result_set': result_set
+        })
+        summary = json.loads(more.get_data(as_text=True).splitlines()[-1])
+        self.assertEqual(summary['result_set'], result_set)
+
+        response = self.client.get(f"/api/result_sets/{result_set}")
+        self.assertEqual([i['id'] for i in response.get_json()['images']], ['0', '1', '2', '3'])
+
+        # The position lives in the result set, so another search of the same query starts over
+        args, kwargs = api.image_searcher.search_more.call_args
+        self.assertEqual(kwargs['offset'], 12)
+        self.assertEqual(sorted(kwargs['seen']), [f"https://example.com/{i}.jpg" for i in range(3)])
+        self.assertEqual(self.result_sets.position(result_set), 24)
+        other = self.client.post('/api/scrape', json={'query': 'shell', 'search_type': 'text_search'}).get_json()
+        self.assertEqual(self.result_sets.position(other['result_set']), 12)
+        self.assertEqual(self.result_sets.position(result_set), 24)
+
+    def test_concurrent_searches_get_separate_result_sets(self):
+        first = self.client.post('/api/scrape', json={'query': 'shell frame'}).get_json()
+        second = self.client.post('/api/scrape', json={'query': 'shell box'}).get_json()
+        self.assertNotEqual(first['result_set'], second['result_set'])
+        self.assertEqual(len(first['images']), 3)
+        self.assertEqual(len(self.result_sets.get(first['result_set'])['items']), 3)
+        self.assertEqual(self.client.get('/api/result_sets/unknown').status_code, 404)
+
+    def test_event_stream_for_eventsource_clients(self):
+        response = self.client.get('/api/scrape/stream?q=shell&limit=2', headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+        self.assertTrue(body.startswith('event: search\ndata: '))
+        self.assertIn('event: summary\n', body)
+
+    def test_failed_search_ends_with_an_unsuccessful_summary(self):
+        with mock.patch.object(api.image_searcher, 'search_images', side_effect=RuntimeError('engines down')):
+            response = self.client.post('/api/scrape/stream', json={'query': 'shell'})
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([e['type'] for e in events], ['error', 'summary'])
+        self.assertFalse(events[-1]['success'])
+
+    def test_query_is_required(self):
+        response = self.client.post('/api/scrape/stream', json={})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
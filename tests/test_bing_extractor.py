@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bing_extractor import extract_bing_results, iter_bing_metadata
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'bing_images.html')
+
+class TestBingExtractor(unittest.TestCase):
+
+    def setUp(self):
+        with open(FIXTURE, 'rb') as f:
+            self.page = f.read()
+
+    def test_reads_every_well_formed_anchor(self):
+        # 35 anchors, one with a truncated m attribute
+        blobs = list(iter_bing_metadata(self.page))
+        self.assertEqual(len(blobs), 34)
+        self.assertEqual(blobs[0]['t'], 'Seashell Picture Frame #0 – "Beach" <Decor> & More')
+        self.assertIn('c000c', [blob['cid'] for blob in blobs])
+
+    def test_results_need_image_and_page_urls(self):
+        results = extract_bing_results(self.page, 100)
+        self.assertEqual(len(results), 33)
+        self.assertNotIn('c0005', [result['cid'] for result in results])
+
+    def test_stops_at_limit(self):
+        results = extract_bing_results(self.page.decode('utf-8'), 3)
+        self.assertEqual([result['cid'] for result in results], ['c0000', 'c0001', 'c0002'])
+
+    def test_ignores_marker_outside_anchors(self):
+        page = '<style>.iusc{color:red}</style><div class="iusc" m="{&quot;murl&quot;:&quot;x&quot;}"></div>'
+        self.assertEqual(list(iter_bing_metadata(page)), [])
+
+    def test_angle_bracket_inside_the_m_attribute(self):
+        page = ('<ul><li><a class="iusc" m=\'{"murl":"https://example.com/a.jpg","purl":"https://example.com/a",'
+                '"t":"Shells > Sand"}\' href="/images/a"><img src="x"></a></li>'
+                '<li><a class="iusc" m="{&quot;cid&quot;:&quot;b&quot;}">b</a></li></ul>')
+        blobs = list(iter_bing_metadata(page))
+        self.assertEqual([blob.get('t') for blob in blobs], ['Shells > Sand', None])
+        self.assertEqual(blobs[1]['cid'], 'b')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+BingVisualSearch = import_app_module('bing_visual_search').BingVisualSearch
+StubImageAnalyzer = import_app_module('image_analysis').StubImageAnalyzer
+SearchOrchestrator = import_app_module('search_orchestrator').SearchOrchestrator
+
+class SlowSearcher:
+    """Searches one engine that answers each query after a per-query delay with results named after the query"""
+
+    def __init__(self, delays, budget=5.0):
+        self.delays = delays
+        self.queries = []
+        self.orchestrator = SearchOrchestrator(budget=budget)
+        self.orchestrator.register('slow', self.engine)
+
+    def engine(self, query, limit, offset=0):
+        self.queries.append(query)
+        time.sleep(self.delays.get(query.split()[0], 0.2))
+        shared = [{'image_url': 'https://example.com/shared.jpg', 'title': 'shared'}]
+        return (shared + [{'image_url': f"https://example.com/{query}/{i}.jpg", 'title': query} for i in range(limit)])[:limit]
+
+    def search_queries(self, queries, limit, deadline=None):
+        return self.orchestrator.search_many(queries, limit, budget=deadline, offset=0)
+
+class TestVisualSearchConcurrency(unittest.TestCase):
+
+    def test_fallback_queries_run_concurrently_and_are_deduped(self):
+        searcher = SlowSearcher({})
+        search = BingVisualSearch(analyzer=StubImageAnalyzer(), image_searcher=searcher)
+        started = time.monotonic()
+        results = search.fallback_visual_search('upload.jpg', 'shell', limit=8)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(searcher.queries), 4)
+        self.assertEqual(len({r['image_url'] for r in results}), len(results))
+        self.assertTrue(all(r['search_type'] == 'visual_fallback' for r in results))
+
+    def test_stragglers_are_abandoned_once_limit_is_reached(self):
+        searcher = SlowSearcher({'handmade': 0.05, 'artisan': 2.0, 'DIY': 2.0, 'decorative': 2.0})
+        search = BingVisualSearch(analyzer=StubImageAnalyzer(), image_searcher=searcher)
+        started = time.monotonic()
+        results = search._search_queries(['handmade a', 'artisan b', 'DIY c', 'decorative d'], 1, lambda r: None)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(len(results), 1)
+
+    def test_deadline_bounds_latency(self):
+        searcher = SlowSearcher({'slow': 2.0}, budget=0.2)
+        search = BingVisualSearch(analyzer=StubImageAnalyzer(), image_searcher=searcher)
+        started = time.monotonic()
+        results = search._search_queries(['slow one', 'slow two'], 4, lambda r: None)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(results, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+SearchOrchestrator = import_app_module('search_orchestrator').SearchOrchestrator
+alternative_image_search = import_app_module('alternative_image_search')
+search_cache = import_app_module('search_cache').search_cache
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'bing_images.html')
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def _breaker(self, **kwargs):
+        options = dict(min_calls=4, slow_call=1.0, cooldown=0.05, jitter=0.0)
+        options.update(kwargs)
+        return CircuitBreaker('engine:test', **options)
+
+    def test_opens_on_error_rate_and_skips_calls(self):
+        breaker = self._breaker()
+        for ok in (True, False, True, False):
+            breaker.record_success() if ok else breaker.record_failure('boom')
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertFalse(breaker.available())
+        self.assertEqual(breaker.snapshot()['skipped_calls'], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = self._breaker()
+        for _ in range(4):
+            breaker.record_success(latency=2.0)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self._breaker()
+        breaker.trip('quota')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_success(latency=0.1)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_backs_off(self):
+        breaker = self._breaker()
+        breaker.trip('quota')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure('still failing')
+        self.assertEqual(breaker.state, OPEN)
+        time.sleep(0.06)
+        self.assertFalse(breaker.available())
+        time.sleep(0.05)
+        self.assertTrue(breaker.available())
+
+    def test_orchestrator_skips_open_providers(self):
+        calls = []
+        broken = self._breaker(cooldown=60)
+        broken.trip('down')
+        orchestrator = SearchOrchestrator(budget=1.0)
+        orchestrator.register('broken', lambda q, n: calls.append('broken') or [], breaker=broken)
+        orchestrator.register('working', lambda q, n: [{'image_url': 'https://example.com/1.jpg'}])
+        results = orchestrator.search('shells', limit=1)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(calls, [])
+        self.assertEqual(orchestrator.stats()['broken']['skipped'], 1)
+
+    def test_rate_limit_waits_do_not_count_as_engine_latency(self):
+        breaker = self._breaker(slow_call=0.1)
+        response = mock.Mock(status_code=200)
+        with open(FIXTURE, 'rb') as f:
+            response.content = f.read()
+        searcher = alternative_image_search.AlternativeImageSearch()
+        with mock.patch.object(alternative_image_search, 'acquire_within_budget', lambda key: time.sleep(0.15)), \
+                mock.patch.object(alternative_image_search.http_session, 'get', return_value=response), \
+                mock.patch.object(alternative_image_search.circuit_breakers, 'get', return_value=breaker), \
+                mock.patch.object(search_cache, 'get', return_value=None), \
+                mock.patch.object(search_cache, 'set'):
+            for _ in range(4):
+                self.assertTrue(searcher.search_bing_images('shells', 5))
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertNotIn('slow call', str(breaker.snapshot()))
+
+if __name__ == '__main__':
+    unittest.main()
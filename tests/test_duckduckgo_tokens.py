@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+duckduckgo_tokens = import_app_module('duckduckgo_tokens')
+VqdTokenManager = duckduckgo_tokens.VqdTokenManager
+
+class CountingFetch:
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, query, headers=None):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(query)
+            return f"4-{len(self.calls)}"
+
+class TestVqdTokenManager(unittest.TestCase):
+
+    def test_extract_vqd_from_page(self):
+        self.assertEqual(duckduckgo_tokens.extract_vqd('<script>vqd="4-1234-5678";</script>'), '4-1234-5678')
+        self.assertIsNone(duckduckgo_tokens.extract_vqd('<html></html>'))
+
+    def test_token_is_reused_per_normalized_query(self):
+        fetch = CountingFetch()
+        tokens = VqdTokenManager(fetch=fetch, ttl=60)
+        self.assertEqual(tokens.get('Shell Frames'), '4-1')
+        self.assertEqual(tokens.get('  shell   frames '), '4-1')
+        self.assertEqual(len(fetch.calls), 1)
+        self.assertEqual(tokens.stats()['hits'], 1)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        fetch = CountingFetch(delay=0.1)
+        tokens = VqdTokenManager(fetch=fetch, ttl=60)
+        tokens.prefetch(['shell box'])
+        self.assertEqual(tokens.get('shell box'), '4-1')
+        self.assertEqual(len(fetch.calls), 1)
+
+    def test_failed_search_drops_token_and_counts(self):
+        fetch = CountingFetch()
+        tokens = VqdTokenManager(fetch=fetch, ttl=60)
+        tokens.get('shell box')
+        tokens.record_search('shell box', True)
+        tokens.record_search('shell box', False)
+        self.assertEqual(tokens.get('shell box'), '4-2')
+        self.assertEqual(tokens.stats()['search_success_rate'], 0.5)
+
+    def test_stale_token_is_refreshed_in_background(self):
+        fetch = CountingFetch()
+        tokens = VqdTokenManager(fetch=fetch, ttl=60, refresh_ratio=0.0)
+        self.assertEqual(tokens.get('shell box'), '4-1')
+        self.assertEqual(tokens.get('shell box'), '4-1')
+        deadline = time.time() + 2
+        while len(fetch.calls) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(tokens.get('shell box'), '4-2')
+
+if __name__ == '__main__':
+    unittest.main()
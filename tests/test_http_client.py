@@ -0,0 +1,141 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+from PIL import Image
+from tests import import_app_module
+
+http_client = import_app_module('http_client')
+image_search = import_app_module('image_search')
+image_file_manager = import_app_module('image_file_manager')
+search_cache = import_app_module('search_cache').search_cache
+DataManager = import_app_module('data_manager').DataManager
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'bing_images.html')
+
+def _jpeg_bytes(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (30, 90, 160)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        body = f"hello from {self.path}".encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestRecordReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.cassette_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cassette_dir, ignore_errors=True)
+
+    def test_records_live_responses_and_replays_them_offline(self):
+        server = HTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/page"
+        try:
+            recorder = http_client.build_session(mode='record', cassette_dir=self.cassette_dir)
+            live = recorder.get(url, params={'b': '2', 'a': '1'}, timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        replayer = http_client.build_session(mode='replay', cassette_dir=self.cassette_dir)
+        # Query order does not matter when looking up a recording
+        replayed = replayer.get(url + '?a=1&b=2', timeout=5)
+        self.assertEqual(replayed.status_code, 200)
+        self.assertEqual(replayed.text, live.text)
+        self.assertEqual(replayed.headers['ETag'], '"v1"')
+        self.assertEqual(b''.join(replayed.iter_content(chunk_size=4)), live.content)
+        self.assertEqual(_Handler.hits, 1)
+        self.assertEqual(http_client.cassette_stats(recorder)['recorded'], 1)
+        self.assertEqual(http_client.cassette_stats(replayer)['replayed'], 1)
+
+    def test_missing_recording_is_a_connection_error(self):
+        session = http_client.build_session(mode='replay', cassette_dir=self.cassette_dir)
+        with self.assertRaises(requests.ConnectionError):
+            session.get('https://example.com/unrecorded.jpg')
+        self.assertEqual(http_client.cassette_stats(session)['misses'], 1)
+
+    def test_injected_errors_are_repeatable_for_a_seed(self):
+        def outcomes(seed):
+            session = http_client.build_session(mode='replay', cassette_dir=self.cassette_dir,
+                                                error_rate=0.5, seed=seed)
+            session.get_adapter('https://').save('GET', 'https://example.com/a', 200, {}, b'ok')
+            results = []
+            for _ in range(20):
+                try:
+                    session.get('https://example.com/a')
+                    results.append(True)
+                except requests.ConnectionError:
+                    results.append(False)
+            return results
+
+        first = outcomes(7)
+        self.assertEqual(first, outcomes(7))
+        self.assertIn(True, first)
+        self.assertIn(False, first)
+
+    def test_live_session_has_no_cassette_stats(self):
+        self.assertIsNone(http_client.cassette_stats(http_client.build_session(mode='live')))
+
+class TestOfflineScrape(unittest.TestCase):
+    """A Bing search plus the image downloads, served entirely from a cassette"""
+
+    def setUp(self):
+        self.cassette_dir = tempfile.mkdtemp()
+        self.data_dir = tempfile.mkdtemp()
+        self.session = http_client.build_session(mode='replay', cassette_dir=self.cassette_dir)
+        adapter = self.session.get_adapter('https://')
+        with open(FIXTURE, 'rb') as f:
+            page = f.read()
+        adapter.save('GET', 'https://www.bing.com/images/search?q=offline+shells&form=HDRSC2', 200,
+                     {'Content-Type': 'text/html; charset=utf-8'}, page)
+        self.results = image_search.extract_bing_results(page, 3)
+        for image_data in self.results[:2]:
+            adapter.save('GET', image_data['murl'], 200, {'Content-Type': 'image/jpeg'}, _jpeg_bytes())
+
+    def tearDown(self):
+        shutil.rmtree(self.cassette_dir, ignore_errors=True)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_search_and_download_without_network(self):
+        searcher = image_search.ImageSearcher()
+        data_manager = DataManager(data_dir=self.data_dir)
+        with mock.patch.object(image_search, 'http_session', self.session), \
+                mock.patch.object(image_file_manager, 'http_session', self.session), \
+                mock.patch.object(search_cache, 'ttl', 0):
+            results = searcher.search_bing_page('offline shells')
+            saved = data_manager.save_scraped_data(results[:3], 'offline')
+
+        self.assertGreaterEqual(len(results), 3)
+        self.assertEqual([r['image_url'] for r in results[:3]], [d['murl'] for d in self.results])
+        # The third image was never recorded, so it fails like an unreachable host
+        self.assertEqual(saved, 2)
+        stats = http_client.cassette_stats(self.session)
+        self.assertEqual((stats['replayed'], stats['misses']), (3, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import os
+import sys
+import time
+import shutil
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image, ImageDraw
+from tests import import_app_module
+
+image_analysis = import_app_module('image_analysis')
+BingVisualSearch = import_app_module('bing_visual_search').BingVisualSearch
+
+class TestImageAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = 'test_data'
+        os.makedirs(self.test_data_dir, exist_ok=True)
+        self.analyzer = image_analysis.StubImageAnalyzer()
+        self.cache = image_analysis.AnalysisCache(db_path=os.path.join(self.test_data_dir, 'analysis.sqlite'), ttl=60)
+        self.search = BingVisualSearch(analyzer=self.analyzer, analysis_cache=self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def _upload(self, name, size=(2400, 1800), shapes=True, **save_options):
+        img = Image.new('RGB', size, (240, 230, 210))
+        if shapes:
+            draw = ImageDraw.Draw(img)
+            draw.ellipse((size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2), fill=(200, 120, 80))
+            draw.rectangle((size[0] // 2, size[1] // 2, size[0] - 10, size[1] - 10), fill=(40, 90, 160))
+        path = os.path.join(self.test_data_dir, name)
+        img.save(path, 'JPEG', **save_options)
+        return path
+
+    def test_upload_is_downscaled_before_encoding(self):
+        jpeg, content_hash, perceptual_hash = image_analysis.prepare_image(self._upload('big.jpg'), 768)
+        with Image.open(io.BytesIO(jpeg)) as img:
+            self.assertEqual(max(img.size), 768)
+        self.assertEqual(len(content_hash), 64)
+        self.assertIsNotNone(perceptual_hash)
+
+    def test_repeat_upload_skips_the_model(self):
+        path = self._upload('shell.jpg')
+        first = self.search.analyze_image_with_ai(path)
+        second = self.search.analyze_image_with_ai(path)
+        self.assertEqual(first, second)
+        self.assertEqual(self.analyzer.calls, 1)
+
+    def test_near_identical_upload_skips_the_model(self):
+        self.search.analyze_image_with_ai(self._upload('shell.jpg', quality=95))
+        self.search.analyze_image_with_ai(self._upload('shell_small.jpg', size=(1200, 900), quality=60))
+        self.assertEqual(self.analyzer.calls, 1)
+
+    def test_different_image_calls_the_model(self):
+        self.search.analyze_image_with_ai(self._upload('shell.jpg'))
+        self.search.analyze_image_with_ai(self._upload('plain.jpg', shapes=False))
+        self.assertEqual(self.analyzer.calls, 2)
+
+    def test_expired_analysis_calls_the_model_again(self):
+        self.cache.ttl = 0.05
+        path = self._upload('shell.jpg')
+        self.search.analyze_image_with_ai(path)
+        time.sleep(0.1)
+        self.search.analyze_image_with_ai(path)
+        self.assertEqual(self.analyzer.calls, 2)
+
+if __name__ == '__main__':
+    unittest.main()
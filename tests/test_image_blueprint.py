@@ -0,0 +1,86 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from tests import import_app_module
+
+images = import_app_module('blueprints.image_blueprint')
+ImageFileManager = import_app_module('image_file_manager').ImageFileManager
+storage_janitor = import_app_module('storage_janitor')
+
+class TestServeImage(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, True)
+        self.files = ImageFileManager(self.data_dir, layout='sharded')
+        tracker = storage_janitor.AccessTracker(storage_janitor.ServedTimes(os.path.join(self.data_dir, 'served.sqlite')))
+        for patch in (mock.patch.object(images, 'image_file_manager', self.files),
+                      mock.patch.object(images, 'access_tracker', tracker)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        app = Flask(__name__)
+        app.register_blueprint(images.image_blueprint)
+        self.client = app.test_client()
+
+    def _store(self, relative_path, data=b'0123456789'):
+        path = os.path.join(self.files.images_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return relative_path
+
+    def test_only_versioned_urls_are_immutable(self):
+        local_image = self._store(self.files.sharded_path('shell.jpg'))
+        version = self.files.file_version(local_image)
+
+        versioned = self.client.get(f"/images/{local_image}?v={version}")
+        self.assertEqual(versioned.status_code, 200)
+        self.assertTrue(versioned.cache_control.immutable)
+        self.assertEqual(versioned.cache_control.max_age, images.CACHE_MAX_AGE)
+
+        for url in (f"/images/{local_image}", f"/images/{local_image}?v=stale"):
+            response = self.client.get(url)
+            self.assertEqual(response.get_data(), b'0123456789')
+            self.assertFalse(response.cache_control.immutable)
+            self.assertTrue(response.cache_control.no_cache)
+
+    def test_rewritten_image_gets_a_new_version(self):
+        local_image = self._store('shell.jpg')
+        version = self.files.file_version(local_image)
+        self._store('shell.jpg', b'revalidated image')
+        self.assertNotEqual(self.files.file_version(local_image), version)
+
+    def test_matching_etag_is_answered_with_304(self):
+        local_image = self._store('shell.jpg')
+        etag = self.client.get(f"/images/{local_image}").headers['ETag']
+        response = self.client.get(f"/images/{local_image}", headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_range_requests_get_partial_content(self):
+        local_image = self._store('shell.jpg')
+        response = self.client.get(f"/images/{local_image}", headers={'Range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.get_data(), b'2345')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-5/10')
+
+    def test_flat_and_sharded_paths_resolve(self):
+        sharded = self._store(self.files.sharded_path('sharded.jpg'))
+        self._store('flat.jpg', b'flat')
+        self.assertEqual(self.client.get(f"/images/{sharded}").status_code, 200)
+        # Bare filenames find a sharded file, and flat files are served during a migration
+        self.assertEqual(self.client.get('/images/sharded.jpg').status_code, 200)
+        self.assertEqual(self.client.get('/images/flat.jpg').get_data(), b'flat')
+        self.assertEqual(self.client.get('/images/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/images/../metadata.json').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import os
+import sys
+import io
+import time
+import shutil
+import threading
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+from tests import import_app_module
+
+image_file_manager = import_app_module('image_file_manager')
+ImageFileManager = image_file_manager.ImageFileManager
+
+def _jpeg_bytes(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 80)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class TestImageFileManager(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = 'test_data'
+        self.manager = ImageFileManager(data_dir=self.test_data_dir, layout='flat')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def test_first_download_records_validators(self):
+        response = FakeResponse(content=_jpeg_bytes(), headers={
+            'ETag': '"abc"', 'Last-Modified': 'Tue, 01 Jul 2025 10:00:00 GMT', 'Content-Length': '1234'})
+        validators = {}
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response) as get:
+            filename = self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', validators)
+        self.assertEqual(filename, 'img1.jpg')
+        self.assertEqual(get.call_args.kwargs['headers'], {})
+        self.assertEqual(validators['http_etag'], '"abc"')
+        self.assertEqual(validators['http_content_length'], 1234)
+        self.assertEqual(validators['local_image'], 'img1.jpg')
+
+    def test_download_records_dimensions_and_placeholder(self):
+        response = FakeResponse(content=_jpeg_bytes(size=(1600, 900)))
+        image_info = {}
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response):
+            self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', image_info)
+        self.assertEqual((image_info['width'], image_info['height']), (800, 450))
+        self.assertRegex(image_info['dominant_color'], r'^#[0-9a-f]{6}$')
+        self.assertTrue(image_info['placeholder'].startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(image_info['placeholder']), 1000)
+        self.assertEqual(self.manager.describe_image('img1.jpg')['width'], 800)
+
+    def test_not_modified_keeps_existing_file(self):
+        with open(os.path.join(self.manager.images_dir, 'img1.jpg'), 'wb') as f:
+            f.write(_jpeg_bytes())
+        validators = {'local_image': 'img1.jpg', 'http_etag': '"abc"'}
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=FakeResponse(304)) as get, \
+                mock.patch.object(self.manager, '_process_image') as process:
+            filename = self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', validators)
+        self.assertEqual(filename, 'img1.jpg')
+        self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"abc"'})
+        process.assert_not_called()
+
+    def test_matching_validators_skip_processing(self):
+        with open(os.path.join(self.manager.images_dir, 'img1.jpg'), 'wb') as f:
+            f.write(_jpeg_bytes())
+        validators = {'local_image': 'img1.jpg', 'http_last_modified': 'Tue, 01 Jul 2025 10:00:00 GMT',
+                      'http_content_length': 1234}
+        response = FakeResponse(content=b'', headers={
+            'Last-Modified': 'Tue, 01 Jul 2025 10:00:00 GMT', 'Content-Length': '1234'})
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response), \
+                mock.patch.object(self.manager, '_process_image') as process:
+            filename = self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', validators)
+        self.assertEqual(filename, 'img1.jpg')
+        process.assert_not_called()
+
+    def test_changed_etag_reprocesses(self):
+        with open(os.path.join(self.manager.images_dir, 'img1.jpg'), 'wb') as f:
+            f.write(b'old')
+        validators = {'local_image': 'img1.jpg', 'http_etag': '"old"'}
+        response = FakeResponse(content=_jpeg_bytes(), headers={'ETag': '"new"'})
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response):
+            filename = self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', validators)
+        self.assertEqual(filename, 'img1.jpg')
+        self.assertEqual(validators['http_etag'], '"new"')
+        with open(os.path.join(self.manager.images_dir, 'img1.jpg'), 'rb') as f:
+            self.assertNotEqual(f.read(), b'old')
+
+    def test_sharded_layout_fans_out_new_downloads(self):
+        manager = ImageFileManager(data_dir=self.test_data_dir, layout='sharded')
+        response = FakeResponse(content=_jpeg_bytes())
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response):
+            filename = manager.download_and_process_image('https://example.com/a.jpg', 'img1', {})
+        self.assertEqual(filename, ImageFileManager.sharded_path('img1.jpg'))
+        self.assertRegex(filename, r'^[0-9a-f]{2}/[0-9a-f]{2}/img1\.jpg$')
+        self.assertTrue(os.path.isfile(os.path.join(manager.images_dir, filename)))
+
+    def test_migrate_file_and_resolve_both_layouts(self):
+        with open(os.path.join(self.manager.images_dir, 'img1.jpg'), 'wb') as f:
+            f.write(b'data')
+        manager = ImageFileManager(data_dir=self.test_data_dir, layout='sharded')
+        new_path = manager.migrate_file('img1.jpg')
+        self.assertEqual(new_path, ImageFileManager.sharded_path('img1.jpg'))
+        self.assertFalse(os.path.exists(os.path.join(manager.images_dir, 'img1.jpg')))
+        # Items still pointing at the flat name resolve to the moved file
+        self.assertEqual(manager.resolve_path('img1.jpg'), manager.resolve_path(new_path))
+        self.assertEqual(manager.migrate_file(new_path), new_path)
+        self.assertIsNone(manager.resolve_path('../metadata.json'))
+
+    def test_rejects_non_image_content_and_does_not_retry(self):
+        response = FakeResponse(content=b'<html></html>', headers={'content-type': 'text/html; charset=utf-8'})
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response) as get:
+            self.assertIsNone(self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', {}))
+            self.assertIsNone(self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', {}))
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(ImageFileManager(data_dir=self.test_data_dir).is_rejected('https://example.com/a.jpg'))
+
+    def test_rejects_mismatched_content_type(self):
+        response = FakeResponse(content=_jpeg_bytes(), headers={'content-type': 'image/png'})
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response):
+            self.assertIsNone(self.manager.download_and_process_image('https://example.com/a.png', 'img1', {}))
+
+    def test_rejects_images_over_pixel_budget_before_decoding(self):
+        self.manager.max_pixels = 1000
+        response = FakeResponse(content=_jpeg_bytes(size=(40, 30)), headers={'content-type': 'image/jpeg'})
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response), \
+                mock.patch.object(self.manager, '_process_image') as process:
+            self.assertIsNone(self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', {}))
+        process.assert_not_called()
+        self.assertIn('pixel budget', self.manager._load_rejections()[self.manager._rejection_key('https://example.com/a.jpg')]['reason'])
+
+    def _slow_encode(self, delay):
+        encode = ImageFileManager._encode_jpeg
+
+        def slow(body):
+            time.sleep(delay)
+            return encode(body)
+        return staticmethod(slow)
+
+    def test_decode_timeout_excludes_time_waiting_for_a_worker(self):
+        self.manager.decode_timeout = 0.5
+        body = _jpeg_bytes()
+        with mock.patch.object(image_file_manager, '_decode_executor', ThreadPoolExecutor(max_workers=2)), \
+                mock.patch.object(image_file_manager, '_decode_slots', threading.BoundedSemaphore(2)), \
+                mock.patch.object(ImageFileManager, '_encode_jpeg', self._slow_encode(0.3)):
+            threads = [threading.Thread(target=self.manager._process_image, args=(body, 'JPEG', f"img{i}"))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(os.listdir(self.manager.images_dir)), [f"img{i}.jpg" for i in range(4)])
+
+    def test_waiting_for_a_busy_decoder_is_bounded(self):
+        self.manager.decode_timeout = 0.1
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(image_file_manager, '_decode_slots', slots):
+            started = time.monotonic()
+            with self.assertRaises(image_file_manager.DecodeTimeout):
+                self.manager._process_image(_jpeg_bytes(), 'JPEG', 'img1')
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(os.listdir(self.manager.images_dir), [])
+
+    def test_decode_timeout_is_not_recorded_as_a_rejection(self):
+        self.manager.decode_timeout = 0.05
+        response = FakeResponse(content=_jpeg_bytes(), headers={'content-type': 'image/jpeg'})
+        with mock.patch.object(image_file_manager.http_session, 'get', return_value=response), \
+                mock.patch.object(ImageFileManager, '_encode_jpeg', self._slow_encode(0.2)):
+            self.assertIsNone(self.manager.download_and_process_image('https://example.com/a.jpg', 'img1', {}))
+        self.assertFalse(self.manager.is_rejected('https://example.com/a.jpg'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+image_search = import_app_module('image_search')
+ImageSearcher = image_search.ImageSearcher
+CircuitBreakers = import_app_module('circuit_breaker').CircuitBreakers
+search_orchestrator = import_app_module('search_orchestrator')
+SearchOrchestrator = search_orchestrator.SearchOrchestrator
+RateLimiter = import_app_module('rate_limiter').RateLimiter
+
+def _results(prefix, count):
+    return [{'image_url': f"https://example.com/{prefix}{i}.jpg", 'title': f"{prefix}{i}"} for i in range(count)]
+
+def _slow(results, delay):
+    def search(query, limit, offset=0):
+        time.sleep(delay)
+        return results[:limit]
+    return search
+
+class TestImageSearcherFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.searcher = ImageSearcher()
+        self.searcher.search_craft_sites = _slow([], 0.0)
+
+    def test_engines_run_concurrently_and_results_are_deduped(self):
+        shared = _results('shared', 2)
+        self.searcher.search_duckduckgo_images = _slow(shared + _results('ddg', 2), 0.2)
+        self.searcher.search_bing_images = _slow(shared + _results('bing', 2), 0.2)
+        started = time.monotonic()
+        results = self.searcher.search_images('shells', limit=10)
+        self.assertLess(time.monotonic() - started, 0.35)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(len({r['image_url'] for r in results}), 6)
+
+    def test_returns_once_limit_is_reached(self):
+        self.searcher.search_duckduckgo_images = _slow(_results('ddg', 5), 2.0)
+        self.searcher.search_bing_images = _slow(_results('bing', 5), 0.05)
+        started = time.monotonic()
+        results = self.searcher.search_images('shells', limit=4)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual([r['title'] for r in results], ['bing0', 'bing1', 'bing2', 'bing3'])
+
+    def test_deadline_bounds_latency(self):
+        self.searcher.search_duckduckgo_images = _slow(_results('ddg', 5), 2.0)
+        self.searcher.search_bing_images = _slow(_results('bing', 2), 0.05)
+        started = time.monotonic()
+        results = self.searcher.search_images('shells', limit=4, deadline=0.3)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(len(results), 2)
+
+    def test_slow_engines_are_hedged_to_craft_sites(self):
+        self.searcher.orchestrator.hedge_after = 0.1
+        self.searcher.search_duckduckgo_images = _slow(_results('ddg', 5), 2.0)
+        self.searcher.search_bing_images = _slow(_results('bing', 5), 2.0)
+        self.searcher.search_craft_sites = _slow(_results('etsy', 5), 0.05)
+        started = time.monotonic()
+        results = self.searcher.search_images('shells', limit=3)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual([r['title'] for r in results], ['etsy0', 'etsy1', 'etsy2'])
+
+class TestImageSearcherPaging(unittest.TestCase):
+
+    def setUp(self):
+        self.searcher = ImageSearcher()
+        self.searcher.search_craft_sites = _slow([], 0.0)
+        self.calls = []
+
+    def _paged_engine(self, prefix):
+        def search(query, limit, offset=0):
+            self.calls.append((prefix, offset))
+            return _results(prefix, offset + limit)[offset:]
+        return search
+
+    def test_offsets_span_engine_pages(self):
+        self.searcher.search_bing_page = lambda query, page=0: _results(f"p{page}-", 35)
+        results = self.searcher.search_bing_images('shells', 10, offset=30)
+        self.assertEqual([r['title'] for r in results][4:6], ['p0-34', 'p1-0'])
+        self.assertEqual(len(results), 10)
+
+    def test_search_more_continues_from_offset_and_next_page_is_prefetched(self):
+        self.searcher.search_bing_images = self._paged_engine('bing')
+        self.searcher.search_duckduckgo_images = self._paged_engine('bing')
+        first = self.searcher.search_images('Shells', limit=4, prefetch=True)
+        more = self.searcher.search_more('shells', limit=4, offset=4, seen=['https://example.com/bing5.jpg'])
+        self.assertEqual([r['title'] for r in first], ['bing0', 'bing1', 'bing2', 'bing3'])
+        self.assertEqual([r['title'] for r in more], ['bing4', 'bing6', 'bing7'])
+        time.sleep(0.1)
+        self.assertIn(('bing', 8), self.calls)
+
+    def test_searches_do_not_prefetch_unless_asked(self):
+        self.searcher.search_bing_images = self._paged_engine('bing')
+        self.searcher.search_duckduckgo_images = self._paged_engine('bing')
+        self.searcher.search_images('shells', limit=4)
+        time.sleep(0.1)
+        self.assertNotIn(('bing', 4), self.calls)
+
+class TestSearchOrchestrator(unittest.TestCase):
+
+    def test_quota_grows_for_providers_that_underdeliver(self):
+        orchestrator = SearchOrchestrator(budget=1.0)
+        provider = orchestrator.register('sparse', _slow(_results('sparse', 2), 0.0))
+        self.assertEqual(provider.quota(4), 4)
+        for _ in range(5):
+            orchestrator.search('shells', limit=4)
+        time.sleep(0.05)
+        self.assertLess(provider.yield_rate, 0.7)
+        self.assertEqual(provider.quota(4), 8)
+        self.assertEqual(orchestrator.stats()['sparse']['calls'], 5)
+
+    def test_rate_limit_waits_stop_at_the_deadline(self):
+        limiter = RateLimiter({'engine:*': (0.5, 1.0)})
+        calls = []
+
+        def limited(query, limit):
+            search_orchestrator.acquire_within_budget('engine:slow')
+            calls.append(query)
+            return _results(query, limit)
+
+        orchestrator = SearchOrchestrator(budget=0.3)
+        orchestrator.register('slow', limited)
+        with mock.patch.object(search_orchestrator, 'rate_limiter', limiter):
+            self.assertEqual(len(orchestrator.search('first', limit=2)), 2)
+            started = time.monotonic()
+            self.assertEqual(orchestrator.search('second', limit=2), [])
+            time.sleep(0.1)
+        # The second call gave up at once instead of sleeping 2s for a token and searching anyway
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(calls, ['first'])
+        # Its reserved token was given back, so no debt builds up
+        self.assertGreater(limiter.bucket('engine:slow').reserve(), 1.5)
+        self.assertLess(limiter.bucket('engine:slow').reserve(), 4.5)
+        self.assertEqual(orchestrator.stats()['slow']['calls'], 1)
+        self.assertEqual(orchestrator.stats()['slow']['skipped'], 1)
+
+class TestEngineDeadlines(unittest.TestCase):
+
+    def test_engines_called_after_the_deadline_are_skipped_not_failed(self):
+        breakers = CircuitBreakers()
+        searcher = ImageSearcher()
+        token = search_orchestrator._deadline.set(time.monotonic() - 1)
+        try:
+            with mock.patch.object(image_search, 'circuit_breakers', breakers), \
+                    mock.patch.object(image_search.vqd_tokens, 'get', return_value='vqd') as get_token, \
+                    mock.patch.object(image_search.http_session, 'get') as http_get:
+                with self.assertRaises(search_orchestrator.DeadlineExceeded):
+                    searcher.search_duckduckgo_page('expired deadline shells')
+                with self.assertRaises(search_orchestrator.DeadlineExceeded):
+                    searcher.search_bing_page('expired deadline shells')
+        finally:
+            search_orchestrator._deadline.reset(token)
+        http_get.assert_not_called()
+        # The token wait is capped by the budget too
+        self.assertEqual(get_token.call_args.kwargs['timeout'], 0)
+        for key in ('engine:duckduckgo', 'engine:bing'):
+            self.assertEqual(breakers.get(key).snapshot()['recent_calls'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
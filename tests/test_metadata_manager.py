@@ -5,7 +5,9 @@ import json
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from metadata_manager import MetadataManager
+from tests import import_app_module
+
+MetadataManager = import_app_module('metadata_manager').MetadataManager
 
 class TestMetadataManager(unittest.TestCase):
 
@@ -35,5 +37,20 @@ class TestMetadataManager(unittest.TestCase):
         all_items = self.metadata_manager.get_all()
         self.assertEqual(len(all_items), 2)
 
+    def test_get_many_skips_unknown_ids(self):
+        self.metadata_manager.save_item({'id': '1', 'title': 'Item 1'}, 'cat1')
+        self.metadata_manager.save_item({'id': '2', 'title': 'Item 2'}, 'cat1')
+        items = self.metadata_manager.get_many(['2', 'missing', '1'])
+        self.assertEqual(sorted(items), ['1', '2'])
+        self.assertEqual(items['2']['title'], 'Item 2')
+
+    def test_save_existing_item_merges_fields(self):
+        self.metadata_manager.save_item({'id': '1', 'title': 'Item 1'}, 'cat1')
+        self.metadata_manager.save_item({'id': '1', 'local_image': '1.jpg'}, 'cat2')
+        item = self.metadata_manager.get_by_id('1')
+        self.assertEqual(item['title'], 'Item 1')
+        self.assertEqual(item['local_image'], '1.jpg')
+        self.assertEqual(item['category'], 'cat2')
+
 if __name__ == '__main__':
     unittest.main()
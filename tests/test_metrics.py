@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from tests import import_app_module
+
+metrics = import_app_module('metrics')
+metrics_blueprint = import_app_module('blueprints.metrics_blueprint')
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_counter_sums_increments_from_every_thread(self):
+        counter = self.registry.counter('jobs_total', 'Jobs', ('kind',))
+        series = counter.labels('scrape')
+
+        def work():
+            for _ in range(1000):
+                series.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(series.value(), 8000)
+        self.assertIn('jobs_total{kind="scrape"} 8000', self.registry.render())
+
+    def test_exited_threads_leave_no_shards_behind(self):
+        series = self.registry.counter('short_lived_total', 'Short-lived').labels()
+        for _ in range(200):
+            thread = threading.Thread(target=series.inc)
+            thread.start()
+            thread.join()
+        series.inc()
+        self.assertEqual(series.value(), 201)
+        self.assertEqual(len(series._shards), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram('work_seconds', 'Work', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+        lines = self.registry.render().splitlines()
+        self.assertIn('# TYPE work_seconds histogram', lines)
+        self.assertIn('work_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('work_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('work_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('work_seconds_sum 6.05', lines)
+        self.assertIn('work_seconds_count 4', lines)
+
+    def test_label_values_past_the_limit_share_one_series(self):
+        counter = self.registry.counter('hosts_total', 'Hosts', ('host',), max_series=2)
+        for host in ('a', 'b', 'c', 'd'):
+            counter.labels(host).inc()
+        output = self.registry.render()
+        self.assertIn('hosts_total{host="a"} 1', output)
+        self.assertIn(f'hosts_total{{host="{metrics.OVERFLOW_LABEL}"}} 2', output)
+
+    def test_registering_a_name_twice_returns_the_same_metric(self):
+        first = self.registry.counter('requests_total', 'Requests')
+        self.assertIs(self.registry.counter('requests_total', 'Requests'), first)
+        with self.assertRaises(ValueError):
+            self.registry.gauge('requests_total', 'Requests')
+
+    def test_endpoint_reports_route_latency(self):
+        app = Flask(__name__)
+        app.register_blueprint(metrics_blueprint.metrics_blueprint)
+        app.add_url_rule('/items/<item_id>', 'item', lambda item_id: item_id)
+        client = app.test_client()
+        client.get('/items/abc')
+        client.get('/items/def')
+
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{route="/items/<item_id>",method="GET",status="200"}', body)
+        self.assertNotIn('/items/abc', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from tests import import_app_module
+
+profiler = import_app_module('profiler')
+profiling = import_app_module('blueprints.profiling_blueprint')
+
+def slow_handler():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return 'done'
+
+def busy_worker():
+    slow_handler()
+    return 'worked'
+
+pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pool')
+
+def delegating_handler():
+    return pool.submit(profiler.bind(busy_worker)).result()
+
+class TestProfileStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_keeps_only_the_slowest(self):
+        store = profiler.ProfileStore(self.directory, keep=2)
+        for i, duration in enumerate([0.3, 0.1, 0.5, 0.2]):
+            store.save(f"p{i}", Counter({'a;b': 1}), {'duration': duration})
+        self.assertEqual([profile['duration'] for profile in store.list()], [0.5, 0.3])
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        self.assertEqual(store.read('p2'), 'a;b 1\n')
+        self.assertIsNone(store.read('p1'))
+
+    def test_collapsed_format_is_heaviest_first(self):
+        self.assertEqual(profiler.collapse(Counter({'main;a': 1, 'main;b': 3})), 'main;b 3\nmain;a 1\n')
+
+class TestRequestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.register_blueprint(profiling.profiling_blueprint)
+        app.add_url_rule('/slow', 'slow', slow_handler)
+        app.add_url_rule('/delegate', 'delegate', delegating_handler)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _use(self, request_profiler):
+        patch = mock.patch.object(profiling, 'request_profiler', request_profiler)
+        patch.start()
+        self.addCleanup(patch.stop)
+        return request_profiler
+
+    def test_requests_without_the_secret_are_not_profiled(self):
+        request_profiler = self._use(profiler.RequestProfiler(secret='s3cret', sample_rate=0, directory=self.directory))
+        with mock.patch.object(request_profiler, 'start') as start:
+            response = self.client.get('/slow?profile=wrong')
+        start.assert_not_called()
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.client.get('/api/profiles').status_code, 403)
+
+    def test_requested_profile_is_stored_as_collapsed_stacks(self):
+        self._use(profiler.RequestProfiler(secret='s3cret', sample_rate=0, directory=self.directory, interval=0.001))
+        response = self.client.get('/slow', headers={'X-Profile': 's3cret'})
+        response.close()
+        profile_id = response.headers['X-Profile-Id']
+
+        listing = self.client.get('/api/profiles?profile=s3cret').get_json()
+        self.assertEqual([profile['id'] for profile in listing['requested']], [profile_id])
+        self.assertEqual(listing['requested'][0]['route'], '/slow')
+
+        stacks = self.client.get(f"/api/profiles/{profile_id}", headers={'X-Profile': 's3cret'}).get_data(as_text=True)
+        self.assertIn('slow_handler', stacks)
+        self.assertRegex(stacks.splitlines()[0], r'^\S.* \d+$')
+
+    def test_pool_work_submitted_by_the_request_is_sampled(self):
+        request_profiler = self._use(profiler.RequestProfiler(secret='s3cret', directory=self.directory,
+                                                              interval=0.001))
+        response = self.client.get('/delegate?profile=s3cret')
+        response.close()
+        stacks = request_profiler.read(response.headers['X-Profile-Id'])
+        worker_stacks = [line for line in stacks.splitlines() if line.startswith('worker:pool;')]
+        self.assertTrue(any('busy_worker' in line for line in worker_stacks))
+        # Work submitted outside a profiled request is not bound to anything
+        self.assertIs(profiler.bind(busy_worker), busy_worker)
+
+    def test_sampled_requests_keep_the_slowest(self):
+        request_profiler = self._use(profiler.RequestProfiler(secret='', sample_rate=1.0, directory=self.directory,
+                                                              keep=1, interval=0.001))
+        for _ in range(3):
+            response = self.client.get('/slow')
+            self.assertNotIn('X-Profile-Id', response.headers)
+            response.close()
+        self.assertEqual(len(request_profiler.slowest.list()), 1)
+        self.assertEqual(request_profiler.requested.list(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+rate_limiter = import_app_module('rate_limiter')
+RateLimiter = rate_limiter.RateLimiter
+TokenBucket = rate_limiter.TokenBucket
+
+class TestRateLimiter(unittest.TestCase):
+
+    def tearDown(self):
+        shutil.rmtree('test_data', ignore_errors=True)
+
+    def test_burst_is_free_then_requests_are_spaced(self):
+        bucket = TokenBucket(rate=10.0, burst=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.02)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.02)
+
+    def test_limits_fall_back_to_kind_defaults(self):
+        limiter = RateLimiter({'engine:*': (1.0, 3.0), 'engine:bing': (0.5, 1.0), 'host:*': (2.0, 4.0)})
+        self.assertEqual(limiter.bucket('engine:bing').rate, 0.5)
+        self.assertEqual(limiter.bucket('engine:duckduckgo').burst, 3.0)
+        self.assertEqual(limiter.bucket('host:example.com').rate, 2.0)
+        self.assertIs(limiter.bucket('engine:bing'), limiter.bucket('engine:bing'))
+
+    def test_acquire_waits_only_when_budget_is_exhausted(self):
+        limiter = RateLimiter({'engine:*': (20.0, 1.0)})
+        started = time.monotonic()
+        self.assertTrue(limiter.acquire('engine:bing'))
+        self.assertTrue(limiter.acquire('engine:duckduckgo'))
+        self.assertLess(time.monotonic() - started, 0.03)
+        self.assertTrue(limiter.acquire('engine:bing'))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_acquire_gives_up_past_timeout(self):
+        limiter = RateLimiter({'engine:*': (0.1, 1.0)})
+        self.assertTrue(limiter.acquire('engine:bing'))
+        self.assertFalse(limiter.acquire('engine:bing', timeout=0.1))
+        self.assertFalse(asyncio.run(limiter.acquire_async('engine:bing', timeout=0.1)))
+
+    def test_shared_buckets_draw_from_one_budget(self):
+        path = os.path.join('test_data', 'rate_limits.sqlite')
+        first = RateLimiter({'host:*': (0.1, 1.0)}, shared_path=path)
+        second = RateLimiter({'host:*': (0.1, 1.0)}, shared_path=path)
+        self.assertTrue(first.acquire_host('https://example.com/a.jpg'))
+        self.assertFalse(second.acquire_host('https://example.com/b.jpg', timeout=1.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+ResultSets = import_app_module('result_sets').ResultSets
+DataManager = import_app_module('data_manager').DataManager
+storage_janitor = import_app_module('storage_janitor')
+StorageJanitor = storage_janitor.StorageJanitor
+AccessTracker = storage_janitor.AccessTracker
+ServedTimes = storage_janitor.ServedTimes
+
+class TestResultSets(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_data_dir, 'result_sets.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def test_sets_keep_items_in_order_without_duplicates(self):
+        store = ResultSets(db_path=self.db_path, ttl=60)
+        set_id = store.create('search', 'shells', [{'id': 'a'}, {'id': 'b'}])
+        self.assertEqual(store.add(set_id, [{'id': 'b'}, {'id': 'c'}]), 1)
+        result_set = store.get(set_id)
+        self.assertEqual(result_set['query'], 'shells')
+        self.assertEqual([item['id'] for item in result_set['items']], ['a', 'b', 'c'])
+        self.assertEqual([item['id'] for item in store.get(set_id, limit=1, offset=1)['items']], ['b'])
+        self.assertEqual(store.item_ids(), {'a', 'b', 'c'})
+
+    def test_sets_are_independent(self):
+        store = ResultSets(db_path=self.db_path, ttl=60)
+        first = store.create('search', 'frames', [{'id': 'a'}])
+        second = store.create('search', 'boxes', [{'id': 'b'}])
+        self.assertEqual([item['id'] for item in store.get(first)['items']], ['a'])
+        self.assertEqual([item['id'] for item in store.get(second)['items']], ['b'])
+
+    def test_expired_sets_are_gone_and_swept(self):
+        store = ResultSets(db_path=self.db_path, ttl=0.05)
+        set_id = store.create('search', 'shells', [{'id': 'a'}])
+        time.sleep(0.1)
+        self.assertIsNone(store.get(set_id))
+        self.assertFalse(store.touch(set_id))
+        self.assertEqual(store.add(set_id, [{'id': 'b'}]), 0)
+        self.assertEqual(store.item_ids(), set())
+        self.assertEqual(store.sweep(), 1)
+
+class TestOrphanSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = tempfile.mkdtemp()
+        self.data_manager = DataManager(data_dir=self.test_data_dir)
+        self.result_sets = ResultSets(db_path=os.path.join(self.test_data_dir, 'result_sets.sqlite'), ttl=60)
+        tracker = AccessTracker(ServedTimes(os.path.join(self.test_data_dir, 'served.sqlite')))
+        self.janitor = StorageJanitor(self.data_manager, tracker, max_bytes=0, max_per_category=0,
+                                      result_sets=self.result_sets)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def _image(self, item_id, age=0.0, shard=''):
+        directory = os.path.join(self.data_manager.image_file_manager.images_dir, shard)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{item_id}.jpg")
+        with open(path, 'wb') as f:
+            f.write(b'jpeg')
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_only_unreferenced_old_files_are_deleted(self):
+        library = self._image('library', age=3600)
+        self.data_manager.metadata_manager.save_item({'id': 'library', 'local_image': 'library.jpg'}, 'frames')
+        in_set = self._image('in_set', age=3600)
+        self.result_sets.create('search', 'shells', [{'id': 'in_set', 'local_image': 'in_set.jpg'}])
+        orphan = self._image('orphan', age=3600)
+        recent = self._image('recent')
+
+        self.assertEqual(self.janitor.sweep_orphans(), 1)
+        self.assertTrue(os.path.exists(library))
+        self.assertTrue(os.path.exists(in_set))
+        self.assertTrue(os.path.exists(recent))
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_run_pass_sweeps_orphans_at_most_once_per_interval(self):
+        orphan = self._image('orphan', age=3600)
+        self.janitor.run_pass()
+        self.assertFalse(os.path.exists(orphan))
+        orphan = self._image('orphan', age=3600)
+        self.janitor.run_pass()
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_each_pass_sweeps_one_shard_and_resumes_after_it(self):
+        loose = self._image('loose', age=3600)
+        first = self._image('first', age=3600, shard='aa/01')
+        second = self._image('second', age=3600, shard='bb/02')
+
+        self.assertTrue(self.janitor.run_pass())
+        self.assertFalse(os.path.exists(loose))
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(self.janitor.run_pass())
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        # The last shard ends the sweep; the next one waits for the interval
+        self.assertFalse(self.janitor.run_pass())
+        self.assertFalse(os.path.exists(second))
+        loose = self._image('loose', age=3600)
+        self.assertFalse(self.janitor.run_pass())
+        self.assertTrue(os.path.exists(loose))
+
+if __name__ == '__main__':
+    unittest.main()
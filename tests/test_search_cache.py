@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import shutil
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+SearchCache = import_app_module('search_cache').SearchCache
+
+class TestSearchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = 'test_data'
+        self.db_path = os.path.join(self.test_data_dir, 'search_cache.sqlite')
+        self.cache = SearchCache(db_path=self.db_path, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def test_keys_normalize_query(self):
+        self.assertEqual(SearchCache.make_key('bing', 'Shell  Frames ', 10),
+                         SearchCache.make_key('bing', 'shell frames', 10))
+        self.assertNotEqual(SearchCache.make_key('bing', 'shell frames', 10),
+                            SearchCache.make_key('bing', 'shell frames', 5))
+        self.assertNotEqual(SearchCache.make_key('bing', 'shell frames', 10),
+                            SearchCache.make_key('duckduckgo', 'shell frames', 10))
+
+    def test_hits_return_independent_copies(self):
+        key = SearchCache.make_key('bing', 'shells', 10)
+        self.cache.set(key, 'bing', [{'image_url': 'a'}])
+        first = self.cache.get(key)
+        first[0]['image_url'] = 'changed'
+        self.assertEqual(self.cache.get(key), [{'image_url': 'a'}])
+
+    def test_disk_tier_is_shared_between_instances(self):
+        key = SearchCache.make_key('bing', 'shells', 10)
+        self.cache.set(key, 'bing', [{'image_url': 'a'}])
+        other = SearchCache(db_path=self.db_path, ttl=60)
+        self.assertEqual(other.get(key), [{'image_url': 'a'}])
+
+    def test_expired_entries_are_misses(self):
+        cache = SearchCache(db_path=self.db_path, ttl=0.01)
+        key = SearchCache.make_key('bing', 'shells', 10)
+        cache.set(key, 'bing', [{'image_url': 'a'}])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(key))
+        cache._memory.clear()
+        self.assertIsNone(cache.get(key))
+
+    def test_evict_trims_to_max_bytes(self):
+        cache = SearchCache(db_path=self.db_path, ttl=60, max_bytes=100)
+        for i in range(5):
+            cache.set(SearchCache.make_key('bing', f"q{i}", 10), 'bing', [{'image_url': 'x' * 30}])
+        cache.evict()
+        rows = cache._execute('SELECT COALESCE(SUM(size), 0) FROM search_cache')
+        self.assertLessEqual(rows[0][0], 100)
+        self.assertIsNotNone(cache.get(SearchCache.make_key('bing', 'q4', 10)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests import import_app_module
+
+storage_janitor = import_app_module('storage_janitor')
+AccessTracker = storage_janitor.AccessTracker
+ServedTimes = storage_janitor.ServedTimes
+StorageJanitor = storage_janitor.StorageJanitor
+ResultSets = import_app_module('result_sets').ResultSets
+MetadataManager = import_app_module('metadata_manager').MetadataManager
+ImageFileManager = import_app_module('image_file_manager').ImageFileManager
+
+class LibraryStub:
+    """The parts of DataManager the janitor relies on"""
+
+    def __init__(self, data_dir):
+        self.metadata_manager = MetadataManager(data_dir)
+        self.image_file_manager = ImageFileManager(data_dir)
+
+    def delete_images(self, image_ids):
+        for item_id in image_ids:
+            item = self.metadata_manager.get_by_id(item_id)
+            if item and item.get('local_image'):
+                self.image_file_manager.delete_image_file(item['local_image'])
+        return self.metadata_manager.delete_items(image_ids)
+
+class TestStorageJanitor(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = tempfile.mkdtemp()
+        self.library = LibraryStub(self.test_data_dir)
+        self.tracker = AccessTracker(ServedTimes(os.path.join(self.test_data_dir, 'served.sqlite')))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def _add(self, item_id, category, size=100, saved_date=0.0):
+        filename = f"{item_id}.jpg"
+        with open(os.path.join(self.library.image_file_manager.images_dir, filename), 'wb') as f:
+            f.write(b'x' * size)
+        self.library.metadata_manager.save_item({'id': item_id, 'local_image': filename}, category)
+        self.library.metadata_manager.update_items({item_id: {'saved_date': saved_date}})
+
+    def test_enforces_per_category_limit(self):
+        for i in range(4):
+            self._add(f"a{i}", 'frames', saved_date=float(i))
+        self._add('b0', 'boxes')
+        janitor = StorageJanitor(self.library, self.tracker, max_bytes=0, max_per_category=2, policy='oldest')
+        self.assertFalse(janitor.run_pass())
+        remaining = {item['id'] for item in self.library.metadata_manager.get_all()}
+        self.assertEqual(remaining, {'a2', 'a3', 'b0'})
+        self.assertFalse(os.path.exists(os.path.join(self.library.image_file_manager.images_dir, 'a0.jpg')))
+
+    def test_lru_keeps_recently_served_images(self):
+        for i in range(3):
+            self._add(f"a{i}", 'frames', size=100, saved_date=float(i))
+        self.tracker.touch('a0.jpg')
+        janitor = StorageJanitor(self.library, self.tracker, max_bytes=200, max_per_category=0, policy='lru')
+        janitor.run_pass()
+        remaining = {item['id'] for item in self.library.metadata_manager.get_all()}
+        self.assertEqual(remaining, {'a0', 'a2'})
+
+    def test_evicts_in_batches(self):
+        for i in range(5):
+            self._add(f"a{i}", 'frames', saved_date=float(i))
+        janitor = StorageJanitor(self.library, self.tracker, max_bytes=0, max_per_category=1,
+                                 policy='oldest', batch_size=2)
+        self.assertTrue(janitor.run_pass())
+        self.assertEqual(len(self.library.metadata_manager.get_all()), 3)
+        self.assertFalse(janitor.run_pass())
+        self.assertEqual([item['id'] for item in self.library.metadata_manager.get_all()], ['a4'])
+
+    def test_served_times_do_not_rewrite_the_metadata(self):
+        for i in range(3):
+            self._add(f"a{i}", 'frames', size=100, saved_date=float(i))
+        version = self.library.metadata_manager.version()
+        self.tracker.touch('a0.jpg')
+        janitor = StorageJanitor(self.library, self.tracker, max_bytes=1000, max_per_category=0, policy='lru')
+        self.assertFalse(janitor.run_pass())
+        self.assertEqual(self.library.metadata_manager.version(), version)
+        self.assertIn('a0', self.tracker.store.all())
+        # Within budget at this version: later passes do not reload the library
+        with mock.patch.object(self.library.metadata_manager, 'get_all') as get_all:
+            self.assertFalse(janitor.run_pass())
+        get_all.assert_not_called()
+
+    def test_items_of_live_result_sets_are_not_evicted(self):
+        for i in range(3):
+            self._add(f"a{i}", 'frames', saved_date=float(i))
+        result_sets = ResultSets(db_path=os.path.join(self.test_data_dir, 'result_sets.sqlite'))
+        result_sets.create('search', 'shells', [{'id': 'a0'}])
+        janitor = StorageJanitor(self.library, self.tracker, max_bytes=0, max_per_category=1,
+                                 policy='oldest', result_sets=result_sets)
+        janitor.run_pass()
+        remaining = {item['id'] for item in self.library.metadata_manager.get_all()}
+        # The oldest item is kept for the result set and still counts toward the limit
+        self.assertEqual(remaining, {'a0'})
+
+    def test_one_janitor_per_host(self):
+        lock_path = os.path.join(self.test_data_dir, 'janitor.lock')
+        first = StorageJanitor(self.library, self.tracker, lock_path=lock_path)
+        second = StorageJanitor(self.library, self.tracker, lock_path=lock_path)
+        self.assertTrue(first._claim_host())
+        self.assertFalse(second._claim_host())
+        first._lock_file.close()
+        self.assertTrue(second._claim_host())
+        second._lock_file.close()
+
+if __name__ == '__main__':
+    unittest.main()
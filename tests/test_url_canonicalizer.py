@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from url_canonicalizer import canonicalize_url, canonical_id
+from tests import import_app_module
+
+DataManager = import_app_module('data_manager').DataManager
+
+class TestCanonicalizeUrl(unittest.TestCase):
+
+    def assertSameImage(self, *urls):
+        canonical = {canonicalize_url(url) for url in urls}
+        self.assertEqual(len(canonical), 1, canonical)
+
+    def test_normalizes_scheme_host_port_and_fragment(self):
+        self.assertEqual(
+            canonicalize_url('http://Example.COM:80/a/shell.jpg#top'),
+            'https://example.com/a/shell.jpg'
+        )
+        self.assertEqual(canonicalize_url('https://example.com:8443/a.jpg'), 'https://example.com:8443/a.jpg')
+
+    def test_strips_tracking_params_and_sorts_the_rest(self):
+        self.assertEqual(
+            canonicalize_url('https://example.com/a.jpg?utm_source=x&b=2&fbclid=abc&a=1'),
+            'https://example.com/a.jpg?a=1&b=2'
+        )
+
+    def test_etsy_sizes(self):
+        self.assertSameImage(
+            'https://i.etsystatic.com/12345/r/il/abcdef/678/il_300x300.678_xyz.jpg',
+            'https://i.etsystatic.com/12345/r/il/abcdef/678/il_794xN.678_xyz.jpg',
+            'https://i.etsystatic.com/12345/r/il/abcdef/678/il_fullxfull.678_xyz.jpg?version=0',
+        )
+
+    def test_pinterest_sizes(self):
+        self.assertSameImage(
+            'https://i.pinimg.com/236x/ab/cd/ef/abcdef.jpg',
+            'https://i.pinimg.com/736x/ab/cd/ef/abcdef.jpg',
+            'https://i.pinimg.com/originals/ab/cd/ef/abcdef.jpg',
+        )
+
+    def test_amazon_renditions(self):
+        self.assertSameImage(
+            'https://m.media-amazon.com/images/I/71abcXYZ._AC_SL1500_.jpg',
+            'https://m.media-amazon.com/images/I/71abcXYZ._AC_UL320_.jpg',
+            'https://m.media-amazon.com/images/I/71abcXYZ.jpg',
+        )
+
+    def test_shopify_sizes(self):
+        self.assertSameImage(
+            'https://cdn.shopify.com/s/files/1/0001/products/shell_300x300.jpg?v=1612',
+            'https://cdn.shopify.com/s/files/1/0001/products/shell_grande.jpg',
+            'https://cdn.shopify.com/s/files/1/0001/products/shell.jpg?v=99',
+        )
+
+    def test_wordpress_sizes(self):
+        self.assertSameImage(
+            'https://blog.example.com/wp-content/uploads/2021/05/shells-300x200.jpg',
+            'https://blog.example.com/wp-content/uploads/2021/05/shells.jpg',
+        )
+        self.assertSameImage(
+            'https://i0.wp.com/blog.example.com/wp-content/uploads/shells.jpg?w=640&ssl=1',
+            'https://i0.wp.com/blog.example.com/wp-content/uploads/shells-1024x768.jpg?ssl=1',
+        )
+
+    def test_resizing_cdns(self):
+        self.assertSameImage(
+            'https://res.cloudinary.com/demo/image/upload/w_300,h_300,c_fill/v123/shell.jpg',
+            'https://res.cloudinary.com/demo/image/upload/v123/shell.jpg',
+        )
+        self.assertSameImage(
+            'https://assets.imgix.net/shell.jpg?w=400&auto=format&fit=crop',
+            'https://assets.imgix.net/shell.jpg',
+        )
+        self.assertSameImage(
+            'https://images.unsplash.com/photo-123?ixlib=rb-4.0&w=1080&q=80',
+            'https://images.unsplash.com/photo-123',
+        )
+        self.assertSameImage(
+            'https://tse1.mm.bing.net/th?id=OIP.abc&w=200&h=150&c=7',
+            'https://tse2.mm.bing.net/th?id=OIP.abc',
+        )
+
+    def test_distinct_images_stay_distinct(self):
+        self.assertNotEqual(
+            canonicalize_url('https://example.com/a.jpg?id=1'),
+            canonicalize_url('https://example.com/a.jpg?id=2')
+        )
+        self.assertNotEqual(
+            canonical_id('https://i.pinimg.com/236x/ab/cd/ef/one.jpg'),
+            canonical_id('https://i.pinimg.com/236x/ab/cd/ef/two.jpg')
+        )
+
+    def test_non_urls_pass_through(self):
+        self.assertEqual(canonicalize_url(''), '')
+        self.assertEqual(canonicalize_url('not a url'), 'not a url')
+
+class TestLibraryDedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.test_data_dir = 'test_data'
+        self.data_manager = DataManager(data_dir=self.test_data_dir)
+        self.files = self.data_manager.image_file_manager
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir, ignore_errors=True)
+
+    def _fake_download(self, image_url, image_id, image_info):
+        filename = f"{image_id}.jpg"
+        path = os.path.join(self.test_data_dir, 'images', filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'jpeg')
+        image_info['http_validated'] = time.time()
+        return filename
+
+    def test_rescrape_skips_images_already_in_library(self):
+        first = [{'image_url': 'https://i.pinimg.com/236x/ab/cd/ef/shell.jpg', 'title': 'Shell'}]
+        again = [
+            {'image_url': 'https://i.pinimg.com/736x/ab/cd/ef/shell.jpg?utm_source=feed', 'title': 'Shell'},
+            {'image_url': 'https://example.com/new.jpg', 'title': 'New'},
+            {'image_url': 'https://example.com/new.jpg#dup', 'title': 'New again'},
+        ]
+        with mock.patch.object(self.files, 'download_and_process_image', side_effect=self._fake_download) as download:
+            self.assertEqual(self.data_manager.save_scraped_data(first, 'frames'), 1)
+            saved = self.data_manager.save_scraped_data(again, 'mirrors')
+
+        self.assertEqual(saved, 2)
+        self.assertEqual(download.call_count, 2)
+        self.assertEqual(download.call_args[0][0], 'https://example.com/new.jpg')
+        items = self.data_manager.metadata_manager.get_all()
+        self.assertEqual(len(items), 2)
+        shell = self.data_manager.metadata_manager.get_by_id(canonical_id(first[0]['image_url']))
+        self.assertEqual(shell['category'], 'mirrors')
+
+    def test_matches_items_stored_under_legacy_ids(self):
+        image_url = 'https://cdn.shopify.com/s/files/1/products/shell_300x300.jpg?v=1'
+        legacy_id = hashlib.md5(image_url.encode()).hexdigest()
+        self.data_manager.metadata_manager.save_item(
+            {'id': legacy_id, 'image_url': image_url, 'local_image': f"{legacy_id}.jpg", 'http_validated': time.time()},
+            'frames'
+        )
+        self._fake_download(image_url, legacy_id, {})
+
+        with mock.patch.object(self.files, 'download_and_process_image') as download:
+            saved = list(self.data_manager.iter_saved_items(
+                [{'image_url': 'https://cdn.shopify.com/s/files/1/products/shell_grande.jpg'}], 'frames'
+            ))
+
+        download.assert_not_called()
+        self.assertEqual([item['id'] for item in saved], [legacy_id])
+
+    def test_stale_items_are_revalidated(self):
+        image_url = 'https://example.com/shell.jpg'
+        item_id = canonical_id(image_url)
+        self.data_manager.metadata_manager.save_item(
+            {'id': item_id, 'image_url': image_url, 'local_image': f"{item_id}.jpg", 'http_validated': 0},
+            'frames'
+        )
+        self._fake_download(image_url, item_id, {})
+
+        with mock.patch.object(self.files, 'download_and_process_image', side_effect=self._fake_download) as download:
+            self.data_manager.save_scraped_data([{'image_url': image_url}], 'frames')
+
+        download.assert_called_once()
+        self.assertEqual(download.call_args[0][2]['local_image'], f"{item_id}.jpg")
+
+    def test_searches_do_not_refresh_stale_library_files(self):
+        image_url = 'https://example.com/shell.png'
+        item_id = canonical_id(image_url)
+        self.data_manager.metadata_manager.save_item(
+            {'id': item_id, 'image_url': image_url, 'local_image': f"{item_id}.png", 'http_validated': 0},
+            'frames'
+        )
+        stored = os.path.join(self.test_data_dir, 'images', f"{item_id}.png")
+        with open(stored, 'wb') as f:
+            f.write(b'png')
+
+        with mock.patch.object(self.files, 'download_and_process_image', side_effect=self._fake_download) as download:
+            fetched = list(self.data_manager.iter_fetched_items([{'image_url': image_url}]))
+
+        download.assert_not_called()
+        self.assertEqual(fetched[0]['local_image'], f"{item_id}.png")
+        self.assertTrue(os.path.exists(stored))
+
+if __name__ == '__main__':
+    unittest.main()
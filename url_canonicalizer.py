@@ -0,0 +1,113 @@
+"""
+Image URL canonicalization
+Maps the many URLs a CDN serves for one picture (resize parameters, size path
+segments, tracking query strings) to a single canonical URL used for dedupe and ids.
+"""
+
+import re
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from typing import Callable, List, Tuple
+
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', 'ref', 'ref_', 'ref_src',
+    '_ga', '_gl', 'si', 'spm', 'cmpid', 'campaign', 'trk', 'trkid', 'mkt_tok',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_')
+
+# Query parameters that only change the rendition of an image on resizing CDNs
+RENDITION_PARAMS = {
+    'w', 'h', 'width', 'height', 'wid', 'hei', 'fit', 'crop', 'q', 'qlt', 'quality', 'auto', 'fm', 'fmt',
+    'format', 'dpr', 'resize', 'resmode', 'op_sharpen', 'ixlib', 'ixid', 'cs', 'sharp', 'size', 'scale',
+}
+
+def _drop_query(parts, params):
+    return parts._replace(query='')
+
+def _drop_rendition_params(parts, params):
+    kept = [(k, v) for k, v in params if k.lower() not in RENDITION_PARAMS]
+    return parts._replace(query=urlencode(sorted(kept)))
+
+def _etsy(parts, params):
+    # i.etsystatic.com/.../il_300x300.123_abcd.jpg and il_794xN / il_fullxfull are one listing photo
+    return parts._replace(path=re.sub(r'/il_[0-9a-zA-Z]+x[0-9a-zA-Z]+\.', '/il_fullxfull.', parts.path), query='')
+
+def _pinterest(parts, params):
+    # i.pinimg.com/236x/ab/cd/ef/hash.jpg, /736x/..., /originals/...
+    return parts._replace(path=re.sub(r'^/(?:\d+x\d*(?:_[A-Z]+)?|originals)/', '/originals/', parts.path), query='')
+
+def _amazon(parts, params):
+    # m.media-amazon.com/images/I/71abc._AC_SL1500_.jpg -> /images/I/71abc.jpg
+    return parts._replace(path=re.sub(r'\.(?:_[^/.]*_\.)+(?=[a-zA-Z]+$)', '.', parts.path), query='')
+
+def _shopify(parts, params):
+    # cdn.shopify.com/.../file_300x300.jpg?v=123 and file_300x.jpg@2x
+    path = re.sub(r'_(?:\d+x\d*|\d*x\d+|pico|icon|thumb|small|compact|medium|large|grande|master)(?:_crop_\w+)?(?:@\dx)?(?=\.\w+$)', '', parts.path)
+    return parts._replace(path=path, query='')
+
+def _wordpress(parts, params):
+    # wp-content/uploads/2021/05/shells-300x200.jpg, also served through the i0-i3.wp.com proxy
+    path = re.sub(r'-\d+x\d+(?=\.\w+$)', '', parts.path)
+    return _drop_rendition_params(parts._replace(path=path), params)
+
+def _cloudinary(parts, params):
+    # res.cloudinary.com/<cloud>/image/upload/w_300,h_300,c_fill/v123/id.jpg
+    path = re.sub(r'/upload/(?:[a-z]{1,3}_[^/]+/)+', '/upload/', parts.path)
+    return parts._replace(path=path, query='')
+
+def _bing_thumbnail(parts, params):
+    # tse1-tse4.mm.bing.net are interchangeable shards; only the id names the picture
+    kept = [(k, v) for k, v in params if k == 'id']
+    return parts._replace(netloc=re.sub(r'^tse\d+\.', 'tse1.', parts.netloc), query=urlencode(kept))
+
+# (host suffix, rule); the first matching suffix wins
+HOST_RULES: List[Tuple[str, Callable]] = [
+    ('etsystatic.com', _etsy),
+    ('scene7.com', _drop_query),
+    ('images.unsplash.com', _drop_query),
+    ('pinimg.com', _pinterest),
+    ('media-amazon.com', _amazon),
+    ('ssl-images-amazon.com', _amazon),
+    ('cdn.shopify.com', _shopify),
+    ('wp.com', _wordpress),
+    ('res.cloudinary.com', _cloudinary),
+    ('imgix.net', _drop_rendition_params),
+    ('mm.bing.net', _bing_thumbnail),
+]
+
+def canonicalize_url(url: str) -> str:
+    """Canonical form of an image URL; URLs for the same picture map to the same string"""
+    if not url:
+        return url
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    if not parts.netloc:
+        return url.strip()
+
+    host = parts.hostname or ''
+    if parts.port and (parts.scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    scheme = 'https' if parts.scheme in ('http', 'https') else parts.scheme
+    parts = parts._replace(scheme=scheme, netloc=host, fragment='')
+
+    params = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    parts = parts._replace(query=urlencode(sorted(params)))
+
+    for suffix, rule in HOST_RULES:
+        if host == suffix or host.endswith('.' + suffix):
+            parts = rule(parts, params)
+            break
+    else:
+        if '/wp-content/uploads/' in parts.path:
+            parts = _wordpress(parts, params)
+
+    return urlunsplit(parts)
+
+def canonical_id(url: str) -> str:
+    """Item id for an image URL, shared by every URL of the same picture"""
+    return hashlib.md5(canonicalize_url(url).encode()).hexdigest()